@@ -5,6 +5,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token
 from config import Config
 from flask_cors import CORS
+from idp import MetadataCache, fetch_linkedin_profile
+from users import SocialUserCache, require_upsert_support, upgrade_user_table, upsert_statement
 
 
 # ----------------------
@@ -12,6 +14,7 @@ from flask_cors import CORS
 # ----------------------
 app = Flask(__name__)
 app.config.from_object(Config)
+require_upsert_support(app.config["SQLALCHEMY_DATABASE_URI"])
 db = SQLAlchemy(app)
 oauth = OAuth(app)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
@@ -21,8 +24,12 @@ jwt = JWTManager(app)
 
 
 class User(db.Model):
+    # A social id is only unique within its provider; this index also serves
+    # the login upsert's ON CONFLICT
+    __table_args__ = (db.UniqueConstraint("provider", "social_id", name="uq_user_provider_social_id"),)
+
     id = db.Column(db.Integer, primary_key=True)
-    social_id = db.Column(db.String(200), unique=True, nullable=False)
+    social_id = db.Column(db.String(200), nullable=False)
     provider = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(200))
     email = db.Column(db.String(200))
@@ -31,6 +38,23 @@ class User(db.Model):
         return f"<User {self.name}>"
 
 
+user_ids = SocialUserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+
+
+# Id of the user for this social login, created on first login. A returning
+# user is answered from the cache without a query; otherwise one upsert
+# statement finds or creates the row.
+def social_user_id(provider, social_id, name, email):
+    key = (provider, social_id)
+    user_id = user_ids.get(key)
+    if user_id is None:
+        values = {"provider": provider, "social_id": social_id, "name": name, "email": email}
+        user_id = db.session.execute(upsert_statement(db.session, User, values)).scalar_one()
+        db.session.commit()
+        user_ids.put(key, user_id)
+    return user_id
+
+
 # ----------------------
 # OAuth Providers
 # ----------------------
@@ -38,17 +62,23 @@ google = oauth.register(
     name='google',
     client_id=Config.GOOGLE_CLIENT_ID,
     client_secret=Config.GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+    server_metadata_url=Config.GOOGLE_DISCOVERY_URL,
     client_kwargs={'scope': 'openid email profile'}
 )
+# Discovery document and JWKS are fetched at startup and kept fresh in the background
+google_metadata = MetadataCache(
+    google, Config.GOOGLE_DISCOVERY_URL, Config.OIDC_METADATA_TTL, Config.IDP_TIMEOUT, Config.IDP_POOL_SIZE
+)
+google_metadata.ensure_started()
+app.before_request(google_metadata.ensure_started)
 
 linkedin = oauth.register(
     name='linkedin',
     client_id=Config.LINKEDIN_CLIENT_ID,
     client_secret=Config.LINKEDIN_CLIENT_SECRET,
-    access_token_url='https://www.linkedin.com/oauth/v2/accessToken',
-    authorize_url='https://www.linkedin.com/oauth/v2/authorization',
-    api_base_url='https://api.linkedin.com/v2/',
+    access_token_url=Config.LINKEDIN_TOKEN_URL,
+    authorize_url=Config.LINKEDIN_AUTHORIZE_URL,
+    api_base_url=Config.LINKEDIN_API_BASE_URL,
     client_kwargs={'scope': 'r_liteprofile r_emailaddress'}
 )
 
@@ -80,29 +110,21 @@ def authorize(provider):
     if provider == 'linkedin':
         try:
             access_token = linkedin.authorize_access_token()
-            profile = linkedin.get('me').json()
-            email_resp = linkedin.get(
-                'emailAddress?q=members&projection=(elements*(handle~))'
-            ).json()
-            email = email_resp['elements'][0]['handle~']['emailAddress']
-            user_info = {**profile, "email": email}
+            user_info = fetch_linkedin_profile(
+                Config.LINKEDIN_API_BASE_URL, access_token["access_token"], Config.IDP_TIMEOUT, Config.IDP_POOL_SIZE
+            )
         except Exception as e:
             return f"Error during LinkedIn login: {str(e)}"
 
-        social_id = user_info.get("id")
-        user = User.query.filter_by(social_id=social_id, provider=provider).first()
-        if not user:
-            user = User(
-                social_id=social_id,
-                provider=provider,
-                name=user_info.get("localizedFirstName") or user_info.get("name"),
-                email=user_info.get("email")
-            )
-            db.session.add(user)
-            db.session.commit()
+        user_id = social_user_id(
+            provider,
+            user_info.get("id"),
+            user_info.get("localizedFirstName") or user_info.get("name"),
+            user_info.get("email")
+        )
 
         # Issue JWT
-        access_token = create_access_token(identity=str(user.id),additional_claims={"role": "user"})
+        access_token = create_access_token(identity=str(user_id),additional_claims={"role": "user"})
         # Redirect back to React with token
         return redirect(f"http://localhost:3000/login?token={access_token}")
 
@@ -118,19 +140,10 @@ def google_callback():
     except Exception as e:
         return f"Error during Google login: {str(e)}"
 
-    user = User.query.filter_by(social_id=user_info["sub"], provider="google").first()
-    if not user:
-        user = User(
-            social_id=user_info["sub"],
-            provider="google",
-            name=user_info.get("name"),
-            email=user_info.get("email")
-        )
-        db.session.add(user)
-        db.session.commit()
+    user_id = social_user_id("google", user_info["sub"], user_info.get("name"), user_info.get("email"))
 
     # Issue JWT
-    access_token = create_access_token(identity={"id": user.id, "role": "user"})
+    access_token = create_access_token(identity={"id": user_id, "role": "user"})
     # Redirect back to React with token
     return redirect(f"http://localhost:3000/login?token={access_token}")
 
@@ -138,4 +151,5 @@ def google_callback():
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        upgrade_user_table(db.engine, User)
     app.run(debug=True)
@@ -0,0 +1,178 @@
+# Login callback latency against a local fake identity provider.
+#
+#   python benchmarks/bench_login.py --latency 0.1 --logins 5
+#
+# The fake provider serves OIDC discovery, a JWKS, a token endpoint that signs
+# RS256 id_tokens, and LinkedIn's /me and /emailAddress, sleeping --latency
+# seconds on every request. It runs Google and LinkedIn logins through the
+# Week2 app and reports:
+#   - Google callback with metadata fetched lazily by Authlib (what the first
+#     login used to pay) vs. prefetched by MetadataCache
+#   - LinkedIn's two profile calls sequentially vs. fetch_linkedin_profile
+#   - how often each provider endpoint was hit
+#   - SQL statements per login for a new user and for a returning one
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+
+from flask import Flask, jsonify, request
+from sqlalchemy import event
+from joserfc import jwt
+from joserfc.jwk import RSAKey
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CLIENT_ID = "bench-client"
+
+
+def fake_provider(latency, hits):
+    idp = Flask("fake_idp")
+    key = RSAKey.generate_key(2048, parameters={"kid": "bench-key"})
+
+    @idp.before_request
+    def slow():
+        hits[request.path] += 1
+        time.sleep(latency)
+
+    @idp.route("/.well-known/openid-configuration")
+    def discovery():
+        base = request.host_url.rstrip("/")
+        return jsonify({
+            "issuer": base,
+            "authorization_endpoint": f"{base}/authorize",
+            "token_endpoint": f"{base}/token",
+            "jwks_uri": f"{base}/jwks",
+            "id_token_signing_alg_values_supported": ["RS256"],
+        })
+
+    @idp.route("/jwks")
+    def jwks():
+        return jsonify({"keys": [key.as_dict(private=False)]})
+
+    # The code is "google:<nonce>" or "linkedin"
+    @idp.route("/token", methods=["POST"])
+    def token():
+        code = request.form["code"]
+        body = {"access_token": "bench-access", "token_type": "Bearer", "expires_in": 3600}
+        if code.startswith("google:"):
+            now = int(time.time())
+            claims = {"iss": request.host_url.rstrip("/"), "aud": CLIENT_ID, "sub": "google-1", "iat": now,
+                      "exp": now + 300, "nonce": code.split(":", 1)[1], "name": "Bench", "email": "g@example.com"}
+            body["id_token"] = jwt.encode({"alg": "RS256", "kid": "bench-key"}, claims, key)
+        return jsonify(body)
+
+    @idp.route("/v2/me")
+    def me():
+        return jsonify({"id": "linkedin-1", "localizedFirstName": "Bench"})
+
+    @idp.route("/v2/emailAddress")
+    def email_address():
+        return jsonify({"elements": [{"handle~": {"emailAddress": "li@example.com"}}]})
+
+    server = make_server("127.0.0.1", 0, idp, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def redirect_params(response):
+    return {k: v[0] for k, v in parse_qs(urlparse(response.headers["Location"]).query).items()}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--logins", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    hits = Counter()
+    server, base = fake_provider(args.latency, hits)
+    tmpdir = tempfile.mkdtemp()
+    os.environ.update({
+        "SECRET_KEY": "bench", "DATABASE_URL": f"sqlite:///{os.path.join(tmpdir, 'users.db')}",
+        "GOOGLE_CLIENT_ID": CLIENT_ID, "GOOGLE_CLIENT_SECRET": "secret",
+        "LINKEDIN_CLIENT_ID": CLIENT_ID, "LINKEDIN_CLIENT_SECRET": "secret",
+        "GOOGLE_DISCOVERY_URL": f"{base}/.well-known/openid-configuration",
+        "LINKEDIN_AUTHORIZE_URL": f"{base}/authorize", "LINKEDIN_TOKEN_URL": f"{base}/token",
+        "LINKEDIN_API_BASE_URL": f"{base}/v2/",
+    })
+    from app import app, db, google, google_metadata, linkedin, user_ids
+    from idp import fetch_linkedin_profile
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    def google_login():
+        params = redirect_params(client.get("/login/google"))
+        res = client.get(f"/login/callback/google?code=google:{params['nonce']}&state={params['state']}")
+        assert res.headers["Location"].startswith("http://localhost:3000/login?token="), res.get_data(as_text=True)
+
+    def linkedin_login():
+        params = redirect_params(client.get("/login/linkedin"))
+        res = client.get(f"/authorize/linkedin?code=linkedin&state={params['state']}")
+        assert res.headers["Location"].startswith("http://localhost:3000/login?token="), res.get_data(as_text=True)
+
+    # Lazy: what Authlib does on its own (discovery + JWKS inside the login).
+    # The refresher has done its startup fetch and sleeps for OIDC_METADATA_TTL.
+    while google_metadata.loaded_at is None:
+        time.sleep(0.01)
+    google.server_metadata = {}
+    lazy, _ = timed(google_login)
+
+    # Prefetched: what the refresher does at startup and every TTL
+    google.server_metadata = {}
+    google_metadata.refresh()
+    hits.clear()
+    prefetched = [timed(google_login)[0] for _ in range(args.logins)]
+    google_hits = dict(hits)
+
+    token = {"access_token": "bench-access", "token_type": "Bearer"}
+    with app.test_request_context():
+        sequential = [timed(lambda: (linkedin.get("me", token=token).json(),
+                                     linkedin.get("emailAddress?q=members&projection=(elements*(handle~))",
+                                                  token=token).json()))[0]
+                      for _ in range(args.logins)]
+    concurrent = [timed(lambda: fetch_linkedin_profile(f"{base}/v2/", "bench-access", 10, 8))[0]
+                  for _ in range(args.logins)]
+    callbacks = [timed(linkedin_login)[0] for _ in range(args.logins)]
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+    user_ids.clear()
+    linkedin_login()
+    new_user = len(statements)
+    statements.clear()
+    linkedin_login()
+    returning = len(statements)
+    user_ids.clear()
+    statements.clear()
+    linkedin_login()
+    uncached = len(statements)
+
+    print(f"provider latency {args.latency * 1000:.0f} ms, {args.logins} logins each")
+    print(f"google login, metadata fetched lazily   {lazy:7.1f} ms")
+    print(f"google login, metadata prefetched       {min(prefetched):7.1f} ms  (provider hits: {google_hits})")
+    print(f"linkedin profile calls, sequential      {min(sequential):7.1f} ms")
+    print(f"linkedin profile calls, concurrent      {min(concurrent):7.1f} ms")
+    print(f"linkedin login (redirect + callback)    {min(callbacks):7.1f} ms")
+    print(f"SQL statements per login: first {new_user}, returning {returning}, returning after cache expiry {uncached}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
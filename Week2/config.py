@@ -10,6 +10,23 @@ class Config:
     LINKEDIN_CLIENT_ID = os.getenv("LINKEDIN_CLIENT_ID")
     LINKEDIN_CLIENT_SECRET = os.getenv("LINKEDIN_CLIENT_SECRET")
 
+    # Provider endpoints (overridable to point at a local fake provider)
+    GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration")
+    LINKEDIN_AUTHORIZE_URL = os.getenv("LINKEDIN_AUTHORIZE_URL", "https://www.linkedin.com/oauth/v2/authorization")
+    LINKEDIN_TOKEN_URL = os.getenv("LINKEDIN_TOKEN_URL", "https://www.linkedin.com/oauth/v2/accessToken")
+    LINKEDIN_API_BASE_URL = os.getenv("LINKEDIN_API_BASE_URL", "https://api.linkedin.com/v2/")
 
-    SQLALCHEMY_DATABASE_URI = "sqlite:///users.db"
+    # Google's discovery document and signing keys are refreshed in the
+    # background this often (see idp.py). IDP_POOL_SIZE bounds the shared
+    # connection pool and worker threads used for provider calls.
+    OIDC_METADATA_TTL = int(os.getenv("OIDC_METADATA_TTL", 3600))
+    IDP_TIMEOUT = float(os.getenv("IDP_TIMEOUT", 10))
+    IDP_POOL_SIZE = int(os.getenv("IDP_POOL_SIZE", 8))
+
+    # (provider, social id) -> user id cache for returning logins (0 disables it)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+
+
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///users.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
@@ -0,0 +1,133 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_pid = None
+
+
+def _reset_after_fork():
+    global _session, _executor, _pid
+    if _pid != os.getpid():
+        _session, _executor, _pid = None, None, os.getpid()
+
+
+# One keep-alive session and worker pool per process for calls to the identity
+# providers, so a login reuses connections instead of opening new ones
+def get_session(pool_size):
+    global _session
+    with _lock:
+        _reset_after_fork()
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_executor(pool_size):
+    global _executor
+    with _lock:
+        _reset_after_fork()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="idp")
+        return _executor
+
+
+def _get_json(session, url, timeout, **kwargs):
+    response = session.get(url, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+# Keeps an Authlib client's OIDC discovery document and JWKS in memory. Authlib
+# fetches both lazily on the first login and then never again; here they are
+# fetched in a background thread at startup and every `ttl` seconds after,
+# so logins never wait on them. A failed refresh keeps the old documents
+# and is retried sooner. If the signing key changes between refreshes,
+# Authlib refetches the JWKS itself when it sees an unknown key id.
+class MetadataCache:
+    def __init__(self, client, url, ttl, timeout, pool_size):
+        self.client = client
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # Metadata passed to oauth.register() stays under every refreshed copy
+        self.static = dict(client.server_metadata)
+        self.loaded_at = None
+        self.refreshes = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def refresh(self):
+        session = get_session(self.pool_size)
+        metadata = _get_json(session, self.url, self.timeout)
+        if metadata.get("jwks_uri"):
+            metadata["jwks"] = _get_json(session, metadata["jwks_uri"], self.timeout)
+        metadata = {**self.static, **metadata, "_loaded_at": time.time()}
+        # One assignment, so a login never sees discovery and keys from different fetches
+        self.client.server_metadata = metadata
+        self.loaded_at = metadata["_loaded_at"]
+        self.refreshes += 1
+
+    def _run(self, stop):
+        delay = 0
+        while not stop.wait(delay):
+            try:
+                self.refresh()
+                delay = self.ttl * random.uniform(0.9, 1.0)
+            except (requests.RequestException, ValueError) as e:
+                self.failures += 1
+                log.warning("refreshing %s failed: %s", self.url, e)
+                delay = min(self.ttl, 30)
+
+    # Starts the refresher for this process. Threads don't survive a fork, so
+    # this is also called before each request and restarts it in a new child.
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with _lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="oidc-metadata", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+        self._pid = None
+
+    def stats(self):
+        age = time.time() - self.loaded_at if self.loaded_at else None
+        return {"refreshes": self.refreshes, "failures": self.failures, "age_seconds": age}
+
+
+# LinkedIn's profile and email address are separate API calls; both go out at
+# once on the shared session, so the callback waits for the slower one only
+def fetch_linkedin_profile(api_base_url, access_token, timeout, pool_size):
+    session = get_session(pool_size)
+    executor = get_executor(pool_size)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    me = executor.submit(_get_json, session, api_base_url + "me", timeout, headers=headers)
+    email = executor.submit(
+        _get_json, session, api_base_url + "emailAddress?q=members&projection=(elements*(handle~))", timeout,
+        headers=headers,
+    )
+    profile, email_resp = me.result(), email.result()
+    return {**profile, "email": email_resp["elements"][0]["handle~"]["emailAddress"]}
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+
+
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+# Bounded LRU from (provider, social_id) to user id. Entries live `ttl` seconds;
+# ids never change once assigned, so the TTL only bounds how long a user
+# removed from the database can still log in from this process's cache.
+class SocialUserCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, user_id):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# INSERT ... ON CONFLICT (provider, social_id) DO UPDATE ... RETURNING id: one
+# statement creates the user or finds the existing one, with no window for
+# two logins to both insert. The update assigns social_id to itself, leaving
+# the row as it was, and only exists so RETURNING also reports existing rows.
+def upsert_statement(session, model, values):
+    insert = UPSERT_DIALECTS[session.get_bind(mapper=model).dialect.name]
+    stmt = insert(model).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=[model.provider, model.social_id],
+        set_={"social_id": stmt.excluded.social_id},
+    ).returning(model.id)
+
+
+# Logins depend on the upsert above, so a database without ON CONFLICT is
+# refused when the app starts instead of failing the first login
+def require_upsert_support(url):
+    name = make_url(url).get_backend_name()
+    if name not in UPSERT_DIALECTS:
+        raise RuntimeError(
+            f"database URL {make_url(url).render_as_string()} uses {name}; only PostgreSQL and SQLite are supported"
+        )
+
+
+# users.db files from before provider-scoped ids have social_id UNIQUE on its
+# own and no (provider, social_id) index, so the upsert's ON CONFLICT matches
+# nothing and every login fails. Adds the index when it is missing (and drops
+# the old constraint on PostgreSQL; SQLite can't drop a table constraint, and
+# the old one is only stricter). Safe to run on every start.
+def upgrade_user_table(engine, model):
+    table = model.__table__
+    name = engine.dialect.identifier_preparer.quote(table.name)
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        if not inspector.has_table(table.name):
+            return
+        unique = {tuple(c["column_names"]) for c in inspector.get_unique_constraints(table.name)}
+        unique |= {tuple(i["column_names"]) for i in inspector.get_indexes(table.name) if i["unique"]}
+        if ("provider", "social_id") not in unique:
+            connection.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS uq_user_provider_social_id ON {name} (provider, social_id)"
+            ))
+        if engine.dialect.name == "postgresql" and ("social_id",) in unique:
+            connection.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS user_social_id_key"))
@@ -0,0 +1,167 @@
+import heapq
+from datetime import date
+from itertools import islice
+
+from extensions import db
+from models import CovidStat
+from queries import NUMERIC_FIELDS, QueryError, parse_date, parse_int, apply_filters, filter_shards, parse_filter_args
+from sharding import covid_dialect, read_shards, sharding_enabled
+
+
+GROUPS = ("country", "day", "week", "month")
+FUNCS = {"sum": db.func.sum, "avg": db.func.avg, "min": db.func.min, "max": db.func.max}
+TOP_FIELDS = NUMERIC_FIELDS
+MAX_TOP = 250
+
+
+def _parse_choices(args, name, choices):
+    raw = args.get(name)
+    if not raw:
+        return tuple(choices)
+    values = tuple(v.strip() for v in raw.split(",") if v.strip())
+    unknown = [v for v in values if v not in choices]
+    if unknown or not values:
+        raise QueryError(f"{name} must be a comma separated subset of {', '.join(choices)}")
+    return values
+
+
+def parse_aggregate_args(args):
+    params = parse_filter_args(args)
+    params["group_by"] = args.get("group_by") or "country"
+    if params["group_by"] not in GROUPS:
+        raise QueryError(f"group_by must be one of {', '.join(GROUPS)}")
+    params["metrics"] = _parse_choices(args, "metrics", NUMERIC_FIELDS)
+    params["funcs"] = _parse_choices(args, "funcs", tuple(FUNCS))
+    return params
+
+
+def parse_top_args(args):
+    params = {
+        "by": args.get("by") or "deaths",
+        "n": min(parse_int(args, "n", minimum=1) or 10, MAX_TOP),
+        "date": parse_date(args, "date"),
+    }
+    if params["by"] not in TOP_FIELDS:
+        raise QueryError(f"by must be one of {', '.join(TOP_FIELDS)}")
+    return params
+
+
+# Expression for the start of the time bucket a snapshot falls in
+def _bucket_expr(group_by):
+    column = CovidStat.snapshot_date
+    if group_by == "day":
+        return column
+    if covid_dialect() == "postgresql":
+        return db.func.date(db.func.date_trunc(group_by, column))
+    if group_by == "week":
+        # ISO weeks start on Monday: move to the next Sunday, then back six days
+        return db.func.date(column, "weekday 0", "-6 days")
+    return db.func.date(column, "start of month")
+
+
+def _label(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _number(value):
+    if value is None or isinstance(value, int):
+        return value
+    return round(float(value), 2)
+
+
+# SUM/AVG/MIN/MAX per country or per time bucket, computed by the database
+def aggregate_covid(params):
+    if params["group_by"] == "country":
+        key, group = "country", CovidStat.country
+    else:
+        key, group = "bucket", _bucket_expr(params["group_by"])
+
+    columns = [group.label("group_key"), db.func.count().label("count")]
+    for metric in params["metrics"]:
+        for name in params["funcs"]:
+            columns.append(FUNCS[name](getattr(CovidStat, metric)).label(f"{metric}_{name}"))
+
+    stmt = apply_filters(db.select(*columns), params)
+    if key == "bucket":
+        stmt = stmt.where(CovidStat.snapshot_date.isnot(None))
+    stmt = stmt.group_by(group).order_by(group)
+    if sharding_enabled():
+        rows = _merge_groups(read_shards(stmt, filter_shards(params)), params)
+    else:
+        rows = db.session.execute(stmt).mappings()
+
+    results = []
+    for row in rows:
+        item = {key: _label(row["group_key"]), "count": row["count"]}
+        for metric in params["metrics"]:
+            item[metric] = {name: _number(row[f"{metric}_{name}"]) for name in params["funcs"]}
+        results.append(item)
+    return results
+
+
+# Combines per-shard groups into one row per group key, in key order. A
+# country is on one shard, but a time bucket has rows on every shard: sums
+# and counts add up, min and max combine, and averages are weighted by count
+# (the metric columns are NOT NULL, so count is also the AVG's row count).
+def _merge_groups(pages, params):
+    merged = {}
+    for row in heapq.merge(*pages, key=lambda row: row.group_key):
+        row = row._asdict()
+        total = merged.get(row["group_key"])
+        if total is None:
+            merged[row["group_key"]] = row
+            continue
+        for metric in params["metrics"]:
+            for name in params["funcs"]:
+                column = f"{metric}_{name}"
+                if name == "sum":
+                    total[column] += row[column]
+                elif name == "min":
+                    total[column] = min(total[column], row[column])
+                elif name == "max":
+                    total[column] = max(total[column], row[column])
+                else:
+                    total[column] = (
+                        (float(total[column]) * total["count"] + float(row[column]) * row["count"])
+                        / (total["count"] + row["count"])
+                    )
+        total["count"] += row["count"]
+    return merged.values()
+
+
+# Top N countries by a metric. For a single date this is an ORDER BY ... LIMIT on
+# an index led by (snapshot_date, metric); otherwise each country's latest
+# snapshot is ranked, picked with ROW_NUMBER() over the covering (country,
+# snapshot_date, ...) index. Not MAX(): active counts fall, and corrected rows
+# can go down. Undated rows only count for countries with no dated one.
+def top_countries(params):
+    column = getattr(CovidStat, params["by"])
+    if params["date"]:
+        stmt = (
+            db.select(CovidStat.country, column.label("value"))
+            .where(CovidStat.snapshot_date == params["date"])
+            .order_by(column.desc(), CovidStat.country)
+            .limit(params["n"])
+        )
+    else:
+        recency = db.func.row_number().over(
+            partition_by=CovidStat.country,
+            order_by=(CovidStat.snapshot_date.desc().nulls_last(), CovidStat.id.desc()),
+        )
+        latest = db.select(CovidStat.country, column.label("value"), recency.label("recency")).subquery()
+        stmt = (
+            db.select(latest.c.country, latest.c.value)
+            .where(latest.c.recency == 1)
+            .order_by(latest.c.value.desc(), latest.c.country)
+            .limit(params["n"])
+        )
+    if sharding_enabled():
+        # Countries don't span shards, so the top N is among the shards' own top N
+        pages = read_shards(stmt)
+        rows = islice(heapq.merge(*pages, key=lambda row: (-row.value, row.country)), params["n"])
+    else:
+        rows = db.session.execute(stmt)
+    return [
+        {"rank": rank, "country": row.country, params["by"]: row.value}
+        for rank, row in enumerate(rows, start=1)
+    ]
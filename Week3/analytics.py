@@ -0,0 +1,261 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from flask import current_app
+
+from extensions import cache, db
+from models import CovidStat
+from queries import QueryError, parse_date
+from response_cache import current_generation
+from sharding import read_shards, sharding_enabled
+
+
+METRICS = ("cases", "deaths", "recovered", "active")
+DELTA_FIELDS = ("cases", "deaths", "recovered")
+ROLLING_DAYS = 7
+REWRITE_KEY = "covid:analytics_rewrite"
+# recorded_at is set before commit, so a transaction that commits late can
+# carry a timestamp older than the newest one already loaded; re-read this far back
+SYNC_OVERLAP = timedelta(minutes=5)
+_EPOCH = date(1970, 1, 1)
+# Day numbers are offset so that dates before 1970 stay positive and never
+# spill into the country code bits of a key
+_DAY_BIAS = 1 << 31
+_DAY_MASK = 0xFFFFFFFF
+
+
+def parse_analytics_args(args):
+    countries = tuple(sorted({c.strip() for c in (args.get("country") or "").split(",") if c.strip()}))
+    params = {
+        "countries": countries or None,
+        "start_date": parse_date(args, "start_date"),
+        "end_date": parse_date(args, "end_date"),
+        "latest": (args.get("latest") or "").lower() in ("1", "true"),
+    }
+    if params["start_date"] and params["end_date"] and params["start_date"] > params["end_date"]:
+        raise QueryError("start_date must not be after end_date")
+    return params
+
+
+# Every dated CovidStat row, held as int64 columns sorted by (country, day).
+# key = country code << 32 | (days since 1970 + 2**31), so a country's snapshots are one
+# contiguous run and searchsorted finds any (country, day). A _Series is never
+# changed once published; a sync builds a new one and swaps it in.
+class _Series:
+    def __init__(self, countries, keys, values, max_id, watermark, generation, rewrite, loaded_at):
+        self.countries = countries
+        self.codes = {name: code for code, name in enumerate(countries)}
+        self.keys = keys
+        self.values = values
+        self.max_id = max_id
+        self.watermark = watermark
+        self.generation = generation
+        self.rewrite = rewrite
+        self.loaded_at = loaded_at
+        self._derived = None
+        self._lock = threading.Lock()
+
+    # Derived metrics for every row at once, computed on first use
+    def derived(self):
+        if self._derived is None:
+            with self._lock:
+                if self._derived is None:
+                    self._derived = _derive(self.keys, self.values)
+        return self._derived
+
+
+def _load(since_id=None, since=None):
+    stmt = db.select(
+        CovidStat.id, CovidStat.country, CovidStat.snapshot_date, CovidStat.recorded_at,
+        *[getattr(CovidStat, name) for name in METRICS],
+    ).where(CovidStat.snapshot_date.isnot(None))
+    if since_id is not None:
+        changed = CovidStat.id > since_id
+        if since is not None:
+            changed = db.or_(changed, CovidStat.recorded_at >= since - SYNC_OVERLAP)
+        stmt = stmt.where(changed)
+    if sharding_enabled():
+        return [row for rows in read_shards(stmt) for row in rows]
+    return db.session.execute(stmt).all()
+
+
+# Row tuples from _load() -> (sorted unique keys, {metric: array}, max id,
+# newest recorded_at). Unknown countries get the next free code.
+def _arrays(rows, countries, codes):
+    if not rows:
+        return np.empty(0, np.int64), {name: np.empty(0, np.int64) for name in METRICS}, None, None
+    ids, names, days, recorded, *metrics = zip(*rows)
+    for name in names:
+        if name not in codes:
+            codes[name] = len(countries)
+            countries.append(name)
+    country_codes = np.fromiter((codes[name] for name in names), np.int64, len(names))
+    day_numbers = np.array(days, dtype="datetime64[D]").astype(np.int64) + _DAY_BIAS
+    keys = (country_codes << 32) | day_numbers
+    # Stable sort then keep the last row per key (a key is unique in the table,
+    # but an overlapping sync can list a row twice)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    values = {name: np.array(column, dtype=np.int64)[order][last] for name, column in zip(METRICS, metrics)}
+    stamps = [stamp for stamp in recorded if stamp is not None]
+    return keys[last], values, max(ids), max(stamps) if stamps else None
+
+
+def _full_load(generation, rewrite):
+    countries, codes = [], {}
+    keys, values, max_id, watermark = _arrays(_load(), countries, codes)
+    return _Series(countries, keys, values, max_id or 0, watermark, generation, rewrite, time.monotonic())
+
+
+# New keys are inserted in place and existing ones overwritten, so only the
+# rows written since the last sync are read from the database
+def _merge(state, generation):
+    countries = list(state.countries)
+    codes = dict(state.codes)
+    rows = _load(state.max_id, state.watermark)
+    new_keys, new_values, max_id, watermark = _arrays(rows, countries, codes)
+    keys, values = state.keys, state.values
+    if len(new_keys):
+        pos = np.searchsorted(keys, new_keys)
+        exists = pos < len(keys)
+        exists[exists] = keys[pos[exists]] == new_keys[exists]
+        keys = np.insert(keys, pos[~exists], new_keys[~exists])
+        # Overwritten rows keep their index: position plus the inserts before it
+        shifted = pos[exists] + np.searchsorted(pos[~exists], pos[exists], side="right")
+        merged = {}
+        for name in METRICS:
+            column = np.insert(values[name], pos[~exists], new_values[name][~exists])
+            column[shifted] = new_values[name][exists]
+            merged[name] = column
+        values = merged
+    return _Series(
+        countries, keys, values, max(state.max_id, max_id or 0),
+        max(filter(None, (state.watermark, watermark)), default=None), generation, state.rewrite,
+        state.loaded_at,
+    )
+
+
+# Updates and deletes can't be found by id or recorded_at, so they make every
+# worker reload in full. Inserts and snapshot upserts are merged incrementally.
+def mark_rewritten():
+    cache.set(REWRITE_KEY, current_generation(), timeout=0)
+
+
+def _expired(state):
+    return time.monotonic() - state.loaded_at > current_app.config["ANALYTICS_MAX_AGE"]
+
+
+# The series for this app, synced to the current response-cache generation.
+# With a per-process cache a write on another worker never changes the
+# generation seen here, so the series is also reloaded in full once it is
+# ANALYTICS_MAX_AGE seconds old.
+def current_series():
+    holder = current_app.extensions.setdefault("covid_analytics", {"state": None, "lock": threading.Lock()})
+    generation = current_generation()
+    rewrite = cache.get(REWRITE_KEY)
+    state = holder["state"]
+    if (state is not None and state.generation == generation and state.rewrite == rewrite
+            and not _expired(state)):
+        return state
+    with holder["lock"]:
+        state = holder["state"]
+        if state is None or state.rewrite != rewrite or _expired(state):
+            state = _full_load(generation, rewrite)
+        elif state.generation != generation:
+            state = _merge(state, generation)
+        holder["state"] = state
+    return state
+
+
+# Case fatality and recovery rates, change since the previous snapshot, and the
+# average daily change over the last ROLLING_DAYS days: measured from the
+# newest snapshot at least that old, or from the country's first one.
+def _derive(keys, values):
+    n = len(keys)
+    index = np.arange(n)
+    groups = keys >> 32
+    days = keys & _DAY_MASK
+    first = np.ones(n, bool)
+    first[1:] = groups[1:] != groups[:-1]
+    group_start = np.maximum.accumulate(np.where(first, index, 0))
+
+    cases = values["cases"].astype(np.float64)
+    derived = {}
+    for name, numerator in (("case_fatality_rate", "deaths"), ("recovery_rate", "recovered")):
+        rate = np.full(n, np.nan)
+        np.divide(values[numerator], cases, out=rate, where=cases > 0)
+        derived[name] = rate
+
+    anchor = np.maximum(np.searchsorted(keys, keys - ROLLING_DAYS, side="right") - 1, group_start)
+    span = (days - days[anchor]).astype(np.float64)
+    for field in DELTA_FIELDS:
+        column = values[field].astype(np.float64)
+        delta = np.diff(column, prepend=np.nan)
+        delta[first] = np.nan
+        derived[f"new_{field}"] = delta
+        rolling = np.full(n, np.nan)
+        np.divide(column - column[anchor], span, out=rolling, where=span > 0)
+        derived[f"new_{field}_{ROLLING_DAYS}d_avg"] = rolling
+    return derived
+
+
+def _day_number(day):
+    return (day - _EPOCH).days + _DAY_BIAS
+
+
+def _floats(array, digits):
+    return [None if v != v else v for v in np.round(array, digits).tolist()]
+
+
+def _ints(array):
+    return [None if v != v else int(v) for v in array.tolist()]
+
+
+# Per-country series of raw values and derived metrics, countries by name.
+# Deltas and averages look back past start_date, so a window's first day is
+# still correct.
+def covid_analytics(params):
+    state = current_series()
+    derived = state.derived()
+    countries = params["countries"] or sorted(state.countries)
+    start = _day_number(params["start_date"]) if params["start_date"] else 0
+    end = _day_number(params["end_date"]) if params["end_date"] else _DAY_MASK
+
+    results = []
+    for country in countries:
+        code = state.codes.get(country)
+        if code is None:
+            continue
+        lo = np.searchsorted(state.keys, (code << 32) | start)
+        hi = np.searchsorted(state.keys, (code << 32) | end, side="right")
+        if lo == hi:
+            continue
+        if params["latest"]:
+            lo = hi - 1
+        window = slice(lo, hi)
+        days = ((state.keys[window] & _DAY_MASK) - _DAY_BIAS).astype("datetime64[D]").astype(str).tolist()
+        columns = {"date": days}
+        for name in METRICS:
+            columns[name] = state.values[name][window].tolist()
+        for name, array in derived.items():
+            if name.endswith("_rate"):
+                columns[name] = _floats(array[window], 6)
+            elif name.endswith("_avg"):
+                columns[name] = _floats(array[window], 2)
+            else:
+                columns[name] = _ints(array[window])
+        names = list(columns)
+        series = [dict(zip(names, point)) for point in zip(*columns.values())]
+        results.append({"country": country, "series": series})
+    return results
+
+
+def analytics_stats():
+    holder = current_app.extensions.get("covid_analytics")
+    state = holder and holder["state"]
+    if state is None:
+        return {"rows": 0, "countries": 0}
+    return {"rows": len(state.keys), "countries": len(state.countries), "max_id": state.max_id}
@@ -1,107 +1,218 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, abort, current_app, jsonify, request, send_file
 from config import Config
-from extensions import db
-import requests
+from extensions import db, cache
+from db_pool import configure_engines, engine_options, pool_stats
 from models import CovidStat, User
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-import os
+from migrations import upgrade_covid_stat
+from queries import QueryError, get_covid_row, parse_list_args, list_covid
+from snapshots import parse_history_args, record_snapshots, rollup_history
+from aggregates import aggregate_covid, parse_aggregate_args, parse_top_args, top_countries
+from ingest import require_upsert_support
+from upstream import UpstreamError, fetch_all_countries, fetch_countries
+from response_cache import bump_generation, cache_stats, cached_response, normalized_key
+from routing import PRIMARY_HEADER, pin_writer_to_primary, read_replica
+from sharding import delete_rows, init_shards, insert_rows, locate, shard_binds, sharding_enabled, update_rows
+from log_pipeline import configure_logging, log_request, start_request
+import metrics
+import profiling
+import querycount
+from serialization import FastJSONProvider, covid_stat_row, covid_stat_rows
+from passwords import HasherBusy, needs_rehash
+from export import export_response, parse_export_args
+from health import readiness
+from analytics import analytics_stats, covid_analytics, mark_rewritten, parse_analytics_args
+from batch import FIELDS as WRITABLE_FIELDS, BatchError, DEFAULT_OPS, apply_ops, read_items, validate_items
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
+from jwt_cache import CachingJWTManager, revoke_token
+from datetime import datetime
 from utils import role_required
-import logging
-from logging.handlers import RotatingFileHandler
+import click
 from flask_cors import CORS
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from flask_caching import Cache
-
-
-app = Flask(__name__)
-app.config.from_object(Config)
-app.config["JWT_IDENTITY_CLAIM"] = "user_id"
-db.init_app(app)
-CORS(app, resources={r"/*": {"origins": "*"}})
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-jwt-secret")
-jwt = JWTManager(app)
-limiter = Limiter(get_remote_address, app=app, default_limits=["200/day", "50/hour"])
-cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
-
-
-handler = RotatingFileHandler("week3.log", maxBytes=1000000, backupCount=3)
-handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
-
-
+from ratelimit import rate_limit_key
+
+
+api = Blueprint("api", __name__)
+jwt = CachingJWTManager()
+# Default limits (RATELIMIT_DEFAULT) apply to each route separately; the
+# decorators below add tighter ones to logins and writes
+limiter = Limiter(rate_limit_key, on_breach=metrics.record_rate_limited)
+login_limit = limiter.limit(lambda: current_app.config["RATELIMIT_LOGIN"])
+register_limit = limiter.limit(lambda: current_app.config["RATELIMIT_REGISTER"])
+write_limit = limiter.limit(lambda: current_app.config["RATELIMIT_WRITE"])
+api.after_app_request(pin_writer_to_primary)
+
+
+# Application factory. `config` overrides Config, e.g. for tests:
+#   create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///test.db", "TESTING": True})
+def create_app(config=None):
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(app.config), **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    }
+    app.config["SQLALCHEMY_BINDS"] = {
+        **app.config["SQLALCHEMY_BINDS"], **shard_binds(app.config["COVID_SHARD_URLS"])
+    }
+    require_upsert_support(app.config)
+
+    # Registered first so the request id and start times exist even for requests
+    # the rate limiter rejects (after_request hooks run in reverse order)
+    configure_logging(app)
+    app.before_request(metrics.start_request)
+    app.before_request(querycount.start_request)
+    app.before_request(start_request)
+    app.before_request(profiling.start_request)
+    app.after_request(metrics.record_request)
+    app.after_request(log_request)
+    app.after_request(profiling.finish_request)
+    app.teardown_request(profiling.teardown_request)
+
+    db.init_app(app)
+    configure_engines(app)
+    CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-After-Id", "ETag", PRIMARY_HEADER])
+    jwt.init_app(app)
+    limiter.init_app(app)
+    cache.init_app(app)
+
+    app.register_blueprint(api)
+    app.cli.add_command(init_db_command)
+    return app
+
+
+# One-time schema setup, run before starting the server and again after an
+# upgrade:
+#   flask --app app init-db
+# The primary and any CovidStat shards are touched; a replica gets its schema
+# through replication. Tables that already exist are brought up to date.
+@click.command("init-db")
+def init_db_command():
+    db.create_all(bind_key=None)
+    upgrade_covid_stat(db.engine)
+    init_shards()
+    click.echo("Initialized the database.")
+
+
+# Returns the record to store for an upstream payload, with the counts as
+# ints, or None if a field is
+# missing or not a whole number ("N/A", "1,234"), so one bad country is
+# reported in errors instead of failing the whole fetch.
 def validate_covid_data(data):
-    required_fields = ["cases", "deaths", "recovered", "active", "country"]
-    for field in required_fields:
-        if field not in data:
-            return False
-        if not isinstance(data[field], (int, str)):
-            return False
-    return True
+    if not isinstance(data, dict) or not isinstance(data.get("country"), str):
+        return None
+    record = {"country": data["country"]}
+    for field in ("cases", "deaths", "recovered", "active"):
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            return None
+        try:
+            record[field] = int(value)
+        except ValueError:
+            return None
+    return record
 
 # ----------------------
 # Routes
 # ----------------------
 
-@app.route("/")
+@api.route("/")
 def home():
     return {
         "message": "Welcome to the Week3 API 🚀",
         "endpoints": {
-            "fetch covid": "/covid/fetch (GET - pull live data & save)",
-            "covid CRUD": "/covid (POST, GET), /covid/<id> (PUT, DELETE)"
+            "fetch covid": "/covid/fetch?countries=USA,Peru|all (GET - pull live data & save)",
+            "covid CRUD": "/covid (POST, GET), /covid/<id> (GET, PUT, DELETE)",
+            "covid aggregate": "/covid/aggregate, /covid/top, /covid/history, /covid/analytics (GET)",
+            "covid batch": "/covid/batch (POST, PATCH, DELETE - JSON array or NDJSON)",
+            "covid export": "/covid/export?format=csv|ndjson (GET - streamed, same filters as /covid, resume with after_id)",
+            "covid list params": "after_id, limit, country, min_/max_<cases|deaths|recovered|active>, sort"
         }
     }
 
 # Fetch live COVID-19 data and save to DB
-@app.route("/covid/fetch", methods=["GET"])
+# ?countries=USA,Peru fetches several countries concurrently, ?countries=all fetches every country
+@api.route("/covid/fetch", methods=["GET"])
+@write_limit
 def fetch_covid_data():
-    url = "https://disease.sh/v3/covid-19/countries/USA"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        return jsonify({"error": "Failed to fetch data"}), response.status_code
-
-    data = response.json()
-    if not validate_covid_data(data):
+    countries = [c.strip() for c in request.args.get("countries", "USA").split(",") if c.strip()]
+    if not countries:
+        return jsonify({"error": "countries must not be empty"}), 400
+    if len(countries) > current_app.config["COVID_FETCH_MAX_COUNTRIES"]:
+        return jsonify({"error": "too many countries, use countries=all"}), 400
+
+    base_url = current_app.config["COVID_UPSTREAM_URL"]
+    workers = current_app.config["COVID_FETCH_WORKERS"]
+    timeout = current_app.config["COVID_FETCH_TIMEOUT"]
+    if countries == ["all"]:
+        try:
+            results, errors = fetch_all_countries(base_url, workers, timeout), {}
+        except UpstreamError as e:
+            return jsonify({"error": str(e)}), e.status_code
+    else:
+        results, errors = fetch_countries(base_url, countries, workers, timeout)
+
+    saved, records = [], []
+    for country, data in results.items():
+        record = validate_covid_data(data)
+        if record is None:
+            errors[country] = "Invalid data format"
+            continue
+        saved.append(data)
+        records.append(record)
+
+    if not saved:
+        if errors and all(isinstance(e, UpstreamError) for e in errors.values()):
+            status = next(iter(errors.values())).status_code
+            return jsonify({"error": "Failed to fetch data", "errors": {c: str(e) for c, e in errors.items()}}), status
         return jsonify({"error": "Invalid data format"}), 400
 
-    covid_stat = CovidStat(
-        country=data["country"],
-        cases=data["cases"],
-        deaths=data["deaths"],
-        recovered=data["recovered"],
-        active=data["active"]
-    )
-    db.session.add(covid_stat)
+    # All countries are written in one transaction; unchanged snapshots are skipped
+    today = datetime.utcnow().date()
+    stored, skipped = record_snapshots([{**record, "snapshot_date": today} for record in records])
     db.session.commit()
+    if stored:
+        bump_generation()
 
-    return jsonify({"message": "COVID data fetched and saved", "data": data}), 201
+    return jsonify({
+        "message": "COVID data fetched and saved",
+        "data": saved,
+        "skipped": skipped,
+        "errors": {c: str(e) for c, e in errors.items()}
+    }), 201
 
 
 
-@app.route("/covid", methods=["GET"])
+# List COVID records one page at a time (?after_id=&limit=&country=&min_cases=&sort=-deaths)
+@api.route("/covid", methods=["GET"])
+@read_replica
+@cached_response(lambda: normalized_key(parse_list_args(request.args)))
 def get_all_covid():
-    stats = CovidStat.query.all()
-    return jsonify([
-        {
-            "id": s.id,
-            "country": s.country,
-            "cases": s.cases,
-            "deaths": s.deaths,
-            "recovered": s.recovered,
-            "active": s.active
-        }
-        for s in stats
-    ]), 200
+    try:
+        params = parse_list_args(request.args)
+        stats, next_after_id = list_covid(params)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(covid_stat_rows(stats))
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return response, 200
 
 
 
-@app.route("/covid", methods=["POST"])
+@api.route("/covid", methods=["POST"])
+@write_limit
 @jwt_required()
 def add_covid_stat():
     identity = get_jwt_identity()
     data = request.get_json()
+    if sharding_enabled():
+        record_id = insert_rows([{field: data[field] for field in WRITABLE_FIELDS}])[0]
+        bump_generation()
+        return jsonify({"message": "Record added", "id": record_id}), 201
     covid_stat = CovidStat(
         country=data["country"],
         cases=data["cases"],
@@ -110,37 +221,236 @@ def add_covid_stat():
         active=data["active"]
     )
     db.session.add(covid_stat)
+    # Read the id before commit expires the object, or it costs a SELECT
+    db.session.flush()
+    record_id = covid_stat.id
     db.session.commit()
-    return jsonify({"message": "Record added", "id": covid_stat.id}), 201
+    bump_generation()
+    return jsonify({"message": "Record added", "id": record_id}), 201
+
+
+# Stream every matching record as CSV or NDJSON in id order, gzipped when the
+# client accepts it (?format=csv|ndjson&after_id=&country=&min_cases=...)
+@api.route("/covid/export", methods=["GET"])
+@read_replica
+def export_covid():
+    try:
+        params = parse_export_args(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return export_response(params, gzip=request.accept_encodings["gzip"] > 0)
+
+
+# Per-country series with case fatality and recovery rates, change since the
+# previous snapshot and 7-day average daily change, computed with NumPy over an
+# in-memory copy of the snapshots (?country=USA,Peru&start_date=&end_date=&latest=1)
+@api.route("/covid/analytics", methods=["GET"])
+@read_replica
+@cached_response(lambda: normalized_key(parse_analytics_args(request.args)))
+def covid_analytics_view():
+    try:
+        params = parse_analytics_args(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(covid_analytics(params)), 200
+
+
+# SUM/AVG/MIN/MAX grouped by country or time bucket (?group_by=country|day|week|month&metrics=&funcs=)
+@api.route("/covid/aggregate", methods=["GET"])
+@read_replica
+@cached_response(lambda: normalized_key(parse_aggregate_args(request.args)))
+def aggregate_covid_stats():
+    try:
+        params = parse_aggregate_args(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(aggregate_covid(params)), 200
+
+
+# Top N countries by a metric (?by=deaths|active|cases|recovered&n=10&date=YYYY-MM-DD)
+@api.route("/covid/top", methods=["GET"])
+@read_replica
+@cached_response(lambda: normalized_key(parse_top_args(request.args)))
+def top_covid_countries():
+    try:
+        params = parse_top_args(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(top_countries(params)), 200
+
+
+# Daily or weekly snapshot history from the rollup tables
+# (?country=&granularity=day|week&start_date=&end_date=&limit=)
+@api.route("/covid/history", methods=["GET"])
+@read_replica
+@cached_response(lambda: normalized_key(parse_history_args(request.args)))
+def covid_history():
+    try:
+        params = parse_history_args(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(rollup_history(params)), 200
+
+
+# Get a single COVID record
+@api.route("/covid/<int:id>", methods=["GET"])
+@read_replica
+@cached_response(lambda id: str(id))
+def get_covid(id):
+    row = get_covid_row(id)
+    if row is None:
+        abort(404)
+    return jsonify(covid_stat_row(row)), 200
 
 
 # Update a COVID record
-@app.route("/covid/<int:id>", methods=["PUT"])
+@api.route("/covid/<int:id>", methods=["PUT"])
+@write_limit
 # @jwt_required()
 def update_covid(id):
-    stat = CovidStat.query.get_or_404(id)
     data = request.get_json()
-    stat.country = data.get("country", stat.country)
-    stat.cases = data.get("cases", stat.cases)
-    stat.deaths = data.get("deaths", stat.deaths)
-    stat.recovered = data.get("recovered", stat.recovered)
-    stat.active = data.get("active", stat.active)
-    db.session.commit()
+    values = {field: data[field] for field in WRITABLE_FIELDS if field in data}
+    if not values:
+        if get_covid_row(id) is None:
+            abort(404)
+        return jsonify({"message": "Record updated"})
+    if sharding_enabled():
+        located = locate([id])
+        if id not in located or not update_rows({id: values}, located):
+            abort(404)
+    else:
+        # One UPDATE; a missing record shows up as zero matched rows
+        result = db.session.execute(
+            db.update(CovidStat).where(CovidStat.id == id).values(**values),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            abort(404)
+        db.session.commit()
+    bump_generation()
+    mark_rewritten()
     return jsonify({"message": "Record updated"})
 
 
 # Delete a COVID record (Admin only)
-@app.route("/covid/<int:id>", methods=["DELETE"])
+@api.route("/covid/<int:id>", methods=["DELETE"])
+@write_limit
 @role_required("admin")
 def delete_covid(id):
-    stat = CovidStat.query.get_or_404(id)
-    db.session.delete(stat)
-    db.session.commit()
+    if sharding_enabled():
+        if delete_rows([id]) == 0:
+            abort(404)
+    else:
+        result = db.session.execute(
+            db.delete(CovidStat).where(CovidStat.id == id),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            abort(404)
+        db.session.commit()
+    bump_generation()
+    mark_rewritten()
     return jsonify({"message": "Record deleted"})
 
 
+# Bulk create/update/delete in one transaction. POST defaults items to create,
+# PATCH to update and DELETE to delete; an item's "op" overrides the default.
+# Creates run first, then updates, then deletes. Any invalid item rejects the batch.
+@api.route("/covid/batch", methods=["POST", "PATCH", "DELETE"])
+@write_limit
+@jwt_required()
+def batch_covid():
+    try:
+        items = read_items(request, current_app.config["COVID_BATCH_MAX_ITEMS"])
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ops, errors = validate_items(items, DEFAULT_OPS[request.method])
+    if errors:
+        return jsonify({"error": "batch rejected", "results": errors}), 400
+
+    # One role check for the whole batch instead of one per item
+    if any(op == "delete" for _, op, _, _ in ops) and get_jwt().get("role") != "admin":
+        return {"msg": "Forbidden - insufficient privileges"}, 403
+
+    results = apply_ops(ops)
+    db.session.commit()
+    if results:
+        bump_generation()
+    if any(op != "create" for _, op, _, _ in ops):
+        mark_rewritten()
+    return jsonify({"results": results}), 200
+
+
+# Response cache and JWT verification cache counters for this process
+@api.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify({
+        **cache_stats(),
+        "jwt": current_app.extensions["jwt_verified_tokens"].stats(),
+        "analytics": analytics_stats(),
+    }), 200
+
+
+# Prometheus text exposition for this worker process
+@api.route("/metrics", methods=["GET"])
+@limiter.exempt
+def get_metrics():
+    body = metrics.render(metrics.collected_stats())
+    return current_app.response_class(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Liveness probe: the worker is up and answering. It touches neither the
+# database nor the cache, so a slow database never gets pods restarted.
+@api.route("/healthz", methods=["GET"])
+@limiter.exempt
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+
+# Readiness probe: 503 until this worker has warmed up, then the cached result
+# of a primary database ping (see health.py)
+@api.route("/readyz", methods=["GET"])
+@limiter.exempt
+def readyz():
+    ready, body = readiness(current_app._get_current_object())
+    return jsonify(body), 200 if ready else 503
+
+
+# Requests slower than SLOW_REQUEST_MS with their SQL, newest first (this process)
+@api.route("/debug/slow-requests", methods=["GET"])
+@role_required("admin")
+def get_slow_requests():
+    return jsonify(profiling.slow_requests()), 200
+
+
+# Profiles written for `X-Profile: 1` or PROFILE_SAMPLE_RATE, newest first
+@api.route("/debug/profiles", methods=["GET"])
+@role_required("admin")
+def get_profiles():
+    return jsonify(profiling.list_profiles()), 200
+
+
+@api.route("/debug/profiles/<name>", methods=["GET"])
+@role_required("admin")
+def get_profile(name):
+    path = profiling.profile_path(name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=name)
+
+
+# Connection pool usage and checkout wait times for this process, per bind
+@api.route("/db/pool", methods=["GET"])
+def get_pool_stats():
+    return jsonify(pool_stats()), 200
+
+
 # Register a new user
-@app.route("/auth/register", methods=["POST"])
+@api.route("/auth/register", methods=["POST"])
+@register_limit
 def register():
     data = request.get_json()
     if not data or not data.get("username") or not data.get("password"):
@@ -148,23 +458,34 @@ def register():
     if User.query.filter_by(username=data["username"]).first():
         return jsonify({"msg": "username already exists"}), 409
     user = User(username=data["username"], email=data.get("email"))
-    user.set_password(data["password"])
+    try:
+        user.set_password(data["password"])
+    except HasherBusy:
+        return jsonify({"msg": "server busy, try again"}), 503
     db.session.add(user)
     db.session.commit()
     return jsonify({"msg": "user created"}), 201
 
 
 # Login
-@app.route("/auth/login", methods=["POST"])
+@api.route("/auth/login", methods=["POST"])
+@login_limit
 def login():
     data = request.get_json()
     if not data or "username" not in data or "password" not in data:
         return jsonify({"msg": "username and password required"}), 400
     
     user = User.query.filter_by(username=data["username"]).first()
-    if not user or not user.check_password(data["password"]):
-        return jsonify({"msg": "bad username/password"}), 401
-    
+    try:
+        if not user or not user.check_password(data["password"]):
+            return jsonify({"msg": "bad username/password"}), 401
+        # Upgrade hashes made under an older method/cost while we have the password
+        if needs_rehash(user.password_hash):
+            user.set_password(data["password"])
+            db.session.commit()
+    except HasherBusy:
+        return jsonify({"msg": "server busy, try again"}), 503
+
     # Force identity to string to avoid "Subject must be a string" error
     access_token = create_access_token(
         identity=str(user.id),  # 🔑 make sure it's a string
@@ -174,32 +495,39 @@ def login():
 
 
 
+# Logout: revoke the current access token
+@api.route("/auth/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    revoke_token(get_jwt())
+    return jsonify({"msg": "token revoked"}), 200
+
+
+
 # ----------------------
 # Error Handlers
 # ----------------------
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request(e):
-    app.logger.warning(f"400: {e}")
+    current_app.logger.warning("400: %s", e, extra={"status": 400})
     return jsonify({"error": "bad request"}), 400
 
-@app.errorhandler(401)
+@api.app_errorhandler(401)
 def unauthorized(e):
-    app.logger.warning(f"401: {e}")
+    current_app.logger.warning("401: %s", e, extra={"status": 401})
     return jsonify({"error": "unauthorized"}), 401
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(e):
     return jsonify({"error": "not found"}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def server_error(e):
-    app.logger.error(f"500: {e}", exc_info=True)
+    current_app.logger.error("500: %s", e, exc_info=True, extra={"status": 500})
     return jsonify({"error": "internal server error"}), 500
 
 
 
+# Development server only; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=5001)
-
+    create_app().run(debug=True, port=5001)
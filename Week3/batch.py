@@ -0,0 +1,176 @@
+import json
+
+from extensions import db
+from models import CovidStat
+from sharding import locate, shard_index, sharding_enabled, write_shard
+
+
+FIELDS = ("country", "cases", "deaths", "recovered", "active")
+OPS = ("create", "update", "delete")
+DEFAULT_OPS = {"POST": "create", "PATCH": "update", "DELETE": "delete"}
+
+
+class BatchError(ValueError):
+    pass
+
+
+# Read the batch body: a JSON array, or NDJSON (one operation per line) when the
+# request is sent as application/x-ndjson. Lines are read from the stream as they
+# arrive so NDJSON bodies are never buffered as one string.
+def read_items(request, max_items):
+    if request.mimetype == "application/x-ndjson":
+        items = []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+            if len(items) > max_items:
+                raise BatchError(f"batch is limited to {max_items} items")
+        return items
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise BatchError("body must be a JSON array or NDJSON")
+    if len(items) > max_items:
+        raise BatchError(f"batch is limited to {max_items} items")
+    return items
+
+
+def _validate_values(item, required):
+    values = {}
+    for field in FIELDS:
+        if field not in item:
+            if required:
+                return None, f"{field} is required"
+            continue
+        value = item[field]
+        if field == "country":
+            if not isinstance(value, str) or not value or len(value) > 50:
+                return None, "country must be a non-empty string of at most 50 characters"
+        elif not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            return None, f"{field} must be a non-negative integer"
+        values[field] = value
+    unknown = set(item) - set(FIELDS) - {"op", "id"}
+    if unknown:
+        return None, f"unknown fields: {', '.join(sorted(unknown))}"
+    return values, None
+
+
+# Validate every item in one pass. Returns the operations as (index, op, id, values)
+# tuples and a list of per-item errors; nothing is written here.
+def validate_items(items, default_op):
+    ops, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "item must be a JSON object"})
+            continue
+        op = item.get("op", default_op)
+        if op not in OPS:
+            errors.append({"index": index, "error": f"op must be one of {', '.join(OPS)}"})
+            continue
+
+        record_id = item.get("id")
+        if op != "create" and (not isinstance(record_id, int) or isinstance(record_id, bool)):
+            errors.append({"index": index, "error": "id is required"})
+            continue
+
+        values = {}
+        if op != "delete":
+            values, error = _validate_values(item, required=(op == "create"))
+            if error:
+                errors.append({"index": index, "error": error})
+                continue
+            if op == "update" and not values:
+                errors.append({"index": index, "error": "update has no fields"})
+                continue
+        ops.append((index, op, record_id, values))
+
+    # Updates and deletes must target existing rows; one IN query checks them all
+    ids = {record_id for _, op, record_id, _ in ops if op != "create"}
+    if ids:
+        if sharding_enabled():
+            existing = set(locate(ids))
+        else:
+            existing = set(db.session.scalars(db.select(CovidStat.id).where(CovidStat.id.in_(ids))))
+        for index, op, record_id, _ in ops:
+            if op != "create" and record_id not in existing:
+                errors.append({"index": index, "error": f"record {record_id} not found"})
+    if sharding_enabled() and not errors:
+        errors = _single_shard_errors(ops, locate(ids) if ids else {})
+    errors.sort(key=lambda e: e["index"])
+    return ops, errors
+
+
+# Shards commit separately, so a batch is only all or none when every item
+# stays on one shard. Items that don't, including updates that would move a
+# row to another shard, are reported against the shard of the first item.
+def _single_shard_errors(ops, located):
+    errors, target = [], None
+    for index, op, record_id, values in ops:
+        shard = shard_index(values["country"]) if op == "create" else located[record_id]
+        if op == "update" and "country" in values and shard_index(values["country"]) != shard:
+            errors.append({"index": index, "error": f"update would move record {record_id} to another shard"})
+            continue
+        if target is None:
+            target = shard
+        elif shard != target:
+            errors.append({"index": index, "error": "batch spans several shards; send one batch per shard"})
+    return errors
+
+
+# With sharding the validated batch is on one shard and runs in one
+# transaction there
+def _apply_sharded(ops):
+    if not ops:
+        return []
+    creates = [(index, values) for index, op, _, values in ops if op == "create"]
+    if creates:
+        shard = shard_index(creates[0][1]["country"])
+    else:
+        record_id = ops[0][2]
+        shard = locate({record_id})[record_id]
+
+    updates = {}
+    for _, op, record_id, values in ops:
+        if op == "update":
+            updates[record_id] = {**updates.get(record_id, {}), **values}
+    deletes = {record_id for _, op, record_id, _ in ops if op == "delete"}
+    new_ids = write_shard(shard, [values for _, values in creates], updates, deletes)
+
+    results = {index: {"index": index, "status": "created", "id": new_id} for (index, _), new_id in zip(creates, new_ids)}
+    for index, op, record_id, _ in ops:
+        if op != "create":
+            results[index] = {"index": index, "status": "updated" if op == "update" else "deleted", "id": record_id}
+    return [results[index] for index in sorted(results)]
+
+
+# Apply validated operations with one executemany per kind. The caller commits.
+def apply_ops(ops):
+    if sharding_enabled():
+        return _apply_sharded(ops)
+    results = {}
+
+    creates = [(index, values) for index, op, _, values in ops if op == "create"]
+    if creates:
+        stmt = db.insert(CovidStat).returning(CovidStat.id, sort_by_parameter_order=True)
+        new_ids = db.session.scalars(stmt, [values for _, values in creates]).all()
+        for (index, _), new_id in zip(creates, new_ids):
+            results[index] = {"index": index, "status": "created", "id": new_id}
+
+    updates = [(index, record_id, values) for index, op, record_id, values in ops if op == "update"]
+    if updates:
+        db.session.execute(db.update(CovidStat), [{"id": record_id, **values} for _, record_id, values in updates])
+        for index, record_id, _ in updates:
+            results[index] = {"index": index, "status": "updated", "id": record_id}
+
+    deletes = [(index, record_id) for index, op, record_id, _ in ops if op == "delete"]
+    if deletes:
+        db.session.execute(db.delete(CovidStat).where(CovidStat.id.in_({record_id for _, record_id in deletes})))
+        for index, record_id in deletes:
+            results[index] = {"index": index, "status": "deleted", "id": record_id}
+
+    return [results[index] for index in sorted(results)]
@@ -0,0 +1,117 @@
+# SQL-side aggregation versus the client-side approach at 1M rows.
+#
+#   python benchmarks/bench_aggregate.py --rows 1000000
+#
+# "client" pages through GET /covid's query (1000 rows per page, serialized to
+# JSON as the endpoint does) and sums/sorts in Python, which is what the browser
+# had to do before /covid/aggregate and /covid/top existed.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from aggregates import aggregate_covid, top_countries
+from bench_ingest import make_app
+from extensions import db
+from models import CovidStat
+from queries import MAX_LIMIT, list_covid, parse_list_args
+
+COUNTRIES = 200
+
+
+def populate(rows, chunk=50000):
+    start = date(2000, 1, 1)
+    days = rows // COUNTRIES
+    insert = db.insert(CovidStat)
+    batch = []
+    for d in range(days):
+        for c in range(COUNTRIES):
+            batch.append({
+                "country": f"Country-{c:03d}",
+                "snapshot_date": start + timedelta(days=d),
+                "cases": 1000 + c * d,
+                "deaths": c + d,
+                "recovered": 500 + d,
+                "active": 500 + c * d,
+            })
+        if len(batch) >= chunk:
+            db.session.execute(insert, batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+    db.session.commit()
+
+
+def client_side():
+    totals = defaultdict(lambda: {"cases": 0, "deaths": 0, "recovered": 0, "active": 0, "count": 0})
+    after_id = None
+    while True:
+        args = {"limit": str(MAX_LIMIT)}
+        if after_id:
+            args["after_id"] = str(after_id)
+        stats, after_id = list_covid(parse_list_args(args))
+        page = json.loads(json.dumps([s.to_dict() for s in stats]))
+        db.session.expunge_all()
+        for row in page:
+            group = totals[row["country"]]
+            group["count"] += 1
+            for field in ("cases", "deaths", "recovered", "active"):
+                group[field] += row[field]
+        if after_id is None:
+            break
+    top = sorted(totals.items(), key=lambda item: item[1]["deaths"], reverse=True)[:10]
+    return totals, top
+
+
+def server_side():
+    params = {
+        "country": None, "start_date": None, "end_date": None, "group_by": "country",
+        "metrics": ("cases", "deaths", "recovered", "active"), "funcs": ("sum", "avg", "min", "max"),
+    }
+    params.update({f"{bound}_{f}": None for bound in ("min", "max") for f in params["metrics"]})
+    groups = aggregate_covid(params)
+    top = top_countries({"by": "deaths", "n": 10, "date": None})
+    return groups, top
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"  {label:<28} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    url, path = args.url, None
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+
+    bench_app = make_app(url)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+        timed(f"populate {args.rows} rows", lambda: populate(args.rows))
+        print(url)
+        server = timed("server: aggregate + top", server_side)
+        client = timed("client: page + sum in python", client_side)
+        assert len(server[0]) == len(client[0])
+        db.drop_all()
+    if path:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
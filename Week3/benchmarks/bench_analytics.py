@@ -0,0 +1,123 @@
+# NumPy derived metrics vs a pure-Python loop over ORM objects.
+#
+#   python benchmarks/bench_analytics.py --countries 200 --days 500
+#
+# "python loop": load every CovidStat entity and walk each country's snapshots
+# computing the same rates, deltas and 7-day averages one row at a time.
+# "numpy cold": first request after start (full load into arrays + compute).
+# "numpy incremental": one new snapshot per country, then the next request
+# (merge of the new rows only + compute). "numpy warm": metrics already computed.
+# Every numpy run includes building the full JSON-ready result; "metrics only"
+# is the vectorized computation on its own.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import create_app
+from analytics import ROLLING_DAYS, _derive, covid_analytics, current_series, parse_analytics_args
+from extensions import db
+from models import CovidStat
+from response_cache import bump_generation
+from snapshots import record_snapshots
+
+START = date(2020, 1, 1)
+
+
+def seed(countries, days):
+    rows = []
+    for c in range(countries):
+        for d in range(days):
+            cases = 1000 + c * 10 + d * (c + 3)
+            day = START + timedelta(days=d)
+            rows.append({"country": f"C{c:03}", "snapshot_date": day, "cases": cases,
+                         "recorded_at": datetime(day.year, day.month, day.day, 12),
+                         "deaths": cases // 50, "recovered": cases // 2, "active": cases - cases // 50 - cases // 2})
+    db.session.execute(db.insert(CovidStat), rows)
+    db.session.commit()
+
+
+def python_loop():
+    by_country = defaultdict(list)
+    for stat in db.session.scalars(db.select(CovidStat).where(CovidStat.snapshot_date.isnot(None))):
+        by_country[stat.country].append(stat)
+    results = []
+    for country in sorted(by_country):
+        stats = sorted(by_country[country], key=lambda s: s.snapshot_date)
+        series = []
+        for i, stat in enumerate(stats):
+            point = {"date": stat.snapshot_date.isoformat(), "cases": stat.cases, "deaths": stat.deaths,
+                     "recovered": stat.recovered, "active": stat.active,
+                     "case_fatality_rate": round(stat.deaths / stat.cases, 6) if stat.cases else None,
+                     "recovery_rate": round(stat.recovered / stat.cases, 6) if stat.cases else None}
+            anchor = 0
+            for j in range(i, -1, -1):
+                if (stat.snapshot_date - stats[j].snapshot_date).days >= ROLLING_DAYS:
+                    anchor = j
+                    break
+            span = (stat.snapshot_date - stats[anchor].snapshot_date).days
+            for field in ("cases", "deaths", "recovered"):
+                value = getattr(stat, field)
+                point[f"new_{field}"] = value - getattr(stats[i - 1], field) if i else None
+                point[f"new_{field}_7d_avg"] = round((value - getattr(stats[anchor], field)) / span, 2) if span else None
+            series.append(point)
+        results.append({"country": country, "series": series})
+    db.session.expunge_all()
+    return results
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--days", type=int, default=500)
+    args = parser.parse_args()
+    params = parse_analytics_args({})
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+            "LOG_FILE": os.path.join(tmpdir, "bench.log"),
+        })
+        with app.app_context():
+            db.create_all(bind_key=None)
+            seed(args.countries, args.days)
+        rows = args.countries * args.days
+        print(f"{rows:,} snapshots ({args.countries} countries x {args.days} days)")
+
+        with app.test_request_context():
+            loop_time, expected = timed(python_loop)
+            cold_time, result = timed(lambda: covid_analytics(params))
+            assert result == expected
+            warm_time, _ = timed(lambda: covid_analytics(params))
+            state = current_series()
+            derive_time, _ = timed(lambda: _derive(state.keys, state.values))
+
+            record_snapshots([
+                {"country": f"C{c:03}", "snapshot_date": START + timedelta(days=args.days), "cases": 10 ** 6,
+                 "deaths": 10 ** 4, "recovered": 10 ** 5, "active": 10 ** 6 - 11 * 10 ** 4}
+                for c in range(args.countries)
+            ])
+            db.session.commit()
+            bump_generation()
+            incremental_time, _ = timed(lambda: covid_analytics(params))
+            db.engine.dispose()
+
+        for name, seconds in (("python loop", loop_time), ("numpy cold", cold_time),
+                              ("numpy incremental", incremental_time), ("numpy warm", warm_time),
+                              ("metrics only", derive_time)):
+            print(f"{name:<18} {seconds * 1000:8.1f} ms  {loop_time / seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Peak Python memory and throughput of GET /covid/export.
+#
+#   python benchmarks/bench_export.py --rows 10000 100000
+#
+# Streams each format through the test client without buffering the body and
+# drops the chunks as they arrive, like a client writing to disk. Peak memory
+# (tracemalloc, measured on a second run) should stay the same as the row count grows.
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import create_app
+from extensions import db
+from models import CovidStat
+
+
+def seed(count, done):
+    start = date(2020, 1, 1)
+    rows = [
+        {"country": f"C{i % 200}", "cases": i * 7, "deaths": i, "recovered": i * 5, "active": i,
+         "snapshot_date": start + timedelta(days=i // 200)}
+        for i in range(done, count)
+    ]
+    if rows:
+        db.session.execute(db.insert(CovidStat), rows)
+        db.session.commit()
+
+
+def stream(client, query, headers):
+    res = client.get(f"/covid/export?{query}", headers=headers, buffered=False)
+    size = sum(len(chunk) for chunk in res.response)
+    res.close()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+            "LOG_FILE": os.path.join(tmpdir, "bench.log"),
+            "RATELIMIT_ENABLED": False,
+        })
+        with app.app_context():
+            db.create_all(bind_key=None)
+        client = app.test_client()
+        done = 0
+        for count in sorted(args.rows):
+            with app.app_context():
+                seed(count, done)
+            done = count
+            for label, query, headers in (("ndjson", "format=ndjson", {}),
+                                          ("csv", "format=csv", {}),
+                                          ("ndjson+gzip", "format=ndjson", {"Accept-Encoding": "gzip"})):
+                start = time.perf_counter()
+                size = stream(client, query, headers)
+                elapsed = time.perf_counter() - start
+                # Second run under tracemalloc, which slows Python down a lot
+                tracemalloc.start()
+                stream(client, query, headers)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{count:>7} rows  {label:<12} {count / elapsed:>9,.0f} rows/s  "
+                      f"{size / 1e6:6.1f} MB sent  peak {peak / 1e6:5.2f} MB")
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
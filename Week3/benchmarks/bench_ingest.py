@@ -0,0 +1,105 @@
+# Rows/sec for ingesting 200 countries x N days of snapshots.
+#
+#   python benchmarks/bench_ingest.py --days 30
+#   python benchmarks/bench_ingest.py --days 30 --url postgresql://postgres:postgres@db:5432/week3
+#
+# Without --url it runs against a temporary SQLite file, plus DATABASE_URL when
+# that is set (docker-compose sets it to the Postgres service). Each target is
+# measured three ways: the old one-ORM-object-per-row path, the chunked upsert
+# on an empty table, and the same upsert rerun over existing rows.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+
+from extensions import db
+from ingest import upsert_covid_stats
+from models import CovidStat
+
+
+def make_rows(countries, days):
+    start = date(2021, 1, 1)
+    return [
+        {
+            "country": f"Country-{c:03d}",
+            "snapshot_date": start + timedelta(days=d),
+            "cases": 1000 + c * d,
+            "deaths": c + d,
+            "recovered": 500 + d,
+            "active": 500 + c * d - c - 2 * d,
+        }
+        for d in range(days)
+        for c in range(countries)
+    ]
+
+
+def make_app(url):
+    bench_app = Flask(__name__)
+    bench_app.config.update(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_TRACK_MODIFICATIONS=False, COVID_SHARD_URLS=[])
+    db.init_app(bench_app)
+    return bench_app
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {count:>8} rows  {elapsed:8.3f}s  {count / elapsed:>10.0f} rows/sec")
+
+
+def run(url, rows, chunk_size):
+    print(url)
+    bench_app = make_app(url)
+    with bench_app.app_context():
+        def orm_add():
+            for row in rows:
+                db.session.add(CovidStat(**row))
+            db.session.commit()
+
+        def upsert():
+            upsert_covid_stats(rows, chunk_size=chunk_size)
+            db.session.commit()
+
+        db.drop_all()
+        db.create_all()
+        timed("orm add per row", orm_add, len(rows))
+
+        db.drop_all()
+        db.create_all()
+        timed("upsert (insert)", upsert, len(rows))
+        timed("upsert (rerun)", upsert, len(rows))
+        assert db.session.query(CovidStat).count() == len(rows)
+        db.drop_all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--url", action="append", help="database URL (repeatable)")
+    args = parser.parse_args()
+
+    rows = make_rows(args.countries, args.days)
+    urls, path = args.url, None
+    if not urls:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        urls = [f"sqlite:///{path}"]
+        if os.environ.get("DATABASE_URL"):
+            urls.append(os.environ["DATABASE_URL"])
+
+    for url in urls:
+        run(url, rows, args.chunk_size)
+    if path:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
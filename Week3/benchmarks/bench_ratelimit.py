@@ -0,0 +1,93 @@
+# Per-request cost of rate limiting.
+#
+#   python benchmarks/bench_ratelimit.py --requests 5000
+#
+# First the storage/strategy pairs on their own (one hit = one limiter check),
+# including the moving window, whose cost grows with the limit, for comparison.
+# Then GET / through the Flask test client with the limiter off, on with the
+# in-process memory store, and on with the shared SQLite store, anonymous and
+# with a JWT (identity-keyed). The difference to "off" is the overhead per request.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from app import create_app
+from extensions import db
+from ratelimit import SQLiteStorage
+
+
+def bench_strategies(count, tmpdir):
+    limit = parse(f"{count * 2}/hour")
+    storages = {
+        "memory": MemoryStorage(),
+        "sqlite": SQLiteStorage(f"sqlite:///{os.path.join(tmpdir, 'strategies.db')}"),
+    }
+    strategies = [
+        ("fixed-window", FixedWindowRateLimiter),
+        ("sliding-window-counter", SlidingWindowCounterRateLimiter),
+        ("moving-window", MovingWindowRateLimiter),
+    ]
+    for storage_name, storage in storages.items():
+        for strategy_name, strategy in strategies:
+            if strategy is MovingWindowRateLimiter and storage_name == "sqlite":
+                continue
+            limiter = strategy(storage)
+            start = time.perf_counter()
+            for _ in range(count):
+                limiter.hit(limit, "bench")
+            elapsed = time.perf_counter() - start
+            print(f"{storage_name:<7} {strategy_name:<24} {elapsed / count * 1e6:8.1f} us/hit")
+
+
+def bench_requests(count, tmpdir):
+    variants = [
+        ("off", {"RATELIMIT_ENABLED": False}),
+        ("memory", {"RATELIMIT_STORAGE_URI": "memory://"}),
+        ("sqlite", {"RATELIMIT_STORAGE_URI": f"sqlite:///{os.path.join(tmpdir, 'requests.db')}"}),
+    ]
+    baseline = None
+    for name, overrides in variants:
+        bench_app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmpdir, 'app.db')}",
+            "RATELIMIT_DEFAULT": f"{count * 4}/hour",
+            "PASSWORD_HASH_WORKERS": 0,
+            **overrides,
+        })
+        with bench_app.app_context():
+            db.create_all(bind_key=None)
+        client = bench_app.test_client()
+        creds = {"username": f"bench-{name}", "password": "pw"}
+        client.post("/auth/register", json=creds)
+        token = client.post("/auth/login", json=creds).get_json()["access_token"]
+
+        for label, headers in (("anonymous", {}), ("jwt", {"Authorization": f"Bearer {token}"})):
+            start = time.perf_counter()
+            for _ in range(count):
+                client.get("/", headers=headers)
+            per_request = (time.perf_counter() - start) / count * 1e6
+            if name == "off" and label == "anonymous":
+                baseline = per_request
+            print(f"limiter {name:<7} {label:<10} {per_request:8.1f} us/request  (+{per_request - baseline:6.1f})")
+        with bench_app.app_context():
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bench_strategies(args.requests, tmpdir)
+        bench_requests(args.requests, tmpdir)
+
+
+if __name__ == "__main__":
+    main()
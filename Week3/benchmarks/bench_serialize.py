@@ -0,0 +1,87 @@
+# Rows/sec for turning CovidStat rows into a JSON body.
+#
+#   python benchmarks/bench_serialize.py --rows 10000 100000
+#
+# For each size: ORM entities + to_dict + Flask's stdlib encoder (the old
+# GET /covid path), then column tuples + covid_stat_rows with the stdlib encoder,
+# then the same with FastJSONProvider (orjson). Query and encoding are timed
+# together, inside one app context, as the endpoint does it.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+from app import create_app
+from extensions import db
+from models import CovidStat
+from queries import COVID_STAT_COLUMNS
+from serialization import covid_stat_rows
+
+
+def seed(count):
+    start = date(2020, 1, 1)
+    rows = [
+        {"country": f"C{i % 200}", "cases": i * 7, "deaths": i, "recovered": i * 5, "active": i,
+         "snapshot_date": start + timedelta(days=i // 200), "recorded_at": datetime(2024, 1, 1, 12, 0, i % 60)}
+        for i in range(count)
+    ]
+    db.session.execute(db.insert(CovidStat), rows)
+    db.session.commit()
+
+
+def orm_stdlib(app, count):
+    stats = db.session.scalars(db.select(CovidStat).limit(count)).all()
+    body = DefaultJSONProvider(app).response([s.to_dict() for s in stats]).get_data()
+    db.session.expunge_all()
+    return body
+
+
+def columns_stdlib(app, count):
+    rows = db.session.execute(db.select(*COVID_STAT_COLUMNS).limit(count)).all()
+    return DefaultJSONProvider(app).response(covid_stat_rows(rows)).get_data()
+
+
+def columns_fast(app, count):
+    rows = db.session.execute(db.select(*COVID_STAT_COLUMNS).limit(count)).all()
+    return app.json.response(covid_stat_rows(rows)).get_data()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(f"orjson {'installed' if serialization.orjson else 'not installed'}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+            "LOG_FILE": os.path.join(tmpdir, "bench.log"),
+        })
+        with app.app_context():
+            db.create_all(bind_key=None)
+            seed(max(args.rows))
+            for count in args.rows:
+                for name, fn in (("orm + to_dict + json", orm_stdlib),
+                                 ("columns + json", columns_stdlib),
+                                 ("columns + orjson", columns_fast)):
+                    best = min(_timed(fn, app, count) for _ in range(args.repeat))
+                    print(f"{count:>7} rows  {name:<22} {count / best:>10,.0f} rows/s  ({best * 1000:7.1f} ms)")
+            db.engine.dispose()
+
+
+def _timed(fn, app, count):
+    start = time.perf_counter()
+    fn(app, count)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
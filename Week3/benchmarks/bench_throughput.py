@@ -0,0 +1,105 @@
+# Requests/sec on the read endpoints, dev server vs gunicorn.
+#
+# Create and seed a database, start the server one way, run this script, then
+# repeat with the other server on the same database:
+#
+#   flask --app wsgi init-db
+#   RATELIMIT_ENABLED=false python app.py
+#   python benchmarks/bench_throughput.py --url http://127.0.0.1:5001
+#
+#   RATELIMIT_ENABLED=false gunicorn -c gunicorn.conf.py -b 127.0.0.1:5001 wsgi:app
+#   python benchmarks/bench_throughput.py --url http://127.0.0.1:5001
+#
+# --seed registers a throwaway user and inserts 200 countries x 30 days through
+# /covid/batch first. Each endpoint is hit by --clients keep-alive
+# sessions for --seconds; cacheable endpoints are also measured with the cache
+# bypassed via a unique query parameter so both the DB and the cache path show.
+import argparse
+import itertools
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+
+ENDPOINTS = [
+    ("list", "/covid?limit=100"),
+    ("list sorted", "/covid?limit=100&sort=-cases"),
+    ("detail", "/covid/1"),
+    ("aggregate", "/covid/aggregate?group_by=country"),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def client(url, path, bust, stop, latencies, errors):
+    session = requests.Session()
+    counter = itertools.count()
+    while not stop.is_set():
+        target = f"{url}{path}"
+        if bust:
+            target += f"{'&' if '?' in path else '?'}_={threading.get_ident()}-{next(counter)}"
+        start = time.perf_counter()
+        res = session.get(target)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if res.status_code != 200:
+            errors.append(res.status_code)
+
+
+def measure(url, path, bust, clients, seconds):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, path, bust, stop, latencies, errors)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def seed(url, countries=200, days=30):
+    creds = {"username": f"bench-{uuid.uuid4().hex[:8]}", "password": "bench-password"}
+    requests.post(f"{url}/auth/register", json=creds).raise_for_status()
+    token = requests.post(f"{url}/auth/login", json=creds).json()["access_token"]
+    items = [
+        {
+            "country": f"Country-{c:03d}",
+            "cases": 1000 + c * d,
+            "deaths": c + d,
+            "recovered": 500 + d,
+            "active": 500 + c * d - c - 2 * d,
+        }
+        for d in range(days)
+        for c in range(countries)
+    ]
+    res = requests.post(f"{url}/covid/batch", json=items, headers={"Authorization": f"Bearer {token}"})
+    res.raise_for_status()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seed", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.url)
+
+    for label, path in ENDPOINTS:
+        for bust in (False, True):
+            latencies, errors = measure(args.url, path, bust, args.clients, args.seconds)
+            name = f"{label}{' (uncached)' if bust else ''}"
+            print(f"{name:<24} req/s={len(latencies) / args.seconds:8.1f}  p50={statistics.median(latencies):7.1f}ms  "
+                  f"p99={percentile(latencies, 99):7.1f}ms  errors={len(errors)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# CRUD latency during a login storm.
+#
+# Start the API with rate limiting off, once hashing inline (before) and once on
+# the process pool (after), then point this script at it:
+#
+#   RATELIMIT_ENABLED=false PASSWORD_HASH_WORKERS=0 python app.py
+#   python benchmarks/load_login_storm.py --url http://127.0.0.1:5001
+#
+#   RATELIMIT_ENABLED=false PASSWORD_HASH_WORKERS=4 python app.py
+#   python benchmarks/load_login_storm.py --url http://127.0.0.1:5001
+#
+# Each run measures GET /covid latency first on a quiet server and then while
+# --login-threads clients hammer /auth/login.
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def crud_client(url, stop, latencies):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        session.get(f"{url}/covid?limit=50")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def login_client(url, stop, username, counts):
+    session = requests.Session()
+    while not stop.is_set():
+        res = session.post(f"{url}/auth/login", json={"username": username, "password": "storm-password"})
+        counts[res.status_code] = counts.get(res.status_code, 0) + 1
+
+
+def phase(url, seconds, crud_threads, login_threads, username):
+    stop = threading.Event()
+    latencies, counts = [], {}
+    threads = [threading.Thread(target=crud_client, args=(url, stop, latencies)) for _ in range(crud_threads)]
+    threads += [threading.Thread(target=login_client, args=(url, stop, username, counts)) for _ in range(login_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, counts
+
+
+def report(label, latencies, counts):
+    print(f"{label:<12} requests={len(latencies):>6}  p50={statistics.median(latencies):7.1f}ms  "
+          f"p99={percentile(latencies, 99):7.1f}ms  logins={counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--crud-threads", type=int, default=4)
+    parser.add_argument("--login-threads", type=int, default=16)
+    args = parser.parse_args()
+
+    username = f"storm-{uuid.uuid4().hex[:8]}"
+    requests.post(f"{args.url}/auth/register", json={"username": username, "password": "storm-password"}).raise_for_status()
+
+    report("quiet", *phase(args.url, args.seconds, args.crud_threads, 0, username))
+    report("login storm", *phase(args.url, args.seconds, args.crud_threads, args.login_threads, username))
+
+
+if __name__ == "__main__":
+    main()
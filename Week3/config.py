@@ -1,6 +1,113 @@
 import os
 
+from db_pool import normalize_database_url
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = "sqlite:///week3.db"
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.environ.get("DATABASE_URL", "sqlite:///week3.db"))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica: read-only endpoints query it (see routing.py)
+    DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+    SQLALCHEMY_BINDS = {"replica": normalize_database_url(DATABASE_REPLICA_URL)} if DATABASE_REPLICA_URL else {}
+    # Optional CovidStat shards, one database URL each, comma separated (see
+    # sharding.py). Rows go to a shard by a hash of their country, so the
+    # list must keep its order and length once data is written.
+    COVID_SHARD_URLS = [
+        normalize_database_url(url.strip()) for url in os.environ.get("COVID_SHARD_URLS", "").split(",") if url.strip()
+    ]
+    # Threads per process running queries on several shards at once, and
+    # CovidStat ids each process reserves from the primary at a time
+    SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", 8))
+    SHARD_ID_BLOCK = int(os.environ.get("SHARD_ID_BLOCK", 100))
+    # A client's own reads stay on the primary this long after it writes, and
+    # everyone's do for DB_REPLICA_LAG seconds after any write
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+    DB_REPLICA_LAG = float(os.environ.get("DB_REPLICA_LAG", 1))
+
+    # Connection pool per worker process (see db_pool.py). Every replica x worker
+    # opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep the total
+    # under the server's max_connections. SQLALCHEMY_ENGINE_OPTIONS overrides these.
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() != "false"
+
+    # Applied to every new SQLite connection
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", 5))
+
+    # /readyz answers from a primary ping at most this many seconds old
+    HEALTH_DB_PING_TTL = float(os.environ.get("HEALTH_DB_PING_TTL", 5))
+    # Warm-up before /readyz reports ready (see health.py): connections opened
+    # per pool, comma-separated GET paths requested in-process, retry delay
+    WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", 2))
+    WARMUP_PATHS = os.environ.get("WARMUP_PATHS", "/covid")
+    WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", 5))
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret")
+    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "dev-jwt-secret")
+    JWT_IDENTITY_CLAIM = "user_id"
+
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() != "false"
+    # Counters must be shared by every worker: the SQLite file covers one host,
+    # redis://... covers several (see ratelimit.py). Limits are per route and keyed
+    # by JWT identity when a valid token is sent, else by client address.
+    RATELIMIT_STORAGE_URI = os.environ.get(
+        "RATELIMIT_STORAGE_URI", "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "ratelimit.db")
+    )
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
+    RATELIMIT_DEFAULT = os.environ.get("RATELIMIT_DEFAULT", "200/day;50/hour")
+    RATELIMIT_LOGIN = os.environ.get("RATELIMIT_LOGIN", "10/minute")
+    RATELIMIT_REGISTER = os.environ.get("RATELIMIT_REGISTER", "5/minute")
+    RATELIMIT_WRITE = os.environ.get("RATELIMIT_WRITE", "60/minute")
+    RATELIMIT_HEADERS_ENABLED = os.environ.get("RATELIMIT_HEADERS_ENABLED", "true").lower() != "false"
+
+    # SimpleCache is per process, so gunicorn refuses to start more than one
+    # worker with it; docker-compose uses RedisCache
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "SimpleCache")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get("CACHE_DEFAULT_TIMEOUT", 300))
+
+    # Logging goes through a bounded queue to one writer thread (see log_pipeline.py)
+    LOG_FILE = os.environ.get("LOG_FILE", "week3.log")
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    LOG_ACCESS_SAMPLE_RATE = float(os.environ.get("LOG_ACCESS_SAMPLE_RATE", 1.0))
+    LOG_4XX_SAMPLE_RATE = float(os.environ.get("LOG_4XX_SAMPLE_RATE", 0.1))
+
+    # Opt-in cProfile of single requests (see profiling.py): admins send
+    # `X-Profile: 1`, PROFILE_SAMPLE_RATE samples everyone. Requests slower than
+    # SLOW_REQUEST_MS keep their SQL in a per-process ring buffer (0 disables it).
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+    PROFILE_DIR = os.environ.get(
+        "PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "profiles")
+    )
+    PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+    SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+    SLOW_REQUEST_BUFFER = int(os.environ.get("SLOW_REQUEST_BUFFER", 100))
+
+    # Upstream used by /covid/fetch
+    COVID_UPSTREAM_URL = os.environ.get("COVID_UPSTREAM_URL", "https://disease.sh/v3/covid-19/countries")
+    COVID_FETCH_WORKERS = int(os.environ.get("COVID_FETCH_WORKERS", 8))
+    COVID_FETCH_TIMEOUT = float(os.environ.get("COVID_FETCH_TIMEOUT", 10))
+    COVID_FETCH_MAX_COUNTRIES = 250
+
+    # Password hashing policy and the process pool it runs on (see passwords.py).
+    # Changing the method or cost rehashes stored passwords on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(os.cpu_count() or 1, 4)))
+    PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", 2))
+    PASSWORD_HASH_START_METHOD = os.environ.get("PASSWORD_HASH_START_METHOD", "forkserver")
+
+    # Verified-token cache in front of JWT signature checks (0 disables it)
+    JWT_VERIFY_CACHE_SIZE = int(os.environ.get("JWT_VERIFY_CACHE_SIZE", 10000))
+    JWT_VERIFY_CACHE_TTL = int(os.environ.get("JWT_VERIFY_CACHE_TTL", 300))
+
+    COVID_BATCH_MAX_ITEMS = int(os.environ.get("COVID_BATCH_MAX_ITEMS", 10000))
+    # Rows fetched and encoded per chunk by /covid/export
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+    # Seconds before a worker's analytics series is reloaded in full even if
+    # no write was seen through the cache
+    ANALYTICS_MAX_AGE = float(os.environ.get("ANALYTICS_MAX_AGE", 60))
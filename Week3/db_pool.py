@@ -0,0 +1,136 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+
+
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+# QueuePool that records how long each checkout waited for a connection. Waits
+# show up once every pooled connection is busy: size the pool (and overflow) so
+# that checkouts stay in the lowest buckets with every replica and worker running.
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = [0] * len(WAIT_BUCKETS_MS)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except sa_exc.TimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            self._record_wait((time.perf_counter() - start) * 1000)
+
+    def _record_wait(self, waited_ms):
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_total += waited_ms
+            self._wait_max = max(self._wait_max, waited_ms)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if waited_ms <= bound:
+                    self._wait_buckets[i] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_ms_total": round(self._wait_total, 3),
+                "wait_ms_max": round(self._wait_max, 3),
+                "wait_ms_avg": round(self._wait_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "wait_ms_buckets": {f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS_MS, self._wait_buckets)},
+            }
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_sqlite_memory(url):
+    return _is_sqlite(url) and url.database in (None, "", ":memory:")
+
+
+# Heroku-style and some managed Postgres providers still hand out postgres://,
+# which SQLAlchemy no longer accepts
+def normalize_database_url(url):
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+# Engine options built from the DB_POOL_* settings. In-memory SQLite keeps
+# Flask-SQLAlchemy's StaticPool; everything else gets a TimedQueuePool.
+def engine_options(config):
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if _is_sqlite_memory(url):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+# SQLite profile: WAL lets readers run alongside the single writer,
+# synchronous=NORMAL is durable across app crashes (only an OS crash can lose the
+# last commits), and busy_timeout makes writers queue instead of failing with
+# "database is locked"
+def _install_sqlite_pragmas(engine, config):
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'] * 1000)}",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+# Called from create_app once the engines exist
+def configure_engines(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            if _is_sqlite(engine.url) and not _is_sqlite_memory(engine.url):
+                _install_sqlite_pragmas(engine, app.config)
+
+
+# Drop connections inherited from the parent process without closing them, so a
+# forked worker never shares a socket with its parent (gunicorn post_fork hook)
+def reset_pools_after_fork(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+# Per-bind pool stats for the current app ("default" is the primary engine)
+def pool_stats():
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        stats[key or "default"] = pool.stats() if isinstance(pool, TimedQueuePool) else {"status": pool.status()}
+    return stats
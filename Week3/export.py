@@ -0,0 +1,101 @@
+import csv
+import heapq
+import io
+import zlib
+from itertools import islice
+
+from flask import current_app, stream_with_context
+
+from extensions import db
+from models import CovidStat
+from queries import COVID_STAT_COLUMNS, QueryError, apply_filters, filter_shards, parse_filter_args, parse_int
+from serialization import COVID_STAT_FIELDS, covid_stat_row, json_bytes
+from sharding import read_shards, sharding_enabled
+
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+# Same filters as GET /covid plus format=csv|ndjson and an after_id to resume
+# from. Rows always come in id order, so the last id received is the cursor.
+def parse_export_args(args):
+    params = parse_filter_args(args)
+    params["after_id"] = parse_int(args, "after_id", minimum=1)
+    params["format"] = args.get("format") or "ndjson"
+    if params["format"] not in FORMATS:
+        raise QueryError(f"format must be one of {', '.join(FORMATS)}")
+    return params
+
+
+# Rows come from the database in batches of EXPORT_BATCH_SIZE (yield_per, a
+# server-side cursor on PostgreSQL), and each batch is encoded into one chunk.
+# Nothing holds more than one batch at a time.
+def _batches(params):
+    if sharding_enabled():
+        yield from _sharded_batches(params)
+        return
+    stmt = apply_filters(db.select(*COVID_STAT_COLUMNS), params)
+    if params["after_id"] is not None:
+        stmt = stmt.where(CovidStat.id > params["after_id"])
+    stmt = stmt.order_by(CovidStat.id).execution_options(yield_per=current_app.config["EXPORT_BATCH_SIZE"])
+    yield from db.session.execute(stmt).partitions()
+
+
+# One shard's rows in id order, read a batch at a time by keyset on id
+def _shard_rows(index, stmt, after_id, size):
+    while True:
+        page = stmt if after_id is None else stmt.where(CovidStat.id > after_id)
+        rows = read_shards(page.limit(size), [index])[0]
+        yield from rows
+        if len(rows) < size:
+            return
+        after_id = rows[-1].id
+
+
+# With sharding, each shard's rows in id order merged into one id-ordered stream
+def _sharded_batches(params):
+    size = current_app.config["EXPORT_BATCH_SIZE"]
+    stmt = apply_filters(db.select(*COVID_STAT_COLUMNS), params).order_by(CovidStat.id)
+    streams = [_shard_rows(index, stmt, params["after_id"], size) for index in filter_shards(params)]
+    merged = heapq.merge(*streams, key=lambda row: row.id)
+    while batch := list(islice(merged, size)):
+        yield batch
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COVID_STAT_FIELDS)
+    for batch in batches:
+        writer.writerows(covid_stat_row(row).values() for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield b"".join(json_bytes(covid_stat_row(row)) + b"\n" for row in batch)
+
+
+# Each chunk is sync-flushed so the client can decompress what it has so far
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+# Builds the streamed response. The generator keeps the request context, and
+# with it the session and the replica choice, until the last chunk is sent.
+def export_response(params, gzip):
+    chunks = (_csv_chunks if params["format"] == "csv" else _ndjson_chunks)(_batches(params))
+    headers = {"Content-Disposition": f"attachment; filename=covid_stat.{params['format']}", "Vary": "Accept-Encoding"}
+    if gzip:
+        chunks = _gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return current_app.response_class(
+        stream_with_context(chunks), content_type=FORMATS[params["format"]], headers=headers
+    )
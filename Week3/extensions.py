@@ -1,3 +1,28 @@
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from flask_caching import Cache
+from sqlalchemy import Select
 
-db = SQLAlchemy()
+REPLICA_BIND = "replica"
+
+
+# Sends plain SELECTs to the "replica" bind while a request is marked for it
+# (see routing.read_replica). Flushes, INSERT/UPDATE/DELETE and every request
+# not so marked use the primary, as does everything when no replica is configured.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and has_request_context()
+            and g.get("db_route") == REPLICA_BIND
+            and REPLICA_BIND in self._db.engines
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+cache = Cache()
@@ -1,10 +1,13 @@
 import requests
-from app import app, db
-from models import CovidStat
+from app import create_app
+from extensions import db
+from ingest import summary_entry_to_row
+from snapshots import record_snapshots
+from response_cache import bump_generation
 
 API_URL = "https://api.covid19api.com/summary"
 
-def fetch_and_store_covid_data():
+def fetch_and_store_covid_data(app=None):
     try:
         response = requests.get(API_URL)
         response.raise_for_status()
@@ -14,29 +17,21 @@ def fetch_and_store_covid_data():
         if "Countries" not in data:
             raise ValueError("Invalid API response: 'Countries' key missing")
 
-        countries = data["Countries"]
-
-        with app.app_context():
-            for entry in countries:
-                country = entry.get("Country")
-                confirmed = entry.get("TotalConfirmed")
-                deaths = entry.get("TotalDeaths")
-                recovered = entry.get("TotalRecovered")
-
-                if not country or confirmed is None or deaths is None:
-                    print(f"Skipping invalid entry: {entry}")
-                    continue
-
-                stat = CovidStat(
-                    country=country,
-                    confirmed=confirmed,
-                    deaths=deaths,
-                    recovered=recovered
-                )
-                db.session.add(stat)
+        rows = []
+        for entry in data["Countries"]:
+            row = summary_entry_to_row(entry)
+            if row is None:
+                print(f"Skipping invalid entry: {entry}")
+                continue
+            rows.append(row)
 
+        with (app or create_app()).app_context():
+            stored, skipped = record_snapshots(rows)
             db.session.commit()
-            print("COVID data successfully stored in database.")
+            if stored:
+                bump_generation()
+            print(f"COVID data successfully stored in database ({len(stored)} rows, {len(skipped)} unchanged).")
+        return len(stored)
 
     except Exception as e:
         print(f"Error fetching/storing COVID data: {e}")
@@ -44,4 +39,3 @@ def fetch_and_store_covid_data():
 
 if __name__ == "__main__":  # pragma: no cover
     fetch_and_store_covid_data()
-
@@ -0,0 +1,58 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Everything can be tuned from the environment:
+#   GUNICORN_WORKERS       worker processes (default 2 * CPUs + 1, or 1 with a
+#                          per-process CACHE_TYPE such as the default SimpleCache)
+#   GUNICORN_THREADS       threads per worker for the gthread class (default 4)
+#   GUNICORN_WORKER_CLASS  gthread (default) or gevent (pip install gevent)
+#   GUNICORN_PRELOAD       load the app once in the master before forking (default true)
+#
+# Graceful reload: `kill -HUP <master pid>` starts new workers and lets the old
+# ones finish in-flight requests within graceful_timeout. With preload on, the
+# application code itself is only re-imported on a full restart.
+import multiprocessing
+import os
+
+from config import Config
+from response_cache import PROCESS_LOCAL_CACHES
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+# A per-process cache can't share the response-cache generation (see
+# on_starting), so without a shared cache the image starts a single worker
+default_workers = 1 if Config.CACHE_TYPE in PROCESS_LOCAL_CACHES else multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("GUNICORN_WORKERS", default_workers))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() != "false"
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+# The response-cache generation has to be shared by all workers
+def on_starting(server):
+    from response_cache import require_shared_cache
+
+    require_shared_cache(Config.CACHE_TYPE, server.cfg.workers)
+
+
+# With preload_app the app (and its engines) are created in the master, so each
+# worker starts from a fresh connection pool instead of inheriting the master's.
+# The worker then warms up in the background; /readyz fails until that is done.
+def post_fork(server, worker):
+    from db_pool import reset_pools_after_fork
+    from health import ensure_warm_up
+    from wsgi import app
+
+    reset_pools_after_fork(app)
+    ensure_warm_up(app)
@@ -0,0 +1,105 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+
+from extensions import db
+from models import CovidStat
+from sharding import allocate_ids, covid_dialect, on_shards, shard_index, sharding_enabled
+
+
+CHUNK_SIZE = 500
+UPSERT_KEY = ("country", "snapshot_date")
+UPDATE_FIELDS = ("cases", "deaths", "recovered", "active")
+OPTIONAL_FIELDS = ("recorded_at", "content_hash")
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def parse_snapshot_date(value):
+    if not value:
+        return datetime.now(timezone.utc).date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+
+
+# Map one entry of the covid19api "summary" payload onto CovidStat columns.
+# Returns None for entries that can't be stored.
+def summary_entry_to_row(entry):
+    country = entry.get("Country")
+    cases = entry.get("TotalConfirmed")
+    deaths = entry.get("TotalDeaths")
+    if not country or cases is None or deaths is None:
+        return None
+    recovered = entry.get("TotalRecovered") or 0
+    return {
+        "country": country,
+        "snapshot_date": parse_snapshot_date(entry.get("Date")),
+        "cases": cases,
+        "deaths": deaths,
+        "recovered": recovered,
+        "active": max(cases - deaths - recovered, 0),
+    }
+
+
+# Dialect-specific insert() (the ones with on_conflict_do_update) for a model's
+# bind, or for the named dialect
+def dialect_insert(model, name=None):
+    return UPSERT_DIALECTS[name or db.session.get_bind(mapper=model).dialect.name]
+
+
+# Snapshots, rollups and ingest all write with ON CONFLICT DO UPDATE, so every
+# database in the config must support it. Checked when the app is created
+# rather than on the first write.
+def require_upsert_support(config):
+    binds = config["SQLALCHEMY_BINDS"].values()
+    urls = [config["SQLALCHEMY_DATABASE_URI"], *(b["url"] if isinstance(b, dict) else b for b in binds)]
+    for url in urls:
+        name = make_url(url).get_backend_name()
+        if name not in UPSERT_DIALECTS:
+            raise RuntimeError(
+                f"database URL {make_url(url).render_as_string()} uses {name}; only PostgreSQL and SQLite are supported"
+            )
+
+
+# Insert or update CovidStat rows keyed on (country, snapshot_date) with
+# INSERT ... ON CONFLICT DO UPDATE, chunk_size rows at a time. The caller
+# commits, except on shards (see _upsert_sharded).
+def upsert_covid_stats(rows, chunk_size=CHUNK_SIZE):
+    # A key may only appear once per statement, so the last row for a key wins
+    deduped = {}
+    for row in rows:
+        deduped[(row["country"], row["snapshot_date"])] = row
+    rows = list(deduped.values())
+    if not rows:
+        return 0
+
+    table = CovidStat.__table__
+    stmt = dialect_insert(CovidStat, covid_dialect())(table)
+    update_fields = UPDATE_FIELDS + tuple(name for name in OPTIONAL_FIELDS if name in rows[0])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in UPSERT_KEY],
+        set_={name: stmt.excluded[name] for name in update_fields},
+    )
+    if sharding_enabled():
+        return _upsert_sharded(stmt, rows, chunk_size)
+    # One cached statement run as executemany per chunk: psycopg2 sends each chunk
+    # as a multi-row VALUES batch, sqlite3 loops over the parameters in C
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(stmt, rows[start:start + chunk_size])
+    return len(rows)
+
+
+# Every row gets a new id up front; a row that updates an existing one keeps
+# the old id and its new one is simply never used. Each shard commits its rows.
+def _upsert_sharded(stmt, rows, chunk_size):
+    by_shard = {}
+    for row, new_id in zip(rows, allocate_ids(len(rows))):
+        by_shard.setdefault(shard_index(row["country"]), []).append({**row, "id": new_id})
+
+    def upsert(connection, rows):
+        for start in range(0, len(rows), chunk_size):
+            connection.execute(stmt, rows[start:start + chunk_size])
+
+    on_shards({index: lambda connection, rows=rows: upsert(connection, rows) for index, rows in by_shard.items()}, write=True)
+    return len(rows)
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app, g
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config as jwt_config
+
+from extensions import db
+from models import RevokedToken
+
+
+# Bounded LRU of verified token payloads keyed by a digest of the encoded token
+# and of the key it was verified with. Entries never outlive the token's exp.
+class VerifiedTokenCache:
+    def __init__(self, maxsize, max_ttl):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, payload, now):
+        expires_at = now + self.max_ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, payload["exp"])
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def _digest(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return hashlib.sha256(value).digest()
+
+
+# JWTManager that skips signature verification for tokens it has already
+# verified. Everything after decoding (token type, freshness, the blocklist
+# check, user loading) still runs on every request, so revoked tokens are
+# rejected even on a cache hit. Rotating JWT_SECRET_KEY changes the cache key,
+# so tokens signed with the old secret are verified (and rejected) again.
+class CachingJWTManager(JWTManager):
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor=add_context_processor)
+        app.extensions["jwt_verified_tokens"] = VerifiedTokenCache(
+            app.config["JWT_VERIFY_CACHE_SIZE"], app.config["JWT_VERIFY_CACHE_TTL"]
+        )
+        self.token_in_blocklist_loader(is_token_revoked)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        verified_tokens = current_app.extensions["jwt_verified_tokens"]
+        if csrf_value is not None or allow_expired or not verified_tokens.maxsize:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = _digest(encoded_token) + _digest(jwt_config.decode_key)
+        # The rate-limit key function decodes the same token earlier in the request
+        seen = g.setdefault("_verified_jwt", {})
+        if key in seen:
+            return dict(seen[key])
+
+        now = time.time()
+        payload = verified_tokens.get(key, now)
+        if payload is None:
+            payload = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            verified_tokens.put(key, payload, now)
+        seen[key] = payload
+        return dict(payload)
+
+
+# Revoked jtis are rows on the primary database, so every worker sees a logout
+# at once and nothing is evicted before the token expires. Expired rows are
+# removed by later logouts.
+def revoke_token(jwt_payload):
+    now = datetime.utcnow()
+    if "exp" in jwt_payload:
+        expires_at = datetime.utcfromtimestamp(jwt_payload["exp"])
+    else:
+        expires_at = now + timedelta(days=1)
+    db.session.execute(db.delete(RevokedToken).where(RevokedToken.expires_at < now))
+    db.session.merge(RevokedToken(jti=jwt_payload["jti"], expires_at=expires_at))
+    db.session.commit()
+
+
+# Read from the primary even inside a replica-routed view: a lagging replica
+# would accept a token that was just revoked. Looked up once per request, as
+# the rate-limit key function verifies the same token before the view does.
+def is_token_revoked(jwt_header, jwt_payload):
+    jti = jwt_payload["jti"]
+    checked = g.setdefault("_revoked_jti", {})
+    if jti not in checked:
+        stmt = db.select(RevokedToken.jti).where(RevokedToken.jti == jti)
+        checked[jti] = db.session.execute(stmt, bind_arguments={"bind": db.engine}).first() is not None
+    return checked[jti]
@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, has_request_context, request
+from flask.logging import default_handler
+
+
+REQUEST_ID_HEADER = "X-Request-Id"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+_listener_pid = None
+_listener_target = None
+
+
+# One JSON object per line. Request fields and extra= values become keys.
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_FIELDS)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# Runs on the request thread: tags the record with the request it belongs to and
+# samples 4xx noise (records with status 400-499 pass with LOG_4XX_SAMPLE_RATE)
+class RequestContextFilter(logging.Filter):
+    def __init__(self, sample_4xx):
+        super().__init__()
+        self.sample_4xx = sample_4xx
+
+    def filter(self, record):
+        status = getattr(record, "status", None)
+        if status is not None and 400 <= status < 500 and random.random() >= self.sample_4xx:
+            return False
+        if has_request_context() and not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id")
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+# QueueHandler that never blocks: when the writer thread falls behind (slow
+# disk, rotation) and the queue is full, records are dropped and counted.
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render message and traceback here, while args and exc_info are still
+        # valid, but keep the record's other attributes for the JSON formatter
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Installs the queue handler on app.logger once, and (re)starts the writer thread
+# for this process. gunicorn forks workers after preload, and threads don't
+# survive a fork, so ensure_listener() also runs at the start of each request.
+def configure_logging(app):
+    global _handler
+    config = app.config
+    with _lock:
+        if _handler is None:
+            _handler = BoundedQueueHandler(config["LOG_QUEUE_SIZE"])
+            app.logger.addHandler(_handler)
+        # Flask's own handler writes to stderr on the request thread; the
+        # writer thread does that instead (see ensure_listener)
+        app.logger.removeHandler(default_handler)
+        _handler.filters = [RequestContextFilter(config["LOG_4XX_SAMPLE_RATE"])]
+        app.logger.setLevel(config["LOG_LEVEL"])
+    ensure_listener(config["LOG_FILE"])
+
+
+def ensure_listener(path):
+    global _listener, _listener_pid, _listener_target
+    if _listener_pid == os.getpid() and _listener_target == path:
+        return
+    with _lock:
+        if _listener_pid == os.getpid() and _listener_target == path:
+            return
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        file_handler = RotatingFileHandler(path, maxBytes=1000000, backupCount=3)
+        file_handler.setFormatter(JsonFormatter())
+        # Plain lines on stderr, as Flask's default handler wrote them, for
+        # `docker logs` and kubectl
+        stderr_handler = logging.StreamHandler(sys.stderr)
+        stderr_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s"))
+        _listener = QueueListener(_handler.queue, file_handler, stderr_handler)
+        _listener.start()
+        _listener_pid, _listener_target = os.getpid(), path
+
+
+# Drains the queue and stops the writer thread; the next request restarts it
+def shutdown_logging():
+    global _listener, _listener_pid, _listener_target
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = _listener_pid = _listener_target = None
+
+
+atexit.register(shutdown_logging)
+
+
+def logging_stats():
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+# before_request hook: request id (taken from the caller when present) and
+# start time for the access log line
+def start_request():
+    ensure_listener(current_app.config["LOG_FILE"])
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+
+
+# after_request hook: one access log line per request. Successful requests
+# are kept at LOG_ACCESS_SAMPLE_RATE, 4xx go through the filter's 4xx sampling,
+# 5xx are always kept.
+def log_request(response):
+    if "request_id" not in g:
+        return response
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    status = response.status_code
+    if status < 400 and random.random() >= current_app.config["LOG_ACCESS_SAMPLE_RATE"]:
+        return response
+    latency_ms = round((time.perf_counter() - g.request_start) * 1000, 3)
+    level = logging.ERROR if status >= 500 else logging.INFO
+    current_app.logger.log(level, "%s %s %s", request.method, request.path, status,
+                           extra={"status": status, "latency_ms": latency_ms})
+    return response
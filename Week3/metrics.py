@@ -0,0 +1,222 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app, g, request
+
+from db_pool import pool_stats
+from log_pipeline import logging_stats
+from querycount import add_statement_hook
+from response_cache import cache_stats
+
+
+# Every metric is split into SHARDS dicts, each with its own lock. A thread (or
+# gevent greenlet) is given one of them round-robin the first time it records
+# anything, so concurrent requests rarely share a lock, and the number of
+# shards stays fixed however many threads or greenlets come and go. A scrape
+# copies each shard under its lock and merges the copies. Values are per
+# process: every gunicorn worker reports its own.
+SHARDS = 16
+
+_slot = threading.local()
+_next_slot = itertools.count()
+
+
+def _slot_index():
+    try:
+        return _slot.index
+    except AttributeError:
+        _slot.index = next(_next_slot) % SHARDS
+        return _slot.index
+
+
+class _Sharded:
+    def __init__(self, name, help_text, label_names, register=True):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._shards = [({}, threading.Lock()) for _ in range(SHARDS)]
+        if register:
+            _registry.append(self)
+
+    def _shard(self):
+        return self._shards[_slot_index()]
+
+    def _items(self):
+        for values, lock in self._shards:
+            with lock:
+                items = [(labels, list(v) if isinstance(v, list) else v) for labels, v in values.items()]
+            yield from items
+
+    def _labels(self, labels, extra=()):
+        pairs = list(zip(self.label_names, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter(_Sharded):
+    def inc(self, *labels, amount=1):
+        shard, lock = self._shard()
+        with lock:
+            shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self):
+        totals = {}
+        for labels, value in self._items():
+            totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{self._labels(labels)} {_number(value)}")
+        return lines
+
+
+# Buckets are fixed up front; observe() is a bisect and three increments
+class Histogram(_Sharded):
+    def __init__(self, name, help_text, label_names, buckets, register=True):
+        super().__init__(name, help_text, label_names, register)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        bucket = bisect_left(self.buckets, value)
+        shard, lock = self._shard()
+        with lock:
+            series = shard.get(labels)
+            if series is None:
+                series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def values(self):
+        totals = {}
+        for labels, series in self._items():
+            merged = totals.setdefault(labels, [0] * len(series[:-1]) + [0.0])
+            for i, value in enumerate(series):
+                merged[i] += value
+        return totals
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+_registry = []
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REQUESTS = Counter("http_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency.", ("endpoint", "method"), LATENCY_BUCKETS
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed.", ("endpoint",))
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements per request.", ("endpoint",), QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per request.", ("endpoint",), LATENCY_BUCKETS
+)
+RATE_LIMITED = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter.", ("endpoint", "limit"))
+UPSTREAM_LATENCY = Histogram(
+    "upstream_fetch_duration_seconds", "Upstream COVID API call latency.", ("outcome",), LATENCY_BUCKETS
+)
+
+
+def _endpoint():
+    # Unmatched URLs share one label so 404 scans can't blow up cardinality
+    return request.endpoint or "unmatched"
+
+
+# before_request hook
+def start_request():
+    g.metrics_start = time.perf_counter()
+
+
+# after_request hook
+def record_request(response):
+    start = g.get("metrics_start")
+    if start is None:
+        return response
+    endpoint = _endpoint()
+    REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint, request.method)
+    DB_QUERIES_PER_REQUEST.observe(g.get("db_queries", 0), endpoint)
+    DB_TIME_PER_REQUEST.observe(g.get("db_time", 0.0), endpoint)
+    return response
+
+
+# Flask-Limiter on_breach callback; returning None keeps the default 429
+def record_rate_limited(request_limit):
+    RATE_LIMITED.inc(_endpoint(), str(request_limit.limit))
+
+
+# Per-request query count and DB time come from querycount.py
+def _count_statement(statement, seconds, in_request):
+    DB_QUERIES.inc(_endpoint() if in_request else "background")
+
+
+add_statement_hook(_count_statement)
+
+
+def observe_upstream(seconds, outcome):
+    UPSTREAM_LATENCY.observe(seconds, outcome)
+
+
+# Stats the cache, JWT, pool and logging modules already keep, in render() form
+def collected_stats():
+    responses = cache_stats()
+    tokens = current_app.extensions["jwt_verified_tokens"].stats()
+    pools = pool_stats()
+    logs = logging_stats()
+    return [
+        ("response_cache_requests_total", "counter", "Cached-endpoint lookups by result.", ("result",),
+         {("hit",): responses["hits"], ("miss",): responses["misses"], ("not_modified",): responses["not_modified"]}),
+        ("jwt_verify_cache_requests_total", "counter", "Verified-token cache lookups by result.", ("result",),
+         {("hit",): tokens["hits"], ("miss",): tokens["misses"]}),
+        ("jwt_verify_cache_entries", "gauge", "Tokens in the verified-token cache.", (), {(): tokens["size"]}),
+        ("db_pool_checked_out", "gauge", "Connections in use.", ("bind",),
+         {(bind,): s["checked_out"] for bind, s in pools.items() if "checked_out" in s}),
+        ("db_pool_checkouts_total", "counter", "Connection checkouts.", ("bind",),
+         {(bind,): s["checkouts"] for bind, s in pools.items() if "checkouts" in s}),
+        ("db_pool_checkout_timeouts_total", "counter", "Checkouts that timed out.", ("bind",),
+         {(bind,): s["timeouts"] for bind, s in pools.items() if "timeouts" in s}),
+        ("db_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for a connection.", ("bind",),
+         {(bind,): s["wait_ms_total"] / 1000 for bind, s in pools.items() if "wait_ms_total" in s}),
+        ("log_queue_depth", "gauge", "Log records waiting for the writer thread.", (), {(): logs["queued"]}),
+        ("log_records_dropped_total", "counter", "Log records dropped on a full queue.", (), {(): logs["dropped"]}),
+    ]
+
+
+# Gauges and counters owned by other modules are read at scrape time and passed
+# in `extra` as (name, type, help, label names, {labels tuple: value}) tuples.
+def render(extra=()):
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, kind, help_text, label_names, values in extra:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(values.items()):
+            pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels))
+            lines.append(f"{name}{'{' + pairs + '}' if pairs else ''} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import CovidStat
+
+
+UNIQUE_SNAPSHOT = "uq_covid_stat_country_snapshot_date"
+
+
+# create_all() skips tables that already exist, so a covid_stat table from
+# before snapshots were dated still lacks snapshot_date, recorded_at and
+# content_hash and their indexes. This adds what is missing and is safe to run
+# again. When snapshot_date is new, each country's newest row is dated today
+# (the old /covid/fetch kept one undated row per fetch) and older rows stay
+# undated, like rows added through POST /covid; NULL dates never collide in
+# the unique index, which is created afterwards.
+def upgrade_covid_stat(engine):
+    table = CovidStat.__table__
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        if not inspector.has_table(table.name):
+            return
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        added = [column for column in table.columns if column.name not in existing]
+        for column in added:
+            column_type = column.type.compile(connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+        names = {column.name for column in added}
+        if "snapshot_date" in names:
+            connection.execute(
+                text(f"UPDATE {table.name} SET snapshot_date = :today "
+                     f"WHERE id IN (SELECT MAX(id) FROM {table.name} GROUP BY country)"),
+                {"today": datetime.utcnow().date()},
+            )
+        if "recorded_at" in names:
+            connection.execute(
+                text(f"UPDATE {table.name} SET recorded_at = :now WHERE recorded_at IS NULL"),
+                {"now": datetime.utcnow()},
+            )
+
+        unique = {tuple(c["column_names"]) for c in inspector.get_unique_constraints(table.name)}
+        unique |= {tuple(i["column_names"]) for i in inspector.get_indexes(table.name) if i["unique"]}
+        if ("country", "snapshot_date") not in unique:
+            connection.execute(text(f"CREATE UNIQUE INDEX {UNIQUE_SNAPSHOT} ON {table.name} (country, snapshot_date)"))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
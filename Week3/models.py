@@ -1,5 +1,6 @@
 from extensions import db 
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
+from serialization import COVID_STAT_FIELDS, covid_stat_row
 from datetime import datetime
 
 class User(db.Model):
@@ -11,25 +12,119 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class CovidStat(db.Model):
+    # Composite (column, id) indexes back keyset pagination and filters on GET /covid
+    __table_args__ = (
+        db.Index("ix_covid_stat_country_id", "country", "id"),
+        db.Index("ix_covid_stat_cases_id", "cases", "id"),
+        db.Index("ix_covid_stat_deaths_id", "deaths", "id"),
+        db.Index("ix_covid_stat_recovered_id", "recovered", "id"),
+        db.Index("ix_covid_stat_active_id", "active", "id"),
+        db.UniqueConstraint("country", "snapshot_date", name="uq_covid_stat_country_snapshot_date"),
+        # Covering indexes for /covid/aggregate (group by country or time bucket).
+        # date_agg also orders /covid/top?date=&by=cases; for the other metrics
+        # SQLite otherwise sorts the whole day (EXPLAIN QUERY PLAN: "USE TEMP
+        # B-TREE FOR ORDER BY" instead of "... RIGHT PART OF ORDER BY"), about
+        # twice as slow with 200 countries
+        db.Index("ix_covid_stat_country_agg", "country", "snapshot_date", "cases", "deaths", "recovered", "active"),
+        db.Index("ix_covid_stat_date_agg", "snapshot_date", "cases", "deaths", "recovered", "active"),
+        db.Index("ix_covid_stat_date_deaths", "snapshot_date", "deaths"),
+        db.Index("ix_covid_stat_date_recovered", "snapshot_date", "recovered"),
+        db.Index("ix_covid_stat_date_active", "snapshot_date", "active"),
+        db.Index("ix_covid_stat_recorded_at", "recorded_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     country = db.Column(db.String(50), nullable=False)
     cases = db.Column(db.Integer, nullable=False)
     deaths = db.Column(db.Integer, nullable=False)
     recovered = db.Column(db.Integer, nullable=False)
     active = db.Column(db.Integer, nullable=False)
+    snapshot_date = db.Column(db.Date)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content_hash = db.Column(db.String(64))
+
+    def to_dict(self):
+        return covid_stat_row([getattr(self, field) for field in COVID_STAT_FIELDS])
+
+
+# Logged-out tokens, kept until they expire (see jwt_cache.revoke_token)
+class RevokedToken(db.Model):
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# Next unreserved CovidStat id when CovidStat is sharded. Lives on the primary;
+# workers reserve blocks of ids from it (see sharding.allocate_ids).
+class IdBlock(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+
+# Rollups are maintained incrementally by snapshots.record_snapshots: each stored
+# snapshot overwrites the bucket's closing values and adds its delta against the
+# country's previous snapshot to the new_* counters.
+class CovidDailyRollup(db.Model):
+    country = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    cases = db.Column(db.Integer, nullable=False)
+    deaths = db.Column(db.Integer, nullable=False)
+    recovered = db.Column(db.Integer, nullable=False)
+    active = db.Column(db.Integer, nullable=False)
+    new_cases = db.Column(db.Integer, nullable=False, default=0)
+    new_deaths = db.Column(db.Integer, nullable=False, default=0)
+    new_recovered = db.Column(db.Integer, nullable=False, default=0)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    content_hash = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index("ix_covid_daily_rollup_day", "day"),)
+
+    def to_dict(self):
+        return {
+            "country": self.country,
+            "day": self.day.isoformat(),
+            "cases": self.cases,
+            "deaths": self.deaths,
+            "recovered": self.recovered,
+            "active": self.active,
+            "new_cases": self.new_cases,
+            "new_deaths": self.new_deaths,
+            "new_recovered": self.new_recovered,
+            "samples": self.samples
+        }
+
+
+class CovidWeeklyRollup(db.Model):
+    country = db.Column(db.String(50), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    cases = db.Column(db.Integer, nullable=False)
+    deaths = db.Column(db.Integer, nullable=False)
+    recovered = db.Column(db.Integer, nullable=False)
+    active = db.Column(db.Integer, nullable=False)
+    new_cases = db.Column(db.Integer, nullable=False, default=0)
+    new_deaths = db.Column(db.Integer, nullable=False, default=0)
+    new_recovered = db.Column(db.Integer, nullable=False, default=0)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index("ix_covid_weekly_rollup_week_start", "week_start"),)
 
     def to_dict(self):
         return {
-            "id": self.id,
             "country": self.country,
+            "week_start": self.week_start.isoformat(),
             "cases": self.cases,
             "deaths": self.deaths,
             "recovered": self.recovered,
-            "active": self.active
+            "active": self.active,
+            "new_cases": self.new_cases,
+            "new_deaths": self.new_deaths,
+            "new_recovered": self.new_recovered,
+            "samples": self.samples
         }
@@ -0,0 +1,106 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+# Password hashing runs on a dedicated process pool so a burst of logins can't
+# take the CPU from request threads. At most workers + PASSWORD_HASH_QUEUE jobs
+# may be in flight; beyond that callers wait PASSWORD_HASH_QUEUE_TIMEOUT seconds
+# for a slot and then get HasherBusy. PASSWORD_HASH_WORKERS = 0 hashes inline.
+def _get_pool(config):
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = config["PASSWORD_HASH_WORKERS"]
+            context = multiprocessing.get_context(config["PASSWORD_HASH_START_METHOD"])
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _slots = threading.BoundedSemaphore(workers + config["PASSWORD_HASH_QUEUE"])
+        return _executor, _slots
+
+
+def shutdown_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _slots = None
+
+
+# A pool whose worker died (OOM kill, segfault) fails every later job, so it is
+# replaced. Only the broken pool is dropped: another thread may already have
+# built its successor.
+def _discard(executor):
+    global _executor, _slots
+    with _lock:
+        if _executor is executor:
+            _executor = None
+            _slots = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(config, fn, args):
+    executor, slots = _get_pool(config)
+    if not slots.acquire(timeout=config["PASSWORD_HASH_QUEUE_TIMEOUT"]):
+        raise HasherBusy("password hashing queue is full")
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _discard(executor)
+        raise
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        _discard(executor)
+        raise
+
+
+# Runs on a fresh pool once more if the current one turns out to be broken
+def _run(fn, *args):
+    config = current_app.config
+    if not config["PASSWORD_HASH_WORKERS"]:
+        return fn(*args)
+    try:
+        return _submit(config, fn, args)
+    except BrokenProcessPool:
+        return _submit(config, fn, args)
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+# werkzeug stores the fully expanded method ("scrypt" -> "scrypt:32768:8:1"),
+# so hash a throwaway value once to learn the prefix the current policy produces
+@lru_cache(maxsize=8)
+def _stored_method(method):
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+# True when a stored hash was made under a different method or cost than the
+# configured PASSWORD_HASH_METHOD
+def needs_rehash(password_hash):
+    return password_hash.split("$", 1)[0] != _stored_method(current_app.config["PASSWORD_HASH_METHOD"])
@@ -0,0 +1,153 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+from querycount import request_queries
+
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ARTIFACT_HEADER = "X-Profile-Artifact"
+
+# One profiled request at a time per process: the profiler slows its own
+# request a lot, and Python 3.12+ allows only one active profiler anyway
+_profile_lock = threading.Lock()
+_slow_requests = None
+_slow_lock = threading.Lock()
+
+
+# An admin asks for a profile with `X-Profile: 1`; anyone else's header is
+# ignored. PROFILE_SAMPLE_RATE profiles a random share of all requests.
+def _wants_profile(config):
+    if request.headers.get(PROFILE_HEADER) == "1":
+        try:
+            verify_jwt_in_request(optional=True)
+            if get_jwt().get("role") == "admin":
+                return True
+        except Exception:
+            pass
+    rate = config["PROFILE_SAMPLE_RATE"]
+    return rate > 0 and random.random() < rate
+
+
+# before_request hook. Registered after the logging and metrics hooks so the
+# request id exists, and before the limiter's, so JWT checks and rate limiting
+# show up in the profile.
+def start_request():
+    config = current_app.config
+    if _wants_profile(config) and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _stop_profiler():
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+    profiler.disable()
+    _profile_lock.release()
+    return profiler
+
+
+# after_request hook, registered last so it runs first: the profile covers the
+# view and JSON encoding, and not the access log or metrics bookkeeping
+def finish_request(response):
+    profiler = _stop_profiler()
+    if profiler is not None:
+        response.headers[PROFILE_ARTIFACT_HEADER] = _write_profile(profiler)
+    _record_if_slow(response.status_code)
+    return response
+
+
+# teardown_request hook: an unhandled exception skips after_request, but the
+# profiler must still be switched off and the lock released
+def teardown_request(exc):
+    _stop_profiler()
+
+
+def _profile_dir():
+    path = current_app.config["PROFILE_DIR"]
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# <ms since epoch>-<endpoint>-<request id>.prof, readable with
+# `python -m pstats` or snakeviz. Only the newest PROFILE_KEEP are kept.
+def _write_profile(profiler):
+    directory = _profile_dir()
+    endpoint = re.sub(r"[^A-Za-z0-9_.]", "_", request.endpoint or "unmatched")
+    request_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(g.get("request_id", "")))[:64]
+    name = f"{time.time_ns() // 1000000}-{endpoint}-{request_id}.prof"
+    profiler.dump_stats(os.path.join(directory, name))
+    for old in list_profiles()[current_app.config["PROFILE_KEEP"]:]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+    return name
+
+
+# Newest first
+def list_profiles():
+    directory = current_app.config["PROFILE_DIR"]
+    if not os.path.isdir(directory):
+        return []
+    return sorted((n for n in os.listdir(directory) if n.endswith(".prof")), reverse=True)
+
+
+def profile_path(name):
+    if name not in list_profiles():
+        return None
+    return os.path.join(current_app.config["PROFILE_DIR"], name)
+
+
+def _buffer(size):
+    global _slow_requests
+    if _slow_requests is None or _slow_requests.maxlen != size:
+        with _slow_lock:
+            if _slow_requests is None or _slow_requests.maxlen != size:
+                _slow_requests = deque(_slow_requests or (), maxlen=size)
+    return _slow_requests
+
+
+# Requests slower than SLOW_REQUEST_MS keep their SQL (statement text and time,
+# no parameters) in a ring buffer of the last SLOW_REQUEST_BUFFER per process
+def _record_if_slow(status):
+    config = current_app.config
+    start = g.get("metrics_start")
+    if start is None or config["SLOW_REQUEST_MS"] <= 0:
+        return
+    latency_ms = (time.perf_counter() - start) * 1000
+    if latency_ms < config["SLOW_REQUEST_MS"]:
+        return
+    queries = request_queries()
+    _buffer(config["SLOW_REQUEST_BUFFER"]).append({
+        "ts": time.time(),
+        "request_id": g.get("request_id"),
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": status,
+        "latency_ms": round(latency_ms, 3),
+        "db_queries": queries["count"],
+        "db_time_ms": queries["time_ms"],
+        "statements": [{"sql": sql, "ms": round(ms, 3)} for sql, ms in queries["statements"]],
+    })
+
+
+# Newest first
+def slow_requests():
+    if _slow_requests is None:
+        return []
+    return list(reversed(_slow_requests))
+
+
+def clear_slow_requests():
+    if _slow_requests is not None:
+        _slow_requests.clear()
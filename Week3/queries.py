@@ -0,0 +1,175 @@
+import heapq
+from datetime import date
+from itertools import islice
+
+from extensions import db
+from models import CovidStat
+from serialization import COVID_STAT_FIELDS
+from sharding import read_shards, shard_count, shard_index, sharding_enabled
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+NUMERIC_FIELDS = ("cases", "deaths", "recovered", "active")
+SORT_FIELDS = ("id", "country") + NUMERIC_FIELDS
+# Plain columns rather than the entity: rows come back as tuples, with no
+# identity map or attribute instrumentation to build
+COVID_STAT_COLUMNS = tuple(getattr(CovidStat, field) for field in COVID_STAT_FIELDS)
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_int(args, name, minimum=0):
+    raw = args.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} must be an integer")
+    if value < minimum:
+        raise QueryError(f"{name} must be >= {minimum}")
+    return value
+
+
+def parse_date(args, name):
+    raw = args.get(name)
+    if not raw:
+        return None
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        raise QueryError(f"{name} must be a YYYY-MM-DD date")
+
+
+# Filters shared by every CovidStat read endpoint
+def parse_filter_args(args):
+    params = {
+        "country": args.get("country") or None,
+        "start_date": parse_date(args, "start_date"),
+        "end_date": parse_date(args, "end_date"),
+    }
+    for field in NUMERIC_FIELDS:
+        params[f"min_{field}"] = parse_int(args, f"min_{field}")
+        params[f"max_{field}"] = parse_int(args, f"max_{field}")
+    return params
+
+
+# Normalize the query string of GET /covid into a plain dict
+def parse_list_args(args):
+    params = parse_filter_args(args)
+    params.update({
+        "after_id": parse_int(args, "after_id", minimum=1),
+        "limit": min(parse_int(args, "limit", minimum=1) or DEFAULT_LIMIT, MAX_LIMIT),
+        "sort": args.get("sort") or "id",
+    })
+
+    if params["sort"].lstrip("-") not in SORT_FIELDS:
+        raise QueryError(f"sort must be one of {', '.join(SORT_FIELDS)} (prefix with - for descending)")
+    return params
+
+
+def apply_filters(stmt, params):
+    if params["country"]:
+        stmt = stmt.where(CovidStat.country == params["country"])
+    if params["start_date"]:
+        stmt = stmt.where(CovidStat.snapshot_date >= params["start_date"])
+    if params["end_date"]:
+        stmt = stmt.where(CovidStat.snapshot_date <= params["end_date"])
+    for field in NUMERIC_FIELDS:
+        column = getattr(CovidStat, field)
+        if params[f"min_{field}"] is not None:
+            stmt = stmt.where(column >= params[f"min_{field}"])
+        if params[f"max_{field}"] is not None:
+            stmt = stmt.where(column <= params[f"max_{field}"])
+    return stmt
+
+
+# `anchor` is the cursor row's sort value when the caller already has it
+def _apply_keyset(stmt, params, anchor=None):
+    descending = params["sort"].startswith("-")
+    field = params["sort"].lstrip("-")
+    column = getattr(CovidStat, field)
+
+    if params["after_id"] is not None:
+        if field == "id":
+            anchor_cmp = CovidStat.id < params["after_id"] if descending else CovidStat.id > params["after_id"]
+            stmt = stmt.where(anchor_cmp)
+        else:
+            # The cursor row's sort value is a primary-key subquery inside the
+            # page query, then the page continues strictly after (value, id).
+            # A missing cursor row matches nothing; list_covid checks for that.
+            if anchor is None:
+                anchor = db.select(column).where(CovidStat.id == params["after_id"]).scalar_subquery()
+            if descending:
+                stmt = stmt.where(db.or_(column < anchor, db.and_(column == anchor, CovidStat.id < params["after_id"])))
+            else:
+                stmt = stmt.where(db.or_(column > anchor, db.and_(column == anchor, CovidStat.id > params["after_id"])))
+
+    if field == "id":
+        order = [CovidStat.id.desc() if descending else CovidStat.id.asc()]
+    elif descending:
+        order = [column.desc(), CovidStat.id.desc()]
+    else:
+        order = [column.asc(), CovidStat.id.asc()]
+    return stmt.order_by(*order)
+
+
+# Shards a query with these filters has to read: a country lives on one
+def filter_shards(params):
+    if params["country"]:
+        return [shard_index(params["country"])]
+    return list(range(shard_count()))
+
+
+# Every shard returns its own first limit + 1 rows in page order; the page is
+# the first limit + 1 of those merged. Only the cursor row's sort value has to
+# be looked up first, since that row can be on any shard.
+def _list_sharded(params):
+    field = params["sort"].lstrip("-")
+    anchor = None
+    if params["after_id"] is not None and field != "id":
+        row = get_covid_row(params["after_id"])
+        if row is None:
+            raise QueryError("after_id does not match an existing record")
+        anchor = row[COVID_STAT_FIELDS.index(field)]
+
+    stmt = apply_filters(db.select(*COVID_STAT_COLUMNS), params)
+    stmt = _apply_keyset(stmt, params, anchor).limit(params["limit"] + 1)
+    position = COVID_STAT_FIELDS.index(field)
+    pages = read_shards(stmt, filter_shards(params))
+    merged = heapq.merge(
+        *pages, key=lambda row: (row[position], row.id), reverse=params["sort"].startswith("-")
+    )
+    return list(islice(merged, params["limit"] + 1))
+
+
+# Return one page of CovidStat row tuples (COVID_STAT_FIELDS) and the cursor
+# for the next page
+def list_covid(params):
+    if sharding_enabled():
+        rows = _list_sharded(params)
+    else:
+        stmt = apply_filters(db.select(*COVID_STAT_COLUMNS), params)
+        stmt = _apply_keyset(stmt, params).limit(params["limit"] + 1)
+        rows = db.session.execute(stmt).all()
+        if not rows and params["after_id"] is not None and params["sort"].lstrip("-") != "id":
+            if get_covid_row(params["after_id"]) is None:
+                raise QueryError("after_id does not match an existing record")
+
+    next_after_id = None
+    if len(rows) > params["limit"]:
+        rows = rows[:params["limit"]]
+        next_after_id = rows[-1].id
+    return rows, next_after_id
+
+
+# One CovidStat row tuple by primary key, or None. Ids don't say which shard
+# holds them, so with sharding every shard is asked.
+def get_covid_row(record_id):
+    stmt = db.select(*COVID_STAT_COLUMNS).where(CovidStat.id == record_id)
+    if sharding_enabled():
+        return next((rows[0] for rows in read_shards(stmt) if rows), None)
+    return db.session.execute(stmt).first()
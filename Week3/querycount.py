@@ -0,0 +1,135 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Statements kept per request (count and time cover all of them)
+MAX_CAPTURED_STATEMENTS = 200
+
+_local = threading.local()
+_statement_hooks = []
+
+
+# Called as hook(statement, seconds, in_request) after every statement on any
+# engine; metrics.py counts queries per endpoint this way
+def add_statement_hook(hook):
+    _statement_hooks.append(hook)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    collected = getattr(_local, "collected", None)
+    if collected is not None:
+        collected.append((statement, elapsed))
+        return
+    _record(statement, elapsed)
+
+
+def _record(statement, elapsed):
+    in_request = has_request_context() and "db_queries" in g
+    if in_request:
+        g.db_queries += 1
+        g.db_time += elapsed
+        if len(g.db_statements) < MAX_CAPTURED_STATEMENTS:
+            g.db_statements.append((statement, elapsed * 1000))
+    for recorder in getattr(_local, "recorders", ()):
+        recorder.statements.append((statement, elapsed * 1000))
+    for hook in _statement_hooks:
+        hook(statement, elapsed, in_request)
+
+
+# before_request hook: statement count, DB time and statement text for this request
+def start_request():
+    g.db_queries = 0
+    g.db_time = 0.0
+    g.db_statements = []
+
+
+# Runs fn(*args) and returns (result, statements) with the statements held
+# back rather than recorded. For pool threads working for a request: the
+# request's own thread passes them to replay_statements() afterwards.
+def collect_statements(fn, *args):
+    _local.collected = []
+    try:
+        return fn(*args), _local.collected
+    finally:
+        _local.collected = None
+
+
+def replay_statements(statements):
+    for statement, elapsed in statements:
+        _record(statement, elapsed)
+
+
+# Count, total time and (statement, ms) pairs of the current request so far
+def request_queries():
+    return {
+        "count": g.get("db_queries", 0),
+        "time_ms": round(g.get("db_time", 0.0) * 1000, 3),
+        "statements": list(g.get("db_statements", ())),
+    }
+
+
+# Records every statement run on this thread while active, on any engine and
+# whether or not a request is active. The Flask test client handles requests
+# on the calling thread, so requests made inside the block are included.
+class QueryRecorder:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def time_ms(self):
+        return sum(ms for _, ms in self.statements)
+
+    def __enter__(self):
+        if not hasattr(_local, "recorders"):
+            _local.recorders = []
+        _local.recorders.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.recorders.remove(self)
+        return False
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# with assert_max_queries(1): client.get("/covid")
+# Fails with the statements listed when the block runs more than `limit`.
+@contextmanager
+def assert_max_queries(limit, label=None):
+    with QueryRecorder() as recorder:
+        yield recorder
+    if recorder.count > limit:
+        listing = "\n".join(f"  {i}. {sql.strip()}" for i, (sql, _) in enumerate(recorder.statements, 1))
+        raise QueryBudgetExceeded(
+            f"{label or 'block'} ran {recorder.count} queries, budget is {limit}:\n{listing}"
+        )
+
+
+# Decorator form of assert_max_queries for a test or any other function
+def query_budget(limit):
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            with assert_max_queries(limit, label=fn.__name__):
+                return fn(*args, **kwargs)
+        return decorator
+    return wrapper
@@ -0,0 +1,148 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from math import floor
+
+from flask import request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_limiter.util import get_remote_address
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+
+# Rate-limit counters in a SQLite file, shared by every worker process on the
+# host: RATELIMIT_STORAGE_URI=sqlite:////var/run/week3/ratelimit.db (four
+# slashes for an absolute path, like SQLAlchemy). Across hosts or k8s replicas
+# use a network store instead, e.g. redis://redis:6379 (needs `pip install redis`).
+#
+# Besides the fixed window, it implements the sliding window counter: each
+# window keeps a single counter and a hit is weighted against the previous
+# window's count, so acquiring costs two primary-key reads and one upsert in a
+# single write transaction, whatever the limit.
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    STORAGE_SCHEME = ["sqlite"]
+
+    # Expired rows are swept on roughly one write in PURGE_EVERY
+    PURGE_EVERY = 1000
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=5.0, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split(":///", 1)[-1]
+        if not self.path or self.path == uri:
+            raise ValueError(f"expected sqlite:///<path>, got {uri!r}")
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._init_schema()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # One connection per thread, reopened in a forked child
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _init_schema(self):
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_counters ("
+            "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _read(self, conn, key, now):
+        row = conn.execute(
+            "SELECT count, expires_at FROM rate_limit_counters WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row or (0, now)
+
+    def _incr(self, conn, key, expiry, amount, now):
+        if random.randrange(self.PURGE_EVERY) == 0:
+            conn.execute("DELETE FROM rate_limit_counters WHERE expires_at <= ?", (now,))
+        return conn.execute(
+            "INSERT INTO rate_limit_counters (key, count, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING count",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()[0]
+
+    def incr(self, key, expiry, amount=1):
+        return self._incr(self._conn(), key, expiry, amount, time.time())
+
+    def get(self, key):
+        return self._read(self._conn(), key, time.time())[0]
+
+    def get_expiry(self, key):
+        now = time.time()
+        return self._read(self._conn(), key, now)[1]
+
+    def check(self):
+        try:
+            self._conn().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._conn().execute("DELETE FROM rate_limit_counters").rowcount
+
+    def clear(self, key):
+        self._conn().execute("DELETE FROM rate_limit_counters WHERE key = ?", (key,))
+
+    def _window(self, conn, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._read(conn, previous_key, now)[0]
+        current_count = self._read(conn, current_key, now)[0]
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl, current_key
+
+    # BEGIN IMMEDIATE takes the write lock up front, so reading both windows and
+    # incrementing is atomic across processes
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous_count, previous_ttl, current_count, _, current_key = self._window(conn, key, expiry, now)
+            allowed = floor(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if allowed:
+                self._incr(conn, current_key, 2 * expiry, amount, now)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return allowed
+
+    def get_sliding_window(self, key, expiry):
+        return self._window(self._conn(), key, expiry, time.time())[:4]
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+
+# Requests carrying a valid access token are limited per identity, so users
+# behind one NAT don't share a quota and one user can't dodge it by switching
+# IPs; anonymous requests (and bad tokens, which the view rejects anyway) fall
+# back to the client address.
+def rate_limit_key():
+    if request.headers.get("Authorization"):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity is not None:
+            return f"user:{identity}"
+    return get_remote_address()
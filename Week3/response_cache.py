@@ -0,0 +1,123 @@
+import threading
+import time
+import zlib
+from functools import wraps
+
+from flask import current_app, g, request
+
+from extensions import cache
+
+
+GENERATION_KEY = "covid:generation"
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    with _lock:
+        hits, misses, not_modified = _stats["hits"], _stats["misses"], _stats["not_modified"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "not_modified": not_modified,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "generation": current_generation(),
+    }
+
+
+def reset_cache_stats():
+    with _lock:
+        _stats["hits"] = _stats["misses"] = _stats["not_modified"] = 0
+
+
+# The generation is a nanosecond timestamp rather than a counter, so it never
+# repeats even if the key is evicted or another process bumps it.
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        cache.add(GENERATION_KEY, generation, timeout=0)
+        generation = cache.get(GENERATION_KEY) or generation
+    return generation
+
+
+# Called after every CovidStat write; all cached reads become unreachable at once
+def bump_generation():
+    cache.set(GENERATION_KEY, time.time_ns(), timeout=0)
+
+
+# Cache types whose entries live in one process
+PROCESS_LOCAL_CACHES = {
+    "SimpleCache", "simple",
+    "flask_caching.backends.SimpleCache", "flask_caching.backends.simplecache.SimpleCache",
+}
+
+
+# Every worker must see the same generation: with a per-process cache a write
+# on one worker leaves the others serving old responses, with different
+# ETags, until their entries time out. Called by gunicorn before it forks.
+def require_shared_cache(cache_type, workers):
+    if workers > 1 and cache_type in PROCESS_LOCAL_CACHES:
+        raise RuntimeError(
+            f"CACHE_TYPE={cache_type} is per process and cannot be used with {workers} workers; "
+            "set CACHE_TYPE=RedisCache and CACHE_REDIS_URL, or GUNICORN_WORKERS=1"
+        )
+
+
+# Cache a read endpoint's 200 responses under the current generation and a key
+# built by make_key() from the normalized request. make_key may raise to skip
+# the cache (e.g. invalid parameters), in which case the view handles the request.
+# So does a client whose reads are pinned to the primary (see routing.py).
+#
+# The same generation and key give a strong ETag, so a matching If-None-Match
+# is answered with 304 before any row is read or serialized.
+def cached_response(make_key):
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if g.get("skip_response_cache"):
+                return fn(*args, **kwargs)
+            try:
+                generation = current_generation()
+                key = f"{request.endpoint}:{make_key(*args, **kwargs)}"
+            except Exception:
+                return fn(*args, **kwargs)
+
+            etag = f"{generation:x}-{zlib.crc32(key.encode()):08x}"
+            if request.if_none_match.contains(etag):
+                _count("not_modified")
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.headers["Cache-Control"] = "no-cache"
+                return response
+
+            cache_key = f"covid:{generation}:{key}"
+            hit = cache.get(cache_key)
+            if hit is not None:
+                _count("hits")
+                body, headers = hit
+                response = current_app.response_class(body, status=200, headers=headers, mimetype="application/json")
+            else:
+                _count("misses")
+                response = current_app.make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                headers = {k: v for k, v in response.headers.items() if k.startswith("X-")}
+                cache.set(cache_key, (response.get_data(), headers))
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return decorator
+    return wrapper
+
+
+def normalized_key(params):
+    return "&".join(f"{k}={v}" for k, v in sorted(params.items()) if v is not None)
@@ -0,0 +1,62 @@
+import time
+from functools import wraps
+
+from flask import current_app, g, request
+
+from extensions import REPLICA_BIND, db
+from response_cache import current_generation
+
+
+PRIMARY_HEADER = "X-DB-Primary-Until"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def replica_enabled():
+    return REPLICA_BIND in db.engines
+
+
+# Reads stay on the primary for this client while the X-DB-Primary-Until
+# header it echoes from its last write is in the future (READ_YOUR_WRITES_SECONDS),
+# and for everyone for DB_REPLICA_LAG seconds after any write. The generation is
+# the time of the last write, so responses cached under it are never built from
+# a replica that has not caught up yet.
+#
+# A header rather than a cookie: the SPA calls the API cross-origin without
+# credentials, so a cookie would never come back.
+def _pinned_to_primary(now):
+    try:
+        return float(request.headers.get(PRIMARY_HEADER, 0)) > now
+    except ValueError:
+        return False
+
+
+def _primary_required():
+    now = time.time()
+    if _pinned_to_primary(now):
+        return True
+    lag = current_app.config["DB_REPLICA_LAG"]
+    return lag > 0 and now - current_generation() / 1e9 < lag
+
+
+# Marks a read-only view: its SELECTs go to the replica bind when one is
+# configured. A client pinned to the primary also skips the response cache,
+# whose entry for the new generation may have been built from the replica.
+def read_replica(fn):
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        if replica_enabled():
+            if _pinned_to_primary(time.time()):
+                g.skip_response_cache = True
+            elif not _primary_required():
+                g.db_route = REPLICA_BIND
+        return fn(*args, **kwargs)
+    return decorator
+
+
+# after_app_request hook: a successful write tells the client how long to pin
+# its reads to the primary
+def pin_writer_to_primary(response):
+    window = current_app.config["READ_YOUR_WRITES_SECONDS"]
+    if request.method in WRITE_METHODS and response.status_code < 400 and window > 0 and replica_enabled():
+        response.headers[PRIMARY_HEADER] = f"{time.time() + window:.3f}"
+    return response
@@ -0,0 +1,74 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+# The one CovidStat schema: the columns read-only endpoints select (in this
+# order) and the JSON object each row becomes. CovidStat.to_dict uses it too.
+COVID_STAT_FIELDS = ("id", "country", "cases", "deaths", "recovered", "active", "snapshot_date", "recorded_at")
+
+
+# Turns a row tuple of COVID_STAT_FIELDS into a JSON-ready dict
+def covid_stat_row(row):
+    record_id, country, cases, deaths, recovered, active, snapshot_date, recorded_at = row
+    return {
+        "id": record_id,
+        "country": country,
+        "cases": cases,
+        "deaths": deaths,
+        "recovered": recovered,
+        "active": active,
+        "snapshot_date": snapshot_date.isoformat() if snapshot_date else None,
+        "recorded_at": recorded_at.isoformat() if recorded_at else None,
+    }
+
+
+def covid_stat_rows(rows):
+    return [covid_stat_row(row) for row in rows]
+
+
+# Compact JSON bytes for plain values (str, int, float, None, lists, dicts)
+def json_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+# jsonify() through orjson when it is installed. Output matches Flask's encoder
+# (sorted keys; dates go through Flask's default and become HTTP dates) except
+# that non-ASCII text is written as UTF-8 rather than \u escapes. Debug-mode
+# indentation and anything orjson can't encode use the stdlib path.
+class FastJSONProvider(DefaultJSONProvider):
+    def _orjson_options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _fast_dumps(self, obj):
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+        except TypeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            body = self._fast_dumps(obj)
+            if body is not None:
+                return body.decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        body = self._fast_dumps(self._prepare_response_obj(args, kwargs))
+        if body is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
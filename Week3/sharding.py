@@ -0,0 +1,236 @@
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import exc as sa_exc
+
+from extensions import db
+from migrations import upgrade_covid_stat
+from models import CovidStat, IdBlock
+from querycount import collect_statements, replay_statements
+
+
+# CovidStat can be split over several databases (COVID_SHARD_URLS). A row lives
+# on the shard picked by a stable hash of its country, so everything about one
+# country is on one shard; reads without a country run on every shard in
+# parallel and the callers merge the results. Rollups, users and the id
+# counter stay on the primary. Writes that touch several shards commit on each
+# shard separately: there is no transaction across shards, which is why
+# /covid/batch only accepts batches that stay on one shard.
+SHARD_BIND_PREFIX = "covid_shard_"
+ID_BLOCK_NAME = "covid_stat"
+
+_lock = threading.Lock()
+_executor = None
+
+
+def shard_binds(urls):
+    return {f"{SHARD_BIND_PREFIX}{index}": url for index, url in enumerate(urls)}
+
+
+def sharding_enabled():
+    return bool(current_app.config["COVID_SHARD_URLS"])
+
+
+def shard_count():
+    return len(current_app.config["COVID_SHARD_URLS"])
+
+
+# crc32 rather than hash(): the same country maps to the same shard in every
+# process and after every restart. Changing the number of shards moves rows.
+def shard_index(country):
+    return zlib.crc32(country.encode("utf-8")) % shard_count()
+
+
+def shard_engine(index):
+    return db.engines[f"{SHARD_BIND_PREFIX}{index}"]
+
+
+# Dialect name of the database(s) holding CovidStat
+def covid_dialect():
+    if sharding_enabled():
+        return shard_engine(0).dialect.name
+    return db.session.get_bind(mapper=CovidStat).dialect.name
+
+
+# One bounded pool per process for shard fan-out, sized by SHARD_WORKERS
+def get_executor(workers):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="covid-shard")
+        return _executor
+
+
+def _run(engine, fn, write):
+    with (engine.begin() if write else engine.connect()) as connection:
+        return fn(connection)
+
+
+# Runs work[index](connection) on each listed shard and returns {index: result}.
+# Several shards run in parallel on the shard pool, and their statements are
+# counted for the current request as if it had run them. `write` gives each
+# shard its own transaction, committed when its function returns.
+def on_shards(work, write=False):
+    if len(work) == 1:
+        (index, fn), = work.items()
+        return {index: _run(shard_engine(index), fn, write)}
+    executor = get_executor(current_app.config["SHARD_WORKERS"])
+    futures = {
+        index: executor.submit(collect_statements, _run, shard_engine(index), fn, write)
+        for index, fn in work.items()
+    }
+    results = {}
+    for index, future in futures.items():
+        results[index], statements = future.result()
+        replay_statements(statements)
+    return results
+
+
+# Rows of one SELECT from every shard (or only `indexes`), as one list per shard
+def read_shards(stmt, indexes=None):
+    indexes = range(shard_count()) if indexes is None else indexes
+    results = on_shards({index: lambda connection: connection.execute(stmt).all() for index in indexes})
+    return list(results.values())
+
+
+def _reserve(size):
+    block = IdBlock.__table__
+    stmt = (
+        db.update(block).where(block.c.name == ID_BLOCK_NAME)
+        .values(next_id=block.c.next_id + size).returning(block.c.next_id)
+    )
+    for _ in range(2):
+        with db.engine.begin() as connection:
+            end = connection.execute(stmt).scalar_one_or_none()
+            if end is not None:
+                return end - size, end
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(db.insert(block).values(name=ID_BLOCK_NAME, next_id=1))
+        except sa_exc.IntegrityError:
+            pass  # another worker created the counter first
+    raise RuntimeError("could not reserve CovidStat ids")
+
+
+# `count` new CovidStat ids. Ids are unique across shards but not in time
+# order: each worker reserves SHARD_ID_BLOCK at a time from the primary, in a
+# transaction of its own, and hands them out until the block runs out.
+def allocate_ids(count):
+    state = current_app.extensions.setdefault("covid_shards", {"lock": threading.Lock(), "next": 0, "end": 0})
+    with state["lock"]:
+        if state["end"] - state["next"] < count:
+            state["next"], state["end"] = _reserve(max(count, current_app.config["SHARD_ID_BLOCK"]))
+        start = state["next"]
+        state["next"] += count
+    return list(range(start, start + count))
+
+
+# {id: shard index} for the ids that exist
+def locate(ids):
+    if not ids:
+        return {}
+    stmt = db.select(CovidStat.id).where(CovidStat.id.in_(ids))
+    return {record_id: index for index, rows in enumerate(read_shards(stmt)) for record_id, in rows}
+
+
+# Inserts rows (dicts of CovidStat columns without id), each on its country's
+# shard. Returns the new ids in row order.
+def insert_rows(rows):
+    ids = allocate_ids(len(rows))
+    by_shard = {}
+    for row, new_id in zip(rows, ids):
+        by_shard.setdefault(shard_index(row["country"]), []).append({**row, "id": new_id})
+    on_shards(
+        {index: lambda connection, rows=rows: connection.execute(db.insert(CovidStat), rows) for index, rows in by_shard.items()},
+        write=True,
+    )
+    return ids
+
+
+# A changed country can belong to another shard: the row is written there
+# first and then removed from the old one, so a failure in between leaves a
+# duplicate rather than losing the row
+def _move(record_id, source, values):
+    row = on_shards({source: lambda connection: connection.execute(
+        db.select(CovidStat.__table__).where(CovidStat.id == record_id)
+    ).mappings().first()})[source]
+    if row is None:
+        return False
+    on_shards({shard_index(values["country"]): lambda connection: connection.execute(
+        db.insert(CovidStat), [{**row, **values}]
+    )}, write=True)
+    on_shards({source: lambda connection: connection.execute(
+        db.delete(CovidStat).where(CovidStat.id == record_id)
+    )}, write=True)
+    return True
+
+
+def _update(connection, rows):
+    updated = []
+    for record_id, values in rows:
+        result = connection.execute(db.update(CovidStat).where(CovidStat.id == record_id).values(**values))
+        if result.rowcount:
+            updated.append(record_id)
+    return updated
+
+
+# Applies {id: values} to rows whose shard `locate` found, one
+# transaction per shard. Returns the ids that were updated.
+def update_rows(updates, located):
+    by_shard, moves = {}, []
+    for record_id, values in updates.items():
+        index = located[record_id]
+        if "country" in values and shard_index(values["country"]) != index:
+            moves.append((record_id, index, values))
+        else:
+            by_shard.setdefault(index, []).append((record_id, values))
+
+    updated = set()
+    if by_shard:
+        work = {index: lambda connection, rows=rows: _update(connection, rows) for index, rows in by_shard.items()}
+        for ids in on_shards(work, write=True).values():
+            updated.update(ids)
+    for record_id, index, values in moves:
+        if _move(record_id, index, values):
+            updated.add(record_id)
+    return updated
+
+
+# Deletes ids from whichever shards hold them; `located` (from locate) limits
+# the work to those shards. Returns the number of rows deleted.
+def delete_rows(ids, located=None):
+    if located is None:
+        indexes = range(shard_count())
+    else:
+        indexes = {located[record_id] for record_id in ids if record_id in located}
+    if not indexes:
+        return 0
+    stmt = db.delete(CovidStat).where(CovidStat.id.in_(ids))
+    results = on_shards({index: lambda connection: connection.execute(stmt).rowcount for index in indexes}, write=True)
+    return sum(results.values())
+
+
+# Inserts rows, applies {id: values} and deletes ids on one shard in a single
+# transaction, so a write confined to one shard is all or none. Returns the new
+# ids in row order.
+def write_shard(index, rows, updates, ids):
+    new_ids = allocate_ids(len(rows)) if rows else []
+
+    def work(connection):
+        if rows:
+            connection.execute(db.insert(CovidStat), [{**row, "id": new_id} for row, new_id in zip(rows, new_ids)])
+        _update(connection, updates.items())
+        if ids:
+            connection.execute(db.delete(CovidStat).where(CovidStat.id.in_(ids)))
+
+    on_shards({index: work}, write=True)
+    return new_ids
+
+
+# Creates CovidStat (with its indexes) on every shard; part of init-db
+def init_shards():
+    for index in range(shard_count()):
+        CovidStat.__table__.create(shard_engine(index), checkfirst=True)
+        upgrade_covid_stat(shard_engine(index))
@@ -0,0 +1,118 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from extensions import db
+from ingest import dialect_insert, upsert_covid_stats
+from models import CovidDailyRollup, CovidWeeklyRollup
+from queries import QueryError, parse_date, parse_int
+
+
+METRICS = ("cases", "deaths", "recovered", "active")
+DELTA_FIELDS = ("cases", "deaths", "recovered")
+COUNTERS = ("new_cases", "new_deaths", "new_recovered", "samples")
+ROLLUPS = {"day": (CovidDailyRollup, "day"), "week": (CovidWeeklyRollup, "week_start")}
+DEFAULT_HISTORY_LIMIT = 1000
+MAX_HISTORY_LIMIT = 10000
+
+
+def content_hash(row):
+    payload = "|".join(str(row[field]) for field in ("country",) + METRICS)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+# Closing values of each country's most recent daily rollup, in one query
+def _latest_state(countries):
+    latest = (
+        db.select(CovidDailyRollup.country, db.func.max(CovidDailyRollup.day).label("day"))
+        .where(CovidDailyRollup.country.in_(countries))
+        .group_by(CovidDailyRollup.country)
+        .subquery()
+    )
+    stmt = db.select(
+        CovidDailyRollup.country, CovidDailyRollup.day, CovidDailyRollup.content_hash,
+        *[getattr(CovidDailyRollup, field) for field in DELTA_FIELDS],
+    ).join(latest, db.and_(CovidDailyRollup.country == latest.c.country, CovidDailyRollup.day == latest.c.day))
+    return {row.country: row._asdict() for row in db.session.execute(stmt)}
+
+
+# Upsert rollup rows: closing values are replaced, counters are added to
+def _upsert_rollup(model, key, rows):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = dialect_insert(model)(table)
+    set_ = {name: stmt.excluded[name] for name in rows[0] if name not in key and name not in COUNTERS}
+    set_.update({name: table.c[name] + stmt.excluded[name] for name in COUNTERS})
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c[name] for name in key], set_=set_)
+    db.session.execute(stmt, rows)
+
+
+# Store a batch of snapshots (dicts with country, snapshot_date and METRICS).
+# A snapshot identical to the country's previous one is skipped. Stored snapshots
+# upsert the raw CovidStat row for (country, snapshot_date) and fold their delta
+# into the daily and weekly rollups, so no rollup is ever recomputed from history.
+# Rollups assume a country's snapshots arrive in time order; a snapshot older than
+# the latest rollup day is kept in raw history only. The caller commits.
+def record_snapshots(rows, recorded_at=None):
+    recorded_at = recorded_at or datetime.utcnow()
+    by_country = {row["country"]: row for row in rows}
+    previous = _latest_state(list(by_country)) if by_country else {}
+
+    stored, skipped = [], []
+    daily, weekly = [], []
+    for country, row in by_country.items():
+        digest = content_hash(row)
+        prev = previous.get(country)
+        if prev and prev["content_hash"] == digest:
+            skipped.append(country)
+            continue
+
+        stored.append({**row, "recorded_at": recorded_at, "content_hash": digest})
+        day = row["snapshot_date"]
+        if prev and day < prev["day"]:
+            continue
+
+        rollup = {field: row[field] for field in ("country",) + METRICS}
+        for field in DELTA_FIELDS:
+            rollup[f"new_{field}"] = row[field] - prev[field] if prev else 0
+        rollup.update(samples=1, updated_at=recorded_at)
+        daily.append({**rollup, "day": day, "content_hash": digest})
+        weekly.append({**rollup, "week_start": week_start(day)})
+
+    upsert_covid_stats(stored)
+    _upsert_rollup(CovidDailyRollup, ("country", "day"), daily)
+    _upsert_rollup(CovidWeeklyRollup, ("country", "week_start"), weekly)
+    return stored, skipped
+
+
+def parse_history_args(args):
+    params = {
+        "country": args.get("country") or None,
+        "granularity": args.get("granularity") or "day",
+        "start_date": parse_date(args, "start_date"),
+        "end_date": parse_date(args, "end_date"),
+        "limit": min(parse_int(args, "limit", minimum=1) or DEFAULT_HISTORY_LIMIT, MAX_HISTORY_LIMIT),
+    }
+    if params["granularity"] not in ROLLUPS:
+        raise QueryError(f"granularity must be one of {', '.join(ROLLUPS)}")
+    return params
+
+
+# Time-range query served entirely from the rollup tables
+def rollup_history(params):
+    model, key = ROLLUPS[params["granularity"]]
+    bucket = getattr(model, key)
+    stmt = db.select(model)
+    if params["country"]:
+        stmt = stmt.where(model.country == params["country"])
+    if params["start_date"]:
+        start = params["start_date"]
+        stmt = stmt.where(bucket >= (week_start(start) if key == "week_start" else start))
+    if params["end_date"]:
+        stmt = stmt.where(bucket <= params["end_date"])
+    stmt = stmt.order_by(bucket, model.country).limit(params["limit"])
+    return [rollup.to_dict() for rollup in db.session.scalars(stmt)]
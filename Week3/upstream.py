@@ -0,0 +1,101 @@
+import threading
+import time
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_upstream
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+
+
+# One keep-alive session and one bounded worker pool per process, shared by
+# every /covid/fetch request. Both are sized by COVID_FETCH_WORKERS.
+def get_session(workers):
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_executor(workers):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="covid-fetch")
+        return _executor
+
+
+def reset():
+    global _session, _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        if _session is not None:
+            _session.close()
+        _session = None
+        _executor = None
+
+
+def fetch_json(session, url, timeout):
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        observe_upstream(time.perf_counter() - start, "error")
+        raise UpstreamError(f"request failed: {e}")
+    if response.status_code != 200:
+        observe_upstream(time.perf_counter() - start, "http_error")
+        raise UpstreamError("Failed to fetch data", status_code=response.status_code)
+    # A 200 that is not JSON, e.g. a proxy's HTML error page, is a bad gateway
+    # rather than a crash in the caller
+    try:
+        data = response.json()
+    except ValueError:
+        observe_upstream(time.perf_counter() - start, "error")
+        raise UpstreamError("upstream returned invalid JSON")
+    observe_upstream(time.perf_counter() - start, "ok")
+    return data
+
+
+# Fetch several countries concurrently. Returns ({country: data}, {country: error})
+# in request order; a failing country does not affect the others.
+def fetch_countries(base_url, countries, workers, timeout):
+    session = get_session(workers)
+    executor = get_executor(workers)
+    futures = {
+        country: executor.submit(fetch_json, session, f"{base_url}/{quote(country, safe='')}", timeout)
+        for country in countries
+    }
+
+    results, errors = {}, {}
+    for country, future in futures.items():
+        try:
+            results[country] = future.result()
+        except UpstreamError as e:
+            errors[country] = e
+    return results, errors
+
+
+# disease.sh returns every country in one response, so "all" is a single request.
+# Anything but a list of objects is a bad gateway, not a crash in the caller.
+def fetch_all_countries(base_url, workers, timeout):
+    data = fetch_json(get_session(workers), base_url, timeout)
+    if not isinstance(data, list) or not all(isinstance(entry, dict) for entry in data):
+        raise UpstreamError("upstream returned an unexpected payload")
+    return {entry.get("country"): entry for entry in data}
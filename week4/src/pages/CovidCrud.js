@@ -2,6 +2,19 @@ import { useState, useEffect } from "react";
 import axios from "axios";
 import "./CovidCrud.css";
 
+// After a write the backend returns X-DB-Primary-Until; sending it back keeps
+// our reads on the primary database so they include that write (cookies are
+// not sent cross-origin, so the header is echoed by hand)
+const PRIMARY_HEADER = "X-DB-Primary-Until";
+let primaryUntil = null;
+
+const rememberPrimary = (res) => {
+  const until = res.headers[PRIMARY_HEADER.toLowerCase()];
+  if (until) primaryUntil = until;
+};
+
+const primaryHeaders = () => (primaryUntil ? { [PRIMARY_HEADER]: primaryUntil } : {});
+
 function CovidCrud() {
   const API_BASE = "http://127.0.0.1:5001"; // Flask backend
   const token = localStorage.getItem("token");
@@ -16,11 +29,19 @@ function CovidCrud() {
   });
   const [editingId, setEditingId] = useState(null);
 
-  // fretch saved COVID records
+  // fretch saved COVID records; GET /covid is paged, so keep following
+  // X-Next-After-Id until the last page
   const fetchSavedData = async () => {
     try {
-      const res = await axios.get(`${API_BASE}/covid`);
-      setStats(res.data);
+      const records = [];
+      let afterId = null;
+      do {
+        const params = { limit: 1000, ...(afterId ? { after_id: afterId } : {}) };
+        const res = await axios.get(`${API_BASE}/covid`, { params, headers: primaryHeaders() });
+        records.push(...res.data);
+        afterId = res.headers["x-next-after-id"];
+      } while (afterId);
+      setStats(records);
     } catch (err) {
       alert("❌ Error fetching saved records");
     }
@@ -50,14 +71,14 @@ function CovidCrud() {
   const handleSubmit = async () => {
     try {
       if (editingId) {
-        await axios.put(`${API_BASE}/covid/${editingId}`, formData, {
+        rememberPrimary(await axios.put(`${API_BASE}/covid/${editingId}`, formData, {
           headers: { Authorization: `Bearer ${token}` }
-        });
+        }));
         alert("✅ Record updated");
       } else {
-        await axios.post(`${API_BASE}/covid`, formData, {
+        rememberPrimary(await axios.post(`${API_BASE}/covid`, formData, {
           headers: { Authorization: `Bearer ${token}` }
-        });
+        }));
         alert("✅ Record added");
       }
 
@@ -85,9 +106,9 @@ function CovidCrud() {
   // Delete record (Admin only)
   const handleDelete = async (id) => {
     try {
-      await axios.delete(`${API_BASE}/covid/${id}`, {
+      rememberPrimary(await axios.delete(`${API_BASE}/covid/${id}`, {
         headers: { Authorization: `Bearer ${token}` }
-      });
+      }));
       alert("✅ Record deleted");
       fetchSavedData();
     } catch (err) {
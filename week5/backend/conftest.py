@@ -5,29 +5,32 @@ import tempfile
 import json
 import pytest
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+# Keep test runs out of the tracked week3.log (read by Config at import)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "week3-tests.log"))
 
-# Import your real app and db
-import sys
 # Add Week3 folder to Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../Week3")))
-from app import app as real_app, db as real_db
+from app import create_app
+from extensions import db as real_db
+from response_cache import reset_cache_stats
 
 @pytest.fixture()
 def app():
-    # Make a fresh test app based on Week3 but with a TEMP DB and TESTING on
+    # Build a fresh Week3 app per test with a TEMP DB and TESTING on
     db_fd, db_path = tempfile.mkstemp()
-    real_app.config.update(
-        TESTING=True,
-        SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
-        JWT_SECRET_KEY="test-jwt",
-        WTF_CSRF_ENABLED=False,
-    )
-    with real_app.app_context():
-        real_db.drop_all()
-        real_db.create_all()
-    yield real_app
+    test_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "JWT_SECRET_KEY": "test-jwt",
+        "WTF_CSRF_ENABLED": False,
+        "RATELIMIT_STORAGE_URI": "memory://",
+    })
+    with test_app.app_context():
+        real_db.create_all(bind_key=None)
+    reset_cache_stats()
+    yield test_app
+    with test_app.app_context():
+        real_db.engine.dispose()
     os.close(db_fd)
     os.remove(db_path)
 
@@ -44,16 +47,15 @@ def auth_header(client):
     return {"Authorization": f"Bearer {token}"}
 
 @pytest.fixture()
-def admin_header(client):
+def admin_header(app, client):
     # Create an admin (if your Week3 gives role=user by default, you can promote via DB)
     client.post("/auth/register", json={"username": "admin", "password": "p2"})
     # Manually promote to admin in DB for testing
     from models import User
-    from extensions import db
-    with real_app.app_context():
+    with app.app_context():
         admin = User.query.filter_by(username="admin").first()
         admin.role = "admin"
-        db.session.commit()
+        real_db.session.commit()
     res = client.post("/auth/login", json={"username": "admin", "password": "p2"})
     token = res.get_json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,64 @@
+from datetime import date
+
+from extensions import db
+from models import CovidStat
+
+
+def seed(app):
+    rows = [
+        ("USA", date(2021, 1, 4), 100, 10, 50, 40),
+        ("USA", date(2021, 1, 5), 120, 12, 60, 48),
+        ("USA", date(2021, 2, 1), 200, 20, 100, 80),
+        ("Peru", date(2021, 1, 4), 30, 3, 10, 17),
+        ("Peru", date(2021, 1, 5), 40, 30, 5, 5),
+    ]
+    with app.app_context():
+        db.session.add_all([
+            CovidStat(country=c, snapshot_date=d, cases=cases, deaths=deaths, recovered=rec, active=act)
+            for c, d, cases, deaths, rec, act in rows
+        ])
+        db.session.commit()
+
+
+def test_aggregate_by_country(app, client):
+    seed(app)
+    data = client.get("/covid/aggregate").get_json()
+    assert [g["country"] for g in data] == ["Peru", "USA"]
+    usa = data[1]
+    assert usa["count"] == 3
+    assert usa["cases"] == {"sum": 420, "avg": 140.0, "min": 100, "max": 200}
+
+
+def test_aggregate_by_time_bucket_with_filters(app, client):
+    seed(app)
+    data = client.get("/covid/aggregate?group_by=week&metrics=deaths&funcs=sum").get_json()
+    assert data == [
+        {"bucket": "2021-01-04", "count": 4, "deaths": {"sum": 55}},
+        {"bucket": "2021-02-01", "count": 1, "deaths": {"sum": 20}},
+    ]
+    monthly = client.get("/covid/aggregate?group_by=month&country=USA&funcs=max&metrics=cases").get_json()
+    assert monthly == [
+        {"bucket": "2021-01-01", "count": 2, "cases": {"max": 120}},
+        {"bucket": "2021-02-01", "count": 1, "cases": {"max": 200}},
+    ]
+    daily = client.get("/covid/aggregate?group_by=day&start_date=2021-01-05&end_date=2021-01-31&funcs=sum&metrics=cases").get_json()
+    assert daily == [{"bucket": "2021-01-05", "count": 2, "cases": {"sum": 160}}]
+
+
+def test_top_countries(app, client):
+    seed(app)
+    overall = client.get("/covid/top?by=deaths&n=1").get_json()
+    assert overall == [{"rank": 1, "country": "Peru", "deaths": 30}]
+    # Ranked on each country's latest snapshot, not its peak: Peru's active
+    # count fell from 17 to 5
+    latest = client.get("/covid/top?by=active").get_json()
+    assert [(r["country"], r["active"]) for r in latest] == [("USA", 80), ("Peru", 5)]
+    on_day = client.get("/covid/top?by=active&date=2021-01-04").get_json()
+    assert [(r["country"], r["active"]) for r in on_day] == [("USA", 40), ("Peru", 17)]
+
+
+def test_aggregate_rejects_bad_params(client):
+    assert client.get("/covid/aggregate?group_by=year").status_code == 400
+    assert client.get("/covid/aggregate?funcs=median").status_code == 400
+    assert client.get("/covid/top?by=password").status_code == 400
+    assert client.get("/covid/top?date=yesterday").status_code == 400
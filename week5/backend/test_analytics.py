@@ -0,0 +1,137 @@
+import math
+from datetime import date, timedelta
+
+import pytest
+
+import analytics
+from extensions import db
+from models import CovidStat
+from response_cache import bump_generation
+from snapshots import record_snapshots
+
+START = date(2024, 1, 1)
+
+
+def snapshot(country, day, cases, deaths, recovered=0):
+    return {"country": country, "snapshot_date": START + timedelta(days=day), "cases": cases,
+            "deaths": deaths, "recovered": recovered, "active": cases - deaths - recovered}
+
+
+@pytest.fixture()
+def seeded(app):
+    with app.app_context():
+        db.session.execute(db.insert(CovidStat), [
+            snapshot("USA", day, 100 + 10 * day, 2 * day, 5 * day) for day in range(10)
+        ] + [
+            snapshot("Peru", 0, 0, 0), snapshot("Peru", 3, 40, 4),
+        ])
+        db.session.commit()
+    return app
+
+
+def test_rates_deltas_and_rolling_average(client, seeded):
+    series = client.get("/covid/analytics?country=USA").get_json()[0]["series"]
+    assert [p["date"] for p in series] == [(START + timedelta(days=d)).isoformat() for d in range(10)]
+    assert series[0]["new_cases"] is None
+    assert series[1]["new_cases"] == 10 and series[1]["new_deaths"] == 2
+    assert series[9]["case_fatality_rate"] == round(18 / 190, 6)
+    assert series[9]["recovery_rate"] == round(45 / 190, 6)
+    # Average daily change over the last 7 days, or since the first snapshot
+    assert series[9]["new_cases_7d_avg"] == 10.0
+    assert series[3]["new_deaths_7d_avg"] == 2.0
+    assert series[0]["new_cases_7d_avg"] is None
+
+
+def test_gaps_and_zero_cases(client, seeded):
+    peru = client.get("/covid/analytics?country=Peru").get_json()[0]["series"]
+    assert peru[0]["case_fatality_rate"] is None
+    assert peru[1]["new_cases"] == 40
+    assert peru[1]["new_cases_7d_avg"] == round(40 / 3, 2)
+
+
+def test_window_and_latest_look_back_past_start_date(client, seeded):
+    body = client.get("/covid/analytics?start_date=2024-01-05&end_date=2024-01-06").get_json()
+    assert [c["country"] for c in body] == ["USA"]
+    assert [p["new_cases"] for p in body[0]["series"]] == [10, 10]
+    latest = client.get("/covid/analytics?latest=1").get_json()
+    assert {c["country"]: [p["date"] for p in c["series"]] for c in latest} == {
+        "Peru": ["2024-01-04"], "USA": ["2024-01-10"],
+    }
+    assert client.get("/covid/analytics?start_date=2024-02-01&end_date=2024-01-01").status_code == 400
+
+
+def test_dates_before_1970_stay_in_their_country(app, client, seeded):
+    for country in ["Peru", "USA"]:
+        body = client.get(f"/covid/analytics?country={country}&start_date=1969-12-01").get_json()
+        assert [c["country"] for c in body] == [country]
+    with app.app_context():
+        db.session.execute(db.insert(CovidStat), [
+            {"country": "Peru", "snapshot_date": date(1969, 12, 31), "cases": 1, "deaths": 0, "recovered": 0, "active": 1},
+        ])
+        db.session.commit()
+        bump_generation()
+    peru = client.get("/covid/analytics?country=Peru&start_date=1969-01-01&end_date=1970-01-01").get_json()
+    assert [(c["country"], [p["date"] for p in c["series"]]) for c in peru] == [("Peru", ["1969-12-31"])]
+
+
+def test_snapshots_are_merged_incrementally(app, client, seeded, monkeypatch):
+    client.get("/covid/analytics")
+    monkeypatch.setattr(analytics, "_full_load", lambda *args: pytest.fail("full reload"))
+    with app.app_context():
+        record_snapshots([snapshot("USA", 10, 200, 20, 50), snapshot("Chile", 0, 5, 1), snapshot("Peru", 1, 10, 1)])
+        db.session.commit()
+        bump_generation()
+
+    body = {c["country"]: c["series"] for c in client.get("/covid/analytics").get_json()}
+    assert body["USA"][-1]["new_cases"] == 10 and len(body["USA"]) == 11
+    assert body["Chile"][0]["cases"] == 5
+    assert [p["cases"] for p in body["Peru"]] == [0, 10, 40]
+    assert client.get("/cache/stats").get_json()["analytics"]["rows"] == 15
+
+
+def test_series_expires_without_a_generation_change(app, client, seeded):
+    client.get("/covid/analytics")
+    # A write made by another worker: nothing changes in this worker's cache
+    with app.app_context():
+        record_snapshots([snapshot("Chile", 0, 5, 1)])
+        db.session.commit()
+        assert "Chile" not in analytics.current_series().countries
+        app.config["ANALYTICS_MAX_AGE"] = 0
+        assert "Chile" in analytics.current_series().countries
+
+
+def test_upserted_snapshot_replaces_the_day(app, client, seeded):
+    client.get("/covid/analytics")
+    with app.app_context():
+        record_snapshots([snapshot("Peru", 3, 50, 5)])
+        db.session.commit()
+        bump_generation()
+    peru = client.get("/covid/analytics?country=Peru").get_json()[0]["series"]
+    assert [p["cases"] for p in peru] == [0, 50]
+
+
+def test_updates_and_deletes_reload(client, seeded, admin_header):
+    client.get("/covid/analytics")
+    with client.application.app_context():
+        usa_last = db.session.scalars(db.select(CovidStat.id).where(CovidStat.country == "USA")
+                                      .order_by(CovidStat.snapshot_date.desc())).first()
+    client.put(f"/covid/{usa_last}", json={"cases": 1000})
+    assert client.get("/covid/analytics?country=USA&latest=1").get_json()[0]["series"][0]["cases"] == 1000
+    client.delete(f"/covid/{usa_last}", headers=admin_header)
+    series = client.get("/covid/analytics?country=USA").get_json()[0]["series"]
+    assert len(series) == 9
+
+
+def test_empty_table(client):
+    assert client.get("/covid/analytics").get_json() == []
+
+
+def test_matches_a_plain_loop(app, seeded):
+    with app.test_request_context():
+        result = analytics.covid_analytics(analytics.parse_analytics_args({}))
+    for country in result:
+        points = country["series"]
+        for previous, point in zip(points, points[1:]):
+            assert point["new_deaths"] == point["deaths"] - previous["deaths"]
+            if point["cases"]:
+                assert math.isclose(point["case_fatality_rate"], point["deaths"] / point["cases"], abs_tol=1e-6)
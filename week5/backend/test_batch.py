@@ -0,0 +1,67 @@
+import json
+
+from models import CovidStat
+
+
+def row(country, cases=1):
+    return {"country": country, "cases": cases, "deaths": 0, "recovered": 0, "active": cases}
+
+
+def test_batch_requires_auth(client):
+    assert client.post("/covid/batch", json=[row("A")]).status_code in (401, 422)
+
+
+def test_batch_create_returns_ids_in_order(app, client, auth_header):
+    res = client.post("/covid/batch", json=[row(f"C{i}", i) for i in range(2000)], headers=auth_header)
+    assert res.status_code == 200
+    results = res.get_json()["results"]
+    assert [r["status"] for r in results] == ["created"] * 2000
+    with app.app_context():
+        assert CovidStat.query.count() == 2000
+        assert CovidStat.query.get(results[7]["id"]).country == "C7"
+
+
+def test_batch_mixed_ops(app, client, auth_header):
+    ids = [r["id"] for r in client.post("/covid/batch", json=[row("A"), row("B")], headers=auth_header).get_json()["results"]]
+    res = client.patch("/covid/batch", json=[
+        {"id": ids[0], "cases": 50},
+        {"op": "create", **row("C")},
+    ], headers=auth_header)
+    assert [r["status"] for r in res.get_json()["results"]] == ["updated", "created"]
+    with app.app_context():
+        assert CovidStat.query.get(ids[0]).cases == 50
+        assert CovidStat.query.count() == 3
+
+
+def test_batch_rejects_whole_batch_on_invalid_item(app, client, auth_header):
+    res = client.post("/covid/batch", json=[row("A"), {"country": "B"}, {"op": "update", "id": 424242, "cases": 1}], headers=auth_header)
+    assert res.status_code == 400
+    assert [e["index"] for e in res.get_json()["results"]] == [1, 2]
+    with app.app_context():
+        assert CovidStat.query.count() == 0
+
+
+def test_batch_delete_needs_admin_once(app, client, auth_header, admin_header):
+    ids = [r["id"] for r in client.post("/covid/batch", json=[row("A"), row("B"), row("C")], headers=auth_header).get_json()["results"]]
+    body = [{"id": i} for i in ids[:2]]
+    assert client.delete("/covid/batch", json=body, headers=auth_header).status_code == 403
+    res = client.delete("/covid/batch", json=body, headers=admin_header)
+    assert [r["status"] for r in res.get_json()["results"]] == ["deleted", "deleted"]
+    with app.app_context():
+        assert [s.country for s in CovidStat.query.all()] == ["C"]
+
+
+def test_batch_ndjson(app, client, auth_header):
+    body = "\n".join(json.dumps(row(f"N{i}")) for i in range(3)) + "\n"
+    res = client.post("/covid/batch", data=body, headers={**auth_header, "Content-Type": "application/x-ndjson"})
+    assert res.status_code == 200
+    assert len(res.get_json()["results"]) == 3
+
+    bad = client.post("/covid/batch", data="{not json}\n", headers={**auth_header, "Content-Type": "application/x-ndjson"})
+    assert bad.status_code == 400
+
+
+def test_batch_invalidates_list_cache(client, auth_header):
+    assert client.get("/covid").get_json() == []
+    client.post("/covid/batch", json=[row("A")], headers=auth_header)
+    assert len(client.get("/covid").get_json()) == 1
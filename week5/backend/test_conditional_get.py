@@ -0,0 +1,58 @@
+from sqlalchemy import event
+
+from extensions import db
+
+
+def add(client, auth_header, country="X"):
+    res = client.post("/covid", json={"country":country,"cases":1,"deaths":1,"recovered":0,"active":0}, headers=auth_header)
+    return res.get_json()["id"]
+
+
+def test_collection_returns_304_for_matching_etag(client, auth_header):
+    add(client, auth_header)
+    first = client.get("/covid")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get("/covid", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert again.get_data() == b""
+
+
+def test_etag_changes_after_write(client, auth_header):
+    add(client, auth_header)
+    etag = client.get("/covid").headers["ETag"]
+    add(client, auth_header, "Y")
+    res = client.get("/covid", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert len(res.get_json()) == 2
+
+
+def test_etag_differs_per_query(client, auth_header):
+    add(client, auth_header)
+    assert client.get("/covid").headers["ETag"] != client.get("/covid?limit=5").headers["ETag"]
+
+
+def test_item_conditional_get(client, auth_header):
+    cid = add(client, auth_header)
+    first = client.get(f"/covid/{cid}")
+    assert first.get_json()["country"] == "X"
+    assert client.get(f"/covid/{cid}", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert client.get("/covid/99999").status_code == 404
+
+
+def test_not_modified_runs_no_sql(app, client, auth_header):
+    add(client, auth_header)
+    etag = client.get("/covid").headers["ETag"]
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert client.get("/covid", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements == []
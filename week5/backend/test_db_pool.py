@@ -0,0 +1,76 @@
+import importlib
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import exc as sa_exc
+
+import config
+from app import create_app
+from db_pool import TimedQueuePool, engine_options, normalize_database_url
+from extensions import db
+
+
+def test_sqlite_connections_get_the_tuned_profile(app):
+    with app.app_context():
+        assert isinstance(db.engine.pool, TimedQueuePool)
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+
+
+def test_pool_stats_count_checkouts(client):
+    client.get("/covid")
+    stats = client.get("/db/pool").get_json()["default"]
+    assert stats["checkouts"] >= 1
+    assert stats["timeouts"] == 0
+    assert stats["wait_ms_buckets"]["le_5000"] == stats["checkouts"]
+
+
+def test_exhausted_pool_records_timeout_and_wait():
+    db_fd, db_path = tempfile.mkstemp()
+    test_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "DB_POOL_SIZE": 1,
+        "DB_MAX_OVERFLOW": 0,
+        "DB_POOL_TIMEOUT": 1,
+        "RATELIMIT_STORAGE_URI": "memory://",
+    })
+    try:
+        with test_app.app_context():
+            held = db.engine.connect()
+            with pytest.raises(sa_exc.TimeoutError):
+                db.engine.connect()
+            held.close()
+            stats = db.engine.pool.stats()
+            assert stats["timeouts"] == 1
+            assert stats["wait_ms_max"] >= 1000
+            db.engine.dispose()
+    finally:
+        os.close(db_fd)
+        os.remove(db_path)
+
+
+def test_engine_options_override_and_memory_sqlite():
+    test_app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"echo": False},
+        "RATELIMIT_STORAGE_URI": "memory://",
+    })
+    assert test_app.config["SQLALCHEMY_ENGINE_OPTIONS"] == {"echo": False}
+
+    options = engine_options({**test_app.config, "SQLALCHEMY_DATABASE_URI": "postgresql://u:p@db/week3"})
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_pre_ping"] is True
+
+
+def test_database_url_is_honored(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgres://u:p@db:5432/week3")
+    try:
+        assert importlib.reload(config).Config.SQLALCHEMY_DATABASE_URI == "postgresql://u:p@db:5432/week3"
+    finally:
+        monkeypatch.delenv("DATABASE_URL")
+        importlib.reload(config)
+    assert normalize_database_url("sqlite:///week3.db") == "sqlite:///week3.db"
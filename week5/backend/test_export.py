@@ -0,0 +1,68 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date
+
+import pytest
+
+from extensions import db
+from models import CovidStat
+
+
+@pytest.fixture()
+def rows(app):
+    app.config["EXPORT_BATCH_SIZE"] = 2
+    with app.app_context():
+        db.session.execute(db.insert(CovidStat), [
+            {"country": "Peru" if i % 2 else "USA", "cases": i * 10, "deaths": i, "recovered": i, "active": i,
+             "snapshot_date": date(2024, 1, i + 1)}
+            for i in range(5)
+        ])
+        db.session.commit()
+        return [s.to_dict() for s in db.session.scalars(db.select(CovidStat).order_by(CovidStat.id))]
+
+
+def test_ndjson_streams_every_row_in_batches(client, rows):
+    res = client.get("/covid/export", buffered=False)
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert res.mimetype == "application/x-ndjson"
+    chunks = [chunk for chunk in res.response if chunk]
+    assert len(chunks) == 3
+    assert [json.loads(line) for line in b"".join(chunks).splitlines()] == rows
+
+
+def test_csv_has_header_and_filters(client, rows):
+    res = client.get("/covid/export?format=csv&country=USA&min_cases=10")
+    assert res.mimetype == "text/csv"
+    assert res.headers["Content-Disposition"] == "attachment; filename=covid_stat.csv"
+    parsed = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+    expected = [r for r in rows if r["country"] == "USA" and r["cases"] >= 10]
+    assert [int(r["id"]) for r in parsed] == [r["id"] for r in expected]
+    assert parsed[0]["snapshot_date"] == expected[0]["snapshot_date"]
+    assert parsed[0]["recorded_at"] == expected[0]["recorded_at"]
+
+
+def test_empty_csv_is_just_the_header(client):
+    res = client.get("/covid/export?format=csv")
+    assert res.get_data(as_text=True) == "id,country,cases,deaths,recovered,active,snapshot_date,recorded_at\n"
+
+
+def test_resume_from_after_id(client, rows):
+    res = client.get(f"/covid/export?after_id={rows[2]['id']}")
+    assert [json.loads(line)["id"] for line in res.get_data().splitlines()] == [r["id"] for r in rows[3:]]
+
+
+def test_gzip_when_accepted(client, rows):
+    res = client.get("/covid/export", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert len(gzip.decompress(res.get_data()).splitlines()) == len(rows)
+    plain = client.get("/covid/export", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in plain.headers
+
+
+def test_bad_parameters(client):
+    assert client.get("/covid/export?format=xml").status_code == 400
+    assert client.get("/covid/export?after_id=0").status_code == 400
+    assert client.get("/covid/export?start_date=yesterday").status_code == 400
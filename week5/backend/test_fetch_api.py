@@ -1,31 +1,12 @@
 import pytest
 import requests
-from unittest.mock import patch, MagicMock
 from fetch_api import fetch_and_store_covid_data
 from models import CovidStat
 
-# --- Mock Models & DB ---
-class DummySession:
-    def __init__(self):
-        self.added = []
-        self.committed = False
-    def add(self, obj):
-        self.added.append(obj)
-    def commit(self):
-        self.committed = True
-
-class DummyCovidStat:
-    def __init__(self, country, confirmed, deaths, recovered):
-        self.country = country
-        self.confirmed = confirmed
-        self.deaths = deaths
-        self.recovered = recovered
-
 @pytest.fixture(autouse=True)
-def patch_db(monkeypatch):
-    # Patch db.session and CovidStat inside fetch_api
-    monkeypatch.setattr("fetch_api.db", MagicMock(session=DummySession()))
-    monkeypatch.setattr("fetch_api.CovidStat", DummyCovidStat)
+def fresh_db(app):
+    # fetch_api writes through the real app, so every test gets the clean test DB
+    yield
 
 # --- Mock Responses ---
 class MockResponseValid:
@@ -34,11 +15,20 @@ class MockResponseValid:
     def json(self):
         return {
             "Countries": [
-                {"Country": "USA", "TotalConfirmed": 100, "TotalDeaths": 5, "TotalRecovered": 90},
+                {"Country": "USA", "TotalConfirmed": 100, "TotalDeaths": 5, "TotalRecovered": 90,
+                 "Date": "2020-04-05T06:37:00Z"},
                 {"Country": None, "TotalConfirmed": 50, "TotalDeaths": 2, "TotalRecovered": 40}, # invalid
             ]
         }
 
+class MockResponseLater(MockResponseValid):
+    # Same country and day as MockResponseValid, later in the day
+    def json(self):
+        return {"Countries": [
+            {"Country": "USA", "TotalConfirmed": 120, "TotalDeaths": 6, "TotalRecovered": 90,
+             "Date": "2020-04-05T18:00:00Z"},
+        ]}
+
 class MockResponseInvalid:
     status_code = 200
     def raise_for_status(self): pass
@@ -50,9 +40,32 @@ class MockResponseError:
     def raise_for_status(self): raise requests.HTTPError("500 Server Error")
 
 # --- Tests ---
-def test_fetch_and_store_valid(monkeypatch):
+def test_fetch_and_store_valid(app, monkeypatch):
     monkeypatch.setattr(requests, "get", lambda url: MockResponseValid())
-    fetch_and_store_covid_data()  # should run without exception
+    assert fetch_and_store_covid_data(app) == 1
+    with app.app_context():
+        stat = CovidStat.query.one()
+        assert (stat.country, stat.cases, stat.deaths, stat.recovered, stat.active) == ("USA", 100, 5, 90, 5)
+        assert stat.snapshot_date.isoformat() == "2020-04-05"
+
+def test_fetch_and_store_rerun_updates_in_place(app, monkeypatch):
+    monkeypatch.setattr(requests, "get", lambda url: MockResponseValid())
+    fetch_and_store_covid_data(app)
+    monkeypatch.setattr(requests, "get", lambda url: MockResponseLater())
+    fetch_and_store_covid_data(app)
+    with app.app_context():
+        stat = CovidStat.query.one()
+        assert (stat.cases, stat.deaths, stat.active) == (120, 6, 24)
+
+def test_fetch_and_store_unchanged_keeps_cache_generation(app, monkeypatch):
+    from response_cache import current_generation
+    monkeypatch.setattr(requests, "get", lambda url: MockResponseValid())
+    fetch_and_store_covid_data(app)
+    with app.app_context():
+        generation = current_generation()
+    assert fetch_and_store_covid_data(app) == 0
+    with app.app_context():
+        assert current_generation() == generation
 
 def test_fetch_and_store_invalid_key(monkeypatch):
     monkeypatch.setattr(requests, "get", lambda url: MockResponseInvalid())
@@ -79,4 +92,25 @@ def test_covidstat_to_dict(app):
         assert result["deaths"] == 4
         assert result["recovered"] == 100
         assert result["active"] == 19
-        assert "id" in result
\ No newline at end of file
+        assert "id" in result
+
+def test_upsert_covid_stats_chunks_and_dedupes(app):
+    from datetime import date
+    from extensions import db
+    from ingest import upsert_covid_stats
+    day = date(2021, 1, 1)
+    rows = [{"country": f"C{i}", "snapshot_date": day, "cases": i, "deaths": 0, "recovered": 0, "active": i}
+            for i in range(5)]
+    rows.append({"country": "C0", "snapshot_date": day, "cases": 99, "deaths": 0, "recovered": 0, "active": 99})
+    with app.app_context():
+        assert upsert_covid_stats(rows, chunk_size=2) == 5
+        db.session.commit()
+        assert CovidStat.query.count() == 5
+        assert CovidStat.query.filter_by(country="C0").one().cases == 99
+
+def test_unsupported_databases_are_rejected_at_startup():
+    from ingest import require_upsert_support
+    require_upsert_support({"SQLALCHEMY_DATABASE_URI": "sqlite://", "SQLALCHEMY_BINDS": {"replica": "postgresql://db/covid"}})
+    with pytest.raises(RuntimeError, match="uses mysql"):
+        require_upsert_support({"SQLALCHEMY_DATABASE_URI": "sqlite://",
+                                "SQLALCHEMY_BINDS": {"covid_shard_0": "mysql+pymysql://user:secret@db/covid"}})
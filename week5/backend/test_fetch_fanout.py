@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import upstream
+from models import CovidStat
+
+COUNTRIES = ["USA", "Peru", "Chile", "India", "Italy", "Japan", "Kenya", "Spain"]
+
+
+def country_payload(name):
+    return {"country": name, "cases": 100, "deaths": 1, "recovered": 90, "active": 9}
+
+
+# Local stand-in for disease.sh that sleeps `latency` seconds before answering
+class FakeUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 can drop some of 8 simultaneous connects, which
+    # then retry a second later and make the fan-out look serial
+    request_queue_size = 64
+    latency = 0.0
+    listing = [country_payload(c) for c in COUNTRIES]
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeUpstreamHandler)
+        self.hits = 0
+        self.paths = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/countries"
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits += 1
+        self.server.paths.append(self.path)
+        time.sleep(self.server.latency)
+        name = self.path.rstrip("/").split("/")[-1]
+        if name == "countries":
+            status, body = 200, self.server.listing
+        elif name == "Nowhere":
+            status, body = 404, {"message": "Country not found"}
+        elif name == "Unreported":
+            status, body = 200, {**country_payload(name), "active": "N/A"}
+        elif name == "Garbled":
+            status, body = 200, "<html>Bad Gateway</html>"
+        else:
+            status, body = 200, country_payload(name)
+        payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def fake_upstream(app, monkeypatch):
+    server = FakeUpstream()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(app.config, "COVID_UPSTREAM_URL", server.url)
+    monkeypatch.setitem(app.config, "COVID_FETCH_WORKERS", len(COUNTRIES))
+    upstream.reset()
+    yield server
+    upstream.reset()
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_list_of_countries_saves_all_in_one_go(app, client, fake_upstream):
+    res = client.get("/covid/fetch?countries=USA,Peru,Chile")
+    assert res.status_code == 201
+    assert [d["country"] for d in res.get_json()["data"]] == ["USA", "Peru", "Chile"]
+    with app.app_context():
+        assert sorted(s.country for s in CovidStat.query.all()) == ["Chile", "Peru", "USA"]
+
+
+def test_fetch_all_is_a_single_upstream_call(app, client, fake_upstream):
+    res = client.get("/covid/fetch?countries=all")
+    assert res.status_code == 201
+    assert fake_upstream.hits == 1
+    with app.app_context():
+        assert CovidStat.query.count() == len(COUNTRIES)
+
+
+def test_fetch_all_rejects_a_payload_that_is_not_a_list(client, fake_upstream):
+    fake_upstream.listing = {"message": "rate limited"}
+    res = client.get("/covid/fetch?countries=all")
+    assert res.status_code == 502
+
+
+def test_fetch_quotes_country_names(client, fake_upstream):
+    res = client.get("/covid/fetch?countries=Guinea/Bissau")
+    assert res.status_code == 201
+    assert fake_upstream.paths == ["/countries/Guinea%2FBissau"]
+
+
+def test_fetch_reports_per_country_errors(client, fake_upstream):
+    res = client.get("/covid/fetch?countries=USA,Nowhere")
+    assert res.status_code == 201
+    body = res.get_json()
+    assert [d["country"] for d in body["data"]] == ["USA"]
+    assert "Nowhere" in body["errors"]
+
+
+def test_fetch_reports_non_json_responses(client, fake_upstream):
+    res = client.get("/covid/fetch?countries=USA,Garbled")
+    assert res.status_code == 201
+    body = res.get_json()
+    assert [d["country"] for d in body["data"]] == ["USA"]
+    assert "Garbled" in body["errors"]
+
+
+def test_fetch_reports_counts_that_are_not_numbers(client, fake_upstream):
+    res = client.get("/covid/fetch?countries=USA,Unreported")
+    assert res.status_code == 201
+    body = res.get_json()
+    assert [d["country"] for d in body["data"]] == ["USA"]
+    assert body["errors"] == {"Unreported": "Invalid data format"}
+
+
+def test_fetch_times_out_slow_upstream(client, fake_upstream, monkeypatch, app):
+    fake_upstream.latency = 0.5
+    monkeypatch.setitem(app.config, "COVID_FETCH_TIMEOUT", 0.1)
+    res = client.get("/covid/fetch?countries=USA")
+    assert res.status_code == 502
+
+
+def test_concurrent_fetch_beats_serial(client, fake_upstream, app):
+    fake_upstream.latency = 0.2
+    session = upstream.get_session(len(COUNTRIES))
+
+    start = time.perf_counter()
+    for country in COUNTRIES:
+        upstream.fetch_json(session, f"{fake_upstream.url}/{country}", 5)
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    res = client.get("/covid/fetch?countries=" + ",".join(COUNTRIES))
+    concurrent = time.perf_counter() - start
+
+    assert res.status_code == 201
+    assert concurrent < serial / 3
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import health
+from querycount import assert_max_queries
+
+
+def wait_ready(client, timeout=10):
+    for _ in range(int(timeout / 0.05)):
+        res = client.get("/readyz")
+        if res.status_code == 200:
+            return res
+        time.sleep(0.05)
+    raise AssertionError(f"not ready: {res.get_json()}")
+
+
+def test_healthz_does_not_touch_the_database(client):
+    with assert_max_queries(0, "GET /healthz"):
+        res = client.get("/healthz")
+    assert res.status_code == 200
+    assert res.get_json() == {"status": "ok"}
+
+
+def test_readyz_waits_for_warm_up(app, client, monkeypatch):
+    release = threading.Event()
+    warm_up = health._warm_up
+
+    def slow_warm_up(app):
+        release.wait(5)
+        warm_up(app)
+
+    monkeypatch.setattr(health, "_warm_up", slow_warm_up)
+    res = client.get("/readyz")
+    assert res.status_code == 503
+    assert res.get_json()["status"] == "warming up"
+
+    release.set()
+    body = wait_ready(client).get_json()
+    assert body["status"] == "ready"
+    assert body["warmup"]["done"] and body["database"]["ok"]
+    # The warm-up filled the pool, the analytics series and the /covid cache
+    assert app.extensions["covid_analytics"]["state"] is not None
+    with assert_max_queries(0, "warmed GET /covid"):
+        assert client.get("/covid").status_code == 200
+
+
+def test_db_ping_is_cached(app, client):
+    app.config["HEALTH_DB_PING_TTL"] = 60
+    wait_ready(client)
+    with assert_max_queries(0, "GET /readyz with a cached ping"):
+        assert client.get("/readyz").status_code == 200
+
+
+def test_readyz_fails_while_database_is_down(app, client, monkeypatch):
+    app.config["HEALTH_DB_PING_TTL"] = 0
+    wait_ready(client)
+
+    def down():
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(health, "_ping_database", down)
+    res = client.get("/readyz")
+    assert res.status_code == 503
+    assert res.get_json()["database"]["error"] == "connection refused"
+    # Liveness is unaffected
+    assert client.get("/healthz").status_code == 200
+
+
+def test_failed_warm_up_is_retried(app, client, monkeypatch):
+    app.config["WARMUP_RETRY_SECONDS"] = 0.01
+    calls = []
+    warm_up = health._warm_up
+
+    def flaky_warm_up(app):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database starting up")
+        warm_up(app)
+
+    monkeypatch.setattr(health, "_warm_up", flaky_warm_up)
+    body = wait_ready(client).get_json()
+    assert body["warmup"]["attempts"] == 2
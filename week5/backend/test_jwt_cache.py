@@ -0,0 +1,59 @@
+from app import create_app
+from jwt_cache import VerifiedTokenCache
+
+ROW = {"country": "X", "cases": 1, "deaths": 0, "recovered": 0, "active": 1}
+
+
+def jwt_stats(client):
+    return client.get("/cache/stats").get_json()["jwt"]
+
+
+def test_repeat_requests_hit_the_cache(client, auth_header):
+    for _ in range(3):
+        assert client.post("/covid", json=ROW, headers=auth_header).status_code == 201
+    stats = jwt_stats(client)
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["hit_rate"] > 0.6
+
+
+def test_role_required_uses_cache(client, admin_header, auth_header):
+    cid = client.post("/covid", json=ROW, headers=auth_header).get_json()["id"]
+    assert client.delete("/covid/99999", headers=admin_header).status_code == 404
+    assert client.delete(f"/covid/{cid}", headers=admin_header).status_code == 200
+    assert jwt_stats(client)["hits"] == 1
+
+
+def test_revoked_token_is_rejected_on_cache_hit(client, auth_header):
+    assert client.post("/covid", json=ROW, headers=auth_header).status_code == 201
+    assert client.post("/auth/logout", headers=auth_header).status_code == 200
+    assert client.post("/covid", json=ROW, headers=auth_header).status_code == 401
+
+
+def test_revocation_reaches_other_workers(app, client, auth_header):
+    # A second app on the same database stands in for another gunicorn worker
+    other = create_app({**app.config, "CACHE_TYPE": "SimpleCache"}).test_client()
+    assert other.post("/covid", json=ROW, headers=auth_header).status_code == 201
+    assert client.post("/auth/logout", headers=auth_header).status_code == 200
+    assert other.post("/covid", json=ROW, headers=auth_header).status_code == 401
+
+
+def test_secret_rotation_invalidates_cached_tokens(app, client, auth_header, monkeypatch):
+    assert client.post("/covid", json=ROW, headers=auth_header).status_code == 201
+    monkeypatch.setitem(app.config, "JWT_SECRET_KEY", "rotated-secret")
+    assert client.post("/covid", json=ROW, headers=auth_header).status_code in (401, 422)
+
+
+def test_entries_expire_at_token_exp_and_lru_is_bounded():
+    tokens = VerifiedTokenCache(maxsize=2, max_ttl=300)
+    tokens.put(b"a", {"exp": 105}, now=100)
+    assert tokens.get(b"a", now=104) == {"exp": 105}
+    assert tokens.get(b"a", now=105) is None
+
+    tokens.put(b"expired", {"exp": 99}, now=100)
+    assert tokens.get(b"expired", now=100) is None
+
+    for key in (b"x", b"y", b"z"):
+        tokens.put(key, {}, now=100)
+    assert tokens.get(b"x", now=101) is None
+    assert tokens.stats()["size"] == 2
@@ -0,0 +1,90 @@
+import json
+import logging
+import sys
+import time
+
+import pytest
+
+from flask.logging import default_handler
+
+from app import create_app
+from log_pipeline import BoundedQueueHandler, JsonFormatter, shutdown_logging
+
+
+@pytest.fixture()
+def make_client(tmp_path):
+    log_file = tmp_path / "app.log"
+
+    def make(**overrides):
+        test_app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+            "RATELIMIT_STORAGE_URI": "memory://",
+            "LOG_FILE": str(log_file),
+            **overrides,
+        })
+        return test_app.test_client()
+
+    def lines():
+        shutdown_logging()
+        return [json.loads(line) for line in log_file.read_text().splitlines()]
+
+    make.lines = lines
+    yield make
+    shutdown_logging()
+
+
+def test_access_log_is_json_with_request_id_and_latency(make_client):
+    client = make_client()
+    res = client.get("/", headers={"X-Request-Id": "req-123"})
+    assert res.headers["X-Request-Id"] == "req-123"
+    generated = client.get("/").headers["X-Request-Id"]
+
+    entries = {entry["request_id"]: entry for entry in make_client.lines()}
+    entry = entries["req-123"]
+    assert entry["level"] == "INFO"
+    assert (entry["method"], entry["path"], entry["status"]) == ("GET", "/", 200)
+    assert entry["latency_ms"] >= 0
+    assert generated in entries
+
+
+def test_stderr_is_written_by_the_writer_thread(make_client, capsys):
+    client = make_client()
+    assert default_handler not in client.application.logger.handlers
+    client.get("/", headers={"X-Request-Id": "req-456"})
+    make_client.lines()
+    assert "INFO in log_pipeline" in capsys.readouterr().err
+
+
+def test_4xx_lines_are_sampled(make_client):
+    client = make_client(LOG_4XX_SAMPLE_RATE=0.0)
+    for _ in range(20):
+        assert client.get("/nope").status_code == 404
+    assert client.get("/").status_code == 200
+    assert [entry["status"] for entry in make_client.lines()] == [200]
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = BoundedQueueHandler(maxsize=2)
+    logger = logging.getLogger("test_log_pipeline.full")
+    logger.propagate = False
+    logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(5):
+        logger.warning("line %d", i)
+    assert time.perf_counter() - start < 0.5
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_traceback_is_rendered_on_the_request_thread():
+    handler = BoundedQueueHandler(maxsize=1)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("app", logging.ERROR, __file__, 1, "failed %s", ("x",), sys.exc_info())
+    record.status = 500
+    entry = json.loads(JsonFormatter().format(handler.prepare(record)))
+    assert entry["message"] == "failed x"
+    assert entry["status"] == 500
+    assert "ValueError: boom" in entry["exc"]
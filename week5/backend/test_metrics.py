@@ -0,0 +1,89 @@
+import threading
+
+import upstream
+from metrics import SHARDS, Counter, Histogram
+from test_covid_api import FakeSession
+
+ROW = {"country": "X", "cases": 1, "deaths": 0, "recovered": 0, "active": 1}
+
+
+def sample(client, series):
+    for line in client.get("/metrics").get_data(as_text=True).splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_requests_latency_and_queries_per_endpoint(client, auth_header):
+    requests_series = 'http_requests_total{endpoint="api.get_all_covid",method="GET",status="200"}'
+    latency_series = 'http_request_duration_seconds_count{endpoint="api.get_all_covid",method="GET"}'
+    queries_series = 'db_queries_per_request_count{endpoint="api.add_covid_stat"}'
+    before = [sample(client, s) for s in (requests_series, latency_series, queries_series)]
+
+    client.post("/covid", json=ROW, headers=auth_header)
+    client.get("/covid")
+    client.get("/covid")
+
+    after = [sample(client, s) for s in (requests_series, latency_series, queries_series)]
+    assert after[0] - before[0] == 2
+    assert after[1] - before[1] == 2
+    assert after[2] - before[2] == 1
+    assert sample(client, 'db_queries_total{endpoint="api.add_covid_stat"}') >= 1
+    assert sample(client, 'response_cache_requests_total{result="hit"}') >= 1
+
+
+def test_exposition_format(client):
+    res = client.get("/metrics")
+    assert res.content_type.startswith("text/plain; version=0.0.4")
+    text = res.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'le="+Inf"' in text
+    assert "db_pool_checkouts_total" in text
+    assert "log_records_dropped_total" in text
+
+
+def test_rate_limit_rejections_are_counted(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "RATELIMIT_LOGIN", "1/minute")
+    series = 'rate_limit_rejections_total{endpoint="api.login",limit="1 per 1 minute"}'
+    before = sample(client, series)
+    for _ in range(3):
+        client.post("/auth/login", json={"username": "nobody", "password": "x"})
+    assert sample(client, series) - before == 2
+
+
+def test_upstream_latency_is_observed(client, monkeypatch):
+    monkeypatch.setattr(upstream, "get_session", lambda workers: FakeSession(200, {**ROW, "country": "USA"}))
+    series = 'upstream_fetch_duration_seconds_count{outcome="ok"}'
+    before = sample(client, series)
+    client.get("/covid/fetch?countries=USA,Peru")
+    assert sample(client, series) - before == 2
+
+
+def test_thread_shards_add_up():
+    counter = Counter("test_thread_counter", "test", ("kind",), register=False)
+    histogram = Histogram("test_thread_histogram", "test", (), (0.1, 1), register=False)
+
+    def work():
+        for i in range(1000):
+            counter.inc("a")
+            histogram.observe(0.5 if i % 2 else 5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.values() == {("a",): 4000}
+    assert histogram.values()[()][:3] == [0, 2000, 2000]
+    assert 'test_thread_histogram_bucket{le="1"} 2000' in histogram.render()
+
+
+def test_short_lived_threads_reuse_shards():
+    counter = Counter("test_churn_counter", "test", (), register=False)
+    for _ in range(200):
+        thread = threading.Thread(target=counter.inc)
+        thread.start()
+        thread.join()
+    assert counter.values() == {(): 200}
+    assert len(counter._shards) == SHARDS
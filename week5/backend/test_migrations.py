@@ -0,0 +1,52 @@
+import sqlite3
+from datetime import date, datetime
+
+from extensions import db
+from models import CovidStat
+from snapshots import record_snapshots
+
+# covid_stat as the first release created it (and as instance/week3.db has it)
+OLD_SCHEMA = """
+CREATE TABLE covid_stat (
+    id INTEGER NOT NULL,
+    country VARCHAR(50) NOT NULL,
+    cases INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    recovered INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    PRIMARY KEY (id)
+)
+"""
+
+
+def test_init_db_upgrades_an_old_covid_stat_table(app, client):
+    path = app.config["SQLALCHEMY_DATABASE_URI"].removeprefix("sqlite:///")
+    with app.app_context():
+        db.engine.dispose()
+    with sqlite3.connect(path) as connection:
+        connection.execute("DROP TABLE covid_stat")
+        connection.execute(OLD_SCHEMA)
+        connection.executemany(
+            "INSERT INTO covid_stat (country, cases, deaths, recovered, active) VALUES (?, ?, ?, ?, ?)",
+            [("USA", 10, 1, 5, 4), ("USA", 20, 2, 10, 8), ("Peru", 5, 0, 1, 4)],
+        )
+
+    # `flask init-db` runs inside an app context; the test runner doesn't push one
+    with app.app_context():
+        result = app.test_cli_runner().invoke(args=["init-db"])
+        assert result.exit_code == 0, result.output
+        # Running it again changes nothing
+        assert app.test_cli_runner().invoke(args=["init-db"]).exit_code == 0
+
+    res = client.get("/covid?sort=id")
+    assert res.status_code == 200
+    today = datetime.utcnow().date().isoformat()
+    assert [(r["country"], r["cases"], r["snapshot_date"]) for r in res.get_json()] == [
+        ("USA", 10, None), ("USA", 20, today), ("Peru", 5, today),
+    ]
+    # The upsert's ON CONFLICT needs the new unique index
+    with app.app_context():
+        record_snapshots([{"country": "USA", "snapshot_date": date.fromisoformat(today), "cases": 30,
+                           "deaths": 3, "recovered": 15, "active": 12}])
+        db.session.commit()
+        assert CovidStat.query.filter_by(country="USA").count() == 2
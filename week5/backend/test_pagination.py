@@ -0,0 +1,48 @@
+from extensions import db
+from models import CovidStat
+
+
+def seed(app, rows):
+    with app.app_context():
+        db.session.add_all([
+            CovidStat(country=c, cases=cases, deaths=deaths, recovered=0, active=0)
+            for c, cases, deaths in rows
+        ])
+        db.session.commit()
+
+
+def test_list_paginates_with_after_id(app, client):
+    seed(app, [("C%d" % i, i, i) for i in range(5)])
+    first = client.get("/covid?limit=2")
+    assert first.status_code == 200
+    assert [r["country"] for r in first.get_json()] == ["C0", "C1"]
+    cursor = first.headers["X-Next-After-Id"]
+
+    second = client.get(f"/covid?limit=2&after_id={cursor}")
+    assert [r["country"] for r in second.get_json()] == ["C2", "C3"]
+
+    last = client.get(f"/covid?limit=2&after_id={second.headers['X-Next-After-Id']}")
+    assert [r["country"] for r in last.get_json()] == ["C4"]
+    assert "X-Next-After-Id" not in last.headers
+
+
+def test_list_filters_country_and_ranges(app, client):
+    seed(app, [("USA", 10, 1), ("USA", 50, 5), ("Peru", 50, 5), ("USA", 90, 9)])
+    res = client.get("/covid?country=USA&min_cases=20&max_deaths=9")
+    data = res.get_json()
+    assert [(r["country"], r["cases"]) for r in data] == [("USA", 50), ("USA", 90)]
+
+
+def test_list_sort_desc_with_cursor_breaks_ties_on_id(app, client):
+    seed(app, [("A", 1, 3), ("B", 1, 7), ("C", 1, 7), ("D", 1, 2)])
+    first = client.get("/covid?sort=-deaths&limit=2").get_json()
+    assert [r["country"] for r in first] == ["C", "B"]
+
+    rest = client.get(f"/covid?sort=-deaths&limit=2&after_id={first[-1]['id']}").get_json()
+    assert [r["country"] for r in rest] == ["A", "D"]
+
+
+def test_list_rejects_bad_params(client):
+    assert client.get("/covid?limit=abc").status_code == 400
+    assert client.get("/covid?sort=password").status_code == 400
+    assert client.get("/covid?sort=deaths&after_id=424242").status_code == 400
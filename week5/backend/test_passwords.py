@@ -0,0 +1,64 @@
+import os
+import signal
+
+import pytest
+
+import passwords
+from models import User
+
+
+@pytest.fixture()
+def fresh_pool():
+    passwords.shutdown_pool()
+    yield
+    passwords.shutdown_pool()
+
+
+def stored_hash(app, username):
+    with app.app_context():
+        return User.query.filter_by(username=username).first().password_hash
+
+
+def test_login_rehashes_when_policy_changes(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+    client.post("/auth/register", json={"username": "r", "password": "pw"})
+    assert stored_hash(app, "r").startswith("pbkdf2:sha256:1000$")
+
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:2000")
+    assert client.post("/auth/login", json={"username": "r", "password": "pw"}).status_code == 200
+    assert stored_hash(app, "r").startswith("pbkdf2:sha256:2000$")
+    assert client.post("/auth/login", json={"username": "r", "password": "pw"}).status_code == 200
+
+
+def test_inline_hashing_when_pool_disabled(app, client, monkeypatch, fresh_pool):
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_WORKERS", 0)
+    client.post("/auth/register", json={"username": "i", "password": "pw"})
+    assert client.post("/auth/login", json={"username": "i", "password": "pw"}).status_code == 200
+    assert passwords._executor is None
+
+
+def test_full_queue_returns_503(app, client, monkeypatch, fresh_pool):
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_QUEUE", 0)
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_QUEUE_TIMEOUT", 0.01)
+    client.post("/auth/register", json={"username": "b", "password": "pw"})
+    _, slots = passwords._get_pool(app.config)
+    slots.acquire()
+    try:
+        res = client.post("/auth/login", json={"username": "b", "password": "pw"})
+        assert res.status_code == 503
+    finally:
+        slots.release()
+    assert client.post("/auth/login", json={"username": "b", "password": "pw"}).status_code == 200
+
+
+def test_dead_worker_is_replaced(app, client, monkeypatch, fresh_pool):
+    monkeypatch.setitem(app.config, "PASSWORD_HASH_WORKERS", 1)
+    client.post("/auth/register", json={"username": "d", "password": "pw"})
+    executor, _ = passwords._get_pool(app.config)
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+    assert client.post("/auth/login", json={"username": "d", "password": "pw"}).status_code == 200
+    assert passwords._executor is not executor
+    assert client.post("/auth/login", json={"username": "d", "password": "pw"}).status_code == 200
@@ -0,0 +1,73 @@
+import pstats
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture()
+def profiled_app(app, tmp_path):
+    app.config.update(PROFILE_DIR=str(tmp_path / "profiles"), SLOW_REQUEST_MS=0.001)
+    profiling.clear_slow_requests()
+    yield app
+    profiling.clear_slow_requests()
+
+
+def test_admin_header_writes_a_profile(profiled_app, client, admin_header):
+    res = client.get("/covid", headers={**admin_header, "X-Profile": "1"})
+    assert res.status_code == 200
+    name = res.headers["X-Profile-Artifact"]
+    assert name.endswith(".prof") and "api.get_all_covid" in name
+
+    listed = client.get("/debug/profiles", headers=admin_header).get_json()
+    assert listed[0] == name
+    download = client.get(f"/debug/profiles/{name}", headers=admin_header)
+    assert download.status_code == 200
+    path = profiled_app.config["PROFILE_DIR"] + "/" + name
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_header_is_ignored_for_non_admins(profiled_app, client, auth_header):
+    assert "X-Profile-Artifact" not in client.get("/covid", headers={"X-Profile": "1"}).headers
+    assert "X-Profile-Artifact" not in client.get("/covid", headers={**auth_header, "X-Profile": "1"}).headers
+    with profiled_app.app_context():
+        assert profiling.list_profiles() == []
+    assert client.get("/debug/profiles", headers=auth_header).status_code == 403
+
+
+def test_sample_rate_and_keep_limit(profiled_app, client):
+    profiled_app.config.update(PROFILE_SAMPLE_RATE=1.0, PROFILE_KEEP=2)
+    names = [client.get("/").headers["X-Profile-Artifact"] for _ in range(3)]
+    with profiled_app.app_context():
+        assert profiling.list_profiles() == sorted(names, reverse=True)[:2]
+
+
+def test_slow_requests_keep_their_sql(profiled_app, client, auth_header, admin_header):
+    client.post("/covid", json={"country": "X", "cases": 1, "deaths": 0, "recovered": 0, "active": 1},
+                headers=auth_header)
+    entries = client.get("/debug/slow-requests", headers=admin_header).get_json()
+    post = next(e for e in entries if e["endpoint"] == "api.add_covid_stat")
+    assert post["status"] == 201
+    assert post["db_queries"] == len(post["statements"]) >= 1
+    assert any(s["sql"].startswith("INSERT INTO covid_stat") for s in post["statements"])
+    assert all(s["ms"] >= 0 for s in post["statements"])
+    assert client.get("/debug/slow-requests", headers=auth_header).status_code == 403
+
+
+def test_fast_requests_are_not_kept(profiled_app, client, admin_header):
+    profiled_app.config["SLOW_REQUEST_MS"] = 60000
+    profiling.clear_slow_requests()
+    client.get("/covid")
+    assert client.get("/debug/slow-requests", headers=admin_header).get_json() == []
+
+
+def test_teardown_releases_the_profiler(profiled_app):
+    profiled_app.config["PROFILE_SAMPLE_RATE"] = 1.0
+    # after_request never runs when an exception escapes the error handlers
+    with profiled_app.test_request_context("/"):
+        profiling.start_request()
+        assert "profiler" in profiling.g
+        profiling.teardown_request(RuntimeError("boom"))
+        assert "profiler" not in profiling.g
+    assert profiling._profile_lock.acquire(blocking=False)
+    profiling._profile_lock.release()
@@ -0,0 +1,84 @@
+import pytest
+
+from querycount import QueryBudgetExceeded, QueryRecorder, assert_max_queries, query_budget, request_queries
+
+ROW = {"country": "X", "cases": 10, "deaths": 1, "recovered": 2, "active": 7}
+
+
+@pytest.fixture()
+def record_ids(client, auth_header):
+    ids = []
+    for i in range(3):
+        res = client.post("/covid", json={**ROW, "country": f"C{i}", "cases": 10 + i}, headers=auth_header)
+        ids.append(res.get_json()["id"])
+    return ids
+
+
+def test_list_covid_budget(client, record_ids):
+    with assert_max_queries(1, "GET /covid"):
+        assert client.get("/covid").status_code == 200
+    with assert_max_queries(1, "GET /covid sorted after a cursor"):
+        res = client.get(f"/covid?sort=-cases&after_id={record_ids[-1]}")
+    assert [r["id"] for r in res.get_json()] == record_ids[-2::-1]
+
+
+def test_missing_cursor_still_rejected(client, record_ids):
+    assert client.get("/covid?sort=cases&after_id=424242").status_code == 400
+
+
+def test_get_covid_budget(client, record_ids):
+    with assert_max_queries(1, "GET /covid/<id>"):
+        assert client.get(f"/covid/{record_ids[0]}").status_code == 200
+
+
+# Authenticated writes also read the revoked-token table
+@query_budget(2)
+def post_covid(client, auth_header):
+    return client.post("/covid", json=ROW, headers=auth_header)
+
+
+def test_post_covid_budget(client, auth_header):
+    res = post_covid(client, auth_header)
+    assert res.status_code == 201
+    assert client.get(f"/covid/{res.get_json()['id']}").get_json()["country"] == "X"
+
+
+def test_update_covid_budget(client, record_ids):
+    with assert_max_queries(1, "PUT /covid/<id>"):
+        assert client.put(f"/covid/{record_ids[0]}", json={"cases": 99}).status_code == 200
+    assert client.get(f"/covid/{record_ids[0]}").get_json()["cases"] == 99
+    with assert_max_queries(1, "PUT /covid/<missing>"):
+        assert client.put("/covid/424242", json={"cases": 1}).status_code == 404
+
+
+def test_delete_covid_budget(client, record_ids, admin_header):
+    with assert_max_queries(2, "DELETE /covid/<id>"):
+        assert client.delete(f"/covid/{record_ids[0]}", headers=admin_header).status_code == 200
+    assert client.get(f"/covid/{record_ids[0]}").status_code == 404
+    assert client.delete(f"/covid/{record_ids[0]}", headers=admin_header).status_code == 404
+
+
+def test_budget_failure_lists_statements(app):
+    from extensions import db
+
+    with app.app_context():
+        with pytest.raises(QueryBudgetExceeded) as info:
+            with assert_max_queries(1, "two selects"):
+                db.session.execute(db.text("SELECT 1"))
+                db.session.execute(db.text("SELECT 2"))
+    message = str(info.value)
+    assert "two selects ran 2 queries, budget is 1" in message
+    assert "1. SELECT 1" in message and "2. SELECT 2" in message
+
+
+def test_recorder_and_request_queries(app):
+    from extensions import db
+
+    with app.test_request_context("/"):
+        app.preprocess_request()
+        with QueryRecorder() as recorder:
+            db.session.execute(db.text("SELECT 1"))
+        queries = request_queries()
+    assert recorder.count == 1
+    assert queries["count"] == 1
+    assert queries["statements"][0][0] == "SELECT 1"
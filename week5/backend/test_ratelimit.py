@@ -0,0 +1,113 @@
+import os
+import tempfile
+
+import pytest
+from limits import parse
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from app import create_app
+from extensions import db
+from ratelimit import SQLiteStorage
+
+ROW = {"country": "X", "cases": 1, "deaths": 0, "recovered": 0, "active": 1}
+
+
+@pytest.fixture()
+def storage_path():
+    fd, path = tempfile.mkstemp()
+    yield path
+    os.close(fd)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def test_sliding_window_is_shared_between_workers(storage_path):
+    # Two storages on one file behave like two gunicorn workers
+    worker_a = SlidingWindowCounterRateLimiter(SQLiteStorage(f"sqlite:///{storage_path}"))
+    worker_b = SlidingWindowCounterRateLimiter(SQLiteStorage(f"sqlite:///{storage_path}"))
+    limit = parse("3/minute")
+
+    assert worker_a.hit(limit, "ip")
+    assert worker_a.hit(limit, "ip")
+    assert worker_b.hit(limit, "ip")
+    assert not worker_b.hit(limit, "ip")
+    assert not worker_a.hit(limit, "ip")
+    assert worker_a.hit(limit, "other-ip")
+
+    stats = worker_b.get_window_stats(limit, "ip")
+    assert stats.remaining == 0
+    worker_a.clear(limit, "ip")
+    assert worker_b.hit(limit, "ip")
+
+
+def test_previous_window_is_weighted(storage_path, monkeypatch):
+    clock = {"now": 600.0}
+    monkeypatch.setattr("ratelimit.time", type("Clock", (), {"time": staticmethod(lambda: clock["now"])}))
+    storage = SQLiteStorage(f"sqlite:///{storage_path}")
+
+    assert all(storage.acquire_sliding_window_entry("k", 10, 60) for _ in range(10))
+    assert not storage.acquire_sliding_window_entry("k", 10, 60)
+
+    # Halfway through the next window the previous one still counts for half
+    clock["now"] = 690.0
+    prev_count, prev_ttl, curr_count, _ = storage.get_sliding_window("k", 60)
+    assert (prev_count, prev_ttl, curr_count) == (10, 30.0, 0)
+    assert all(storage.acquire_sliding_window_entry("k", 10, 60) for _ in range(5))
+    assert not storage.acquire_sliding_window_entry("k", 10, 60)
+
+
+def test_fixed_window_counters(storage_path):
+    storage = SQLiteStorage(f"sqlite:///{storage_path}")
+    assert storage.incr("k", 60) == 1
+    assert storage.incr("k", 60, amount=2) == 3
+    assert storage.get("k") == 3
+    assert storage.get_expiry("k") > 0
+    storage.clear("k")
+    assert storage.get("k") == 0
+    assert storage.check()
+
+
+@pytest.fixture()
+def limited_client(storage_path):
+    db_fd, db_path = tempfile.mkstemp()
+    test_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "JWT_SECRET_KEY": "test-jwt",
+        "RATELIMIT_STORAGE_URI": f"sqlite:///{storage_path}",
+        "RATELIMIT_LOGIN": "3/minute",
+        "RATELIMIT_WRITE": "2/minute",
+    })
+    with test_app.app_context():
+        db.create_all(bind_key=None)
+    yield test_app.test_client()
+    with test_app.app_context():
+        db.engine.dispose()
+    os.close(db_fd)
+    os.remove(db_path)
+
+
+def token(client, username):
+    client.post("/auth/register", json={"username": username, "password": "pw"})
+    res = client.post("/auth/login", json={"username": username, "password": "pw"})
+    return {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+
+
+def test_login_limit_is_per_address(limited_client):
+    for username in ("u1", "u2", "u3"):
+        token(limited_client, username)
+    res = limited_client.post("/auth/login", json={"username": "u1", "password": "pw"})
+    assert res.status_code == 429
+    assert "X-RateLimit-Limit" in res.headers
+
+
+def test_write_limit_is_per_identity_and_route(limited_client):
+    alice, bob = token(limited_client, "alice"), token(limited_client, "bob")
+    for _ in range(2):
+        assert limited_client.post("/covid", json=ROW, headers=alice).status_code == 201
+    assert limited_client.post("/covid", json=ROW, headers=alice).status_code == 429
+    # Same address, different user: separate quota
+    assert limited_client.post("/covid", json=ROW, headers=bob).status_code == 201
+    # Other routes keep their own counters
+    assert limited_client.get("/covid", headers=alice).status_code == 200
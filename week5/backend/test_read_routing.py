@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+import pytest
+
+from app import create_app
+from extensions import db
+from models import CovidStat
+from routing import PRIMARY_HEADER
+
+ROW = {"country": "Primary", "cases": 1, "deaths": 0, "recovered": 0, "active": 1}
+
+
+# Two SQLite files stand in for the primary and its replica. The replica is
+# never written by the app, so rows only it holds show which bind served a read.
+@pytest.fixture()
+def make_replica_app():
+    apps, paths = [], []
+
+    def make(**overrides):
+        (pfd, primary), (rfd, replica) = tempfile.mkstemp(), tempfile.mkstemp()
+        paths.extend([(pfd, primary), (rfd, replica)])
+        test_app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{primary}",
+            "SQLALCHEMY_BINDS": {"replica": f"sqlite:///{replica}"},
+            "CACHE_TYPE": "NullCache",
+            "DB_REPLICA_LAG": 0,
+            "READ_YOUR_WRITES_SECONDS": 5,
+            "JWT_SECRET_KEY": "test-jwt",
+            "RATELIMIT_STORAGE_URI": "memory://",
+            **overrides,
+        })
+        with test_app.app_context():
+            db.create_all(bind_key=None)
+            db.metadata.create_all(db.engines["replica"])
+            with db.engines["replica"].begin() as conn:
+                conn.execute(CovidStat.__table__.insert(), [{**ROW, "country": "ReplicaOnly"}])
+        apps.append(test_app)
+        return test_app
+
+    yield make
+    for test_app in apps:
+        with test_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+    for fd, path in paths:
+        os.close(fd)
+        os.remove(path)
+
+
+@pytest.fixture()
+def replica_app(make_replica_app):
+    return make_replica_app()
+
+
+def countries(client, path="/covid", headers=None):
+    return [row["country"] for row in client.get(path, headers=headers).get_json()]
+
+
+def login(client):
+    client.post("/auth/register", json={"username": "u1", "password": "p1"})
+    token = client.post("/auth/login", json={"username": "u1", "password": "p1"}).get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+# The header a client echoes after its write, as the week4 SPA does
+def pin(response):
+    return {PRIMARY_HEADER: response.headers[PRIMARY_HEADER]}
+
+
+def test_reads_go_to_replica_and_auth_to_primary(replica_app):
+    client = replica_app.test_client()
+    assert countries(client) == ["ReplicaOnly"]
+    assert client.get("/covid/1").get_json()["country"] == "ReplicaOnly"
+    # register/login only work if /auth/* ran on the primary
+    assert "Authorization" in login(client)
+
+
+def test_writer_reads_its_own_writes(replica_app):
+    writer = replica_app.test_client()
+    res = writer.post("/covid", json=ROW, headers=login(writer))
+    assert res.status_code == 201
+    assert PRIMARY_HEADER in res.headers["Access-Control-Expose-Headers"]
+
+    assert countries(writer, headers=pin(res)) == ["Primary"]
+    assert countries(writer) == ["ReplicaOnly"]
+    assert countries(replica_app.test_client()) == ["ReplicaOnly"]
+
+
+def test_window_expires(replica_app):
+    writer = replica_app.test_client()
+    writer.post("/covid", json=ROW, headers=login(writer))
+    assert countries(writer, headers={PRIMARY_HEADER: "0"}) == ["ReplicaOnly"]
+    assert countries(writer, headers={PRIMARY_HEADER: "soon"}) == ["ReplicaOnly"]
+
+
+def test_pinned_read_skips_a_replica_built_cache_entry(make_replica_app):
+    replica_app = make_replica_app(CACHE_TYPE="SimpleCache")
+    writer = replica_app.test_client()
+    res = writer.post("/covid", json=ROW, headers=login(writer))
+    # Another client fills the cache for the new generation from the replica
+    assert countries(replica_app.test_client()) == ["ReplicaOnly"]
+    assert countries(replica_app.test_client()) == ["ReplicaOnly"]
+    assert countries(writer, headers=pin(res)) == ["Primary"]
+
+
+def test_recent_write_keeps_everyone_on_primary(make_replica_app):
+    replica_app = make_replica_app(CACHE_TYPE="SimpleCache", DB_REPLICA_LAG=60)
+    writer = replica_app.test_client()
+    writer.post("/covid", json=ROW, headers=login(writer))
+    assert countries(replica_app.test_client()) == ["Primary"]
+
+
+def test_no_replica_means_no_routing(client, auth_header):
+    res = client.post("/covid", json=ROW, headers=auth_header)
+    assert res.status_code == 201
+    assert PRIMARY_HEADER not in res.headers
+    assert countries(client) == ["Primary"]
@@ -0,0 +1,64 @@
+import pytest
+
+from extensions import db
+from models import CovidStat
+from response_cache import require_shared_cache
+
+
+def stats(client):
+    return client.get("/cache/stats").get_json()
+
+
+def test_repeat_reads_hit_the_cache(client, auth_header):
+    client.post("/covid", json={"country":"X","cases":1,"deaths":1,"recovered":0,"active":0}, headers=auth_header)
+    first = client.get("/covid?limit=10&country=X")
+    second = client.get("/covid?country=X&limit=10")
+    assert first.get_json() == second.get_json()
+    assert stats(client)["hits"] == 1
+    assert stats(client)["misses"] == 1
+
+
+def test_cached_read_serves_snapshot_until_a_write(app, client, auth_header):
+    assert client.get("/covid").get_json() == []
+    # Writes that bypass the API are not seen until the generation moves
+    with app.app_context():
+        db.session.add(CovidStat(country="Y", cases=1, deaths=0, recovered=0, active=1))
+        db.session.commit()
+    assert client.get("/covid").get_json() == []
+
+    client.post("/covid", json={"country":"Z","cases":1,"deaths":1,"recovered":0,"active":0}, headers=auth_header)
+    assert [r["country"] for r in client.get("/covid").get_json()] == ["Y", "Z"]
+
+
+def test_update_and_delete_invalidate(client, auth_header, admin_header):
+    cid = client.post("/covid", json={"country":"U","cases":1,"deaths":0,"recovered":0,"active":1}, headers=auth_header).get_json()["id"]
+    assert client.get("/covid").get_json()[0]["cases"] == 1
+
+    client.put(f"/covid/{cid}", json={"cases": 5}, headers=auth_header)
+    assert client.get("/covid").get_json()[0]["cases"] == 5
+
+    client.delete(f"/covid/{cid}", headers=admin_header)
+    assert client.get("/covid").get_json() == []
+
+
+def test_pagination_header_is_cached(app, client):
+    with app.app_context():
+        db.session.add_all([CovidStat(country=f"C{i}", cases=i, deaths=0, recovered=0, active=0) for i in range(3)])
+        db.session.commit()
+    first = client.get("/covid?limit=2")
+    second = client.get("/covid?limit=2")
+    assert second.headers["X-Next-After-Id"] == first.headers["X-Next-After-Id"]
+    assert stats(client)["hits"] == 1
+
+
+def test_invalid_params_bypass_cache(client):
+    assert client.get("/covid?limit=oops").status_code == 400
+    assert stats(client)["hits"] == 0
+    assert stats(client)["misses"] == 0
+
+
+def test_per_process_cache_needs_a_single_worker():
+    require_shared_cache("SimpleCache", 1)
+    require_shared_cache("RedisCache", 4)
+    with pytest.raises(RuntimeError, match="GUNICORN_WORKERS=1"):
+        require_shared_cache("SimpleCache", 4)
@@ -0,0 +1,49 @@
+import json
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+from extensions import db
+from models import CovidStat
+from queries import get_covid_row
+from serialization import COVID_STAT_FIELDS, covid_stat_row
+
+
+def test_column_rows_match_to_dict(app):
+    with app.app_context():
+        stat = CovidStat(country="X", cases=3, deaths=1, recovered=1, active=1,
+                         snapshot_date=date(2024, 1, 2), recorded_at=datetime(2024, 1, 2, 3, 4, 5, 6))
+        db.session.add(stat)
+        db.session.commit()
+        row = get_covid_row(stat.id)
+        assert tuple(row._fields) == COVID_STAT_FIELDS
+        assert covid_stat_row(row) == stat.to_dict()
+        assert covid_stat_row(row)["recorded_at"] == "2024-01-02T03:04:05.000006"
+
+
+def test_list_and_detail_share_the_schema(client, auth_header):
+    client.post("/covid", json={"country": "X", "cases": 3, "deaths": 1, "recovered": 1, "active": 1},
+                headers=auth_header)
+    listed = client.get("/covid").get_json()
+    assert list(listed[0]) == sorted(COVID_STAT_FIELDS)
+    assert client.get(f"/covid/{listed[0]['id']}").get_json() == listed[0]
+    assert client.get("/covid/99999").status_code == 404
+
+
+def test_fast_provider_matches_flask_encoder(app, monkeypatch):
+    payload = {"b": [1, 2.5, None, True], "a": "é 🚀", "day": date(2024, 1, 2)}
+    with app.app_context():
+        expected = DefaultJSONProvider(app).response(payload).get_data()
+        fast = app.json.response(payload).get_data()
+        assert json.loads(fast) == json.loads(expected)
+        assert json.loads(fast)["day"] == "Tue, 02 Jan 2024 00:00:00 GMT"
+        assert fast.index(b'"a"') < fast.index(b'"b"') < fast.index(b'"day"')
+
+        monkeypatch.setattr(serialization, "orjson", None)
+        assert app.json.response(payload).get_data() == expected
+
+
+def test_unencodable_values_fall_back_to_the_stdlib(app):
+    with app.app_context():
+        assert json.loads(app.json.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
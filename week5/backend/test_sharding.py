@@ -0,0 +1,214 @@
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+from app import create_app
+from extensions import db
+from models import CovidStat
+from querycount import assert_max_queries
+from sharding import init_shards, shard_engine, shard_index
+from snapshots import record_snapshots
+
+SHARDS = 3
+COUNTRIES = ["USA", "Peru", "India", "Chile", "Kenya", "Spain", "Japan", "Brazil"]
+
+
+@pytest.fixture()
+def sharded_app():
+    paths = [tempfile.mkstemp()[1] for _ in range(SHARDS + 1)]
+    test_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{paths[0]}",
+        "COVID_SHARD_URLS": [f"sqlite:///{path}" for path in paths[1:]],
+        "SHARD_ID_BLOCK": 5,
+        "JWT_SECRET_KEY": "test-jwt",
+        "RATELIMIT_STORAGE_URI": "memory://",
+    })
+    with test_app.app_context():
+        db.create_all(bind_key=None)
+        init_shards()
+    yield test_app
+    with test_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    for path in paths:
+        os.remove(path)
+
+
+@pytest.fixture()
+def sharded_client(sharded_app):
+    return sharded_app.test_client()
+
+
+def snapshots():
+    rows = []
+    for n, country in enumerate(COUNTRIES):
+        for day in range(1, 6):
+            cases = 100 * (n + 1) + 10 * day
+            rows.append({"country": country, "snapshot_date": date(2021, 1, day), "cases": cases,
+                         "deaths": cases // 10, "recovered": cases // 2, "active": cases - cases // 10 - cases // 2})
+    return rows
+
+
+def seed(app):
+    with app.app_context():
+        for day in range(1, 6):
+            record_snapshots([row for row in snapshots() if row["snapshot_date"].day == day],
+                             recorded_at=datetime(2021, 1, day))
+            db.session.commit()
+
+
+def shard_rows(app, index):
+    with app.app_context():
+        with shard_engine(index).connect() as connection:
+            return connection.execute(db.select(CovidStat.id, CovidStat.country)).all()
+
+
+def test_rows_live_on_their_country_shard(sharded_app, sharded_client):
+    seed(sharded_app)
+    ids = set()
+    with sharded_app.app_context():
+        for index in range(SHARDS):
+            for record_id, country in shard_rows(sharded_app, index):
+                assert shard_index(country) == index
+                assert record_id not in ids
+                ids.add(record_id)
+        assert len(ids) == len(snapshots())
+        # Nothing is written to the primary's own table
+        assert CovidStat.query.count() == 0
+
+
+def walk(client, query, limit=7):
+    rows, after_id = [], None
+    while True:
+        url = f"/covid?limit={limit}&{query}" + (f"&after_id={after_id}" if after_id else "")
+        res = client.get(url)
+        assert res.status_code == 200
+        rows += res.get_json()
+        after_id = res.headers.get("X-Next-After-Id")
+        if after_id is None:
+            return rows
+
+
+@pytest.mark.parametrize("sort", ["id", "-id", "cases", "-deaths", "country", "-country"])
+def test_keyset_pagination_across_shards(sharded_app, sharded_client, sort):
+    seed(sharded_app)
+    everything = walk(sharded_client, "sort=id", limit=1000)
+    field = sort.lstrip("-")
+    expected = sorted(everything, key=lambda r: (r[field], r["id"]), reverse=sort.startswith("-"))
+    assert walk(sharded_client, f"sort={sort}") == expected
+
+
+def test_single_country_reads_one_shard(sharded_app, sharded_client):
+    seed(sharded_app)
+    with assert_max_queries(1, "GET /covid?country=Peru"):
+        rows = sharded_client.get("/covid?country=Peru&sort=-cases").get_json()
+    assert [r["cases"] for r in rows] == [250, 240, 230, 220, 210]
+    # Statements run on the shard pool still count for the request
+    with assert_max_queries(SHARDS) as recorder:
+        sharded_client.get("/covid?sort=-cases&limit=5")
+    assert recorder.count == SHARDS
+    assert sharded_client.get("/covid?sort=cases&after_id=424242").status_code == 400
+
+
+def test_crud_by_id(sharded_app, sharded_client):
+    row = {"country": "Peru", "cases": 5, "deaths": 1, "recovered": 2, "active": 2}
+    record_id = sharded_client.post("/covid", json=row, headers=login(sharded_client)).get_json()["id"]
+    assert sharded_client.get(f"/covid/{record_id}").get_json()["country"] == "Peru"
+
+    # A new country can move the row to another shard; it keeps its id
+    other = next(c for c in COUNTRIES if shard_index_for(sharded_app, c) != shard_index_for(sharded_app, "Peru"))
+    assert sharded_client.put(f"/covid/{record_id}", json={"country": other, "cases": 6}).status_code == 200
+    moved = sharded_client.get(f"/covid/{record_id}").get_json()
+    assert (moved["country"], moved["cases"], moved["deaths"]) == (other, 6, 1)
+    assert [r for r in shard_rows(sharded_app, shard_index_for(sharded_app, other))] == [(record_id, other)]
+    assert shard_rows(sharded_app, shard_index_for(sharded_app, "Peru")) == []
+
+    assert sharded_client.put("/covid/424242", json={"cases": 1}).status_code == 404
+    admin = login(sharded_client, sharded_app, admin=True)
+    assert sharded_client.delete(f"/covid/{record_id}", headers=admin).status_code == 200
+    assert sharded_client.get(f"/covid/{record_id}").status_code == 404
+    assert sharded_client.delete(f"/covid/{record_id}", headers=admin).status_code == 404
+
+
+def test_batch_stays_on_one_shard(sharded_app, sharded_client):
+    admin = login(sharded_client, sharded_app, admin=True)
+    by_shard = {}
+    for country in COUNTRIES:
+        by_shard.setdefault(shard_index_for(sharded_app, country), []).append(country)
+    # The fullest shard has at least three of the eight countries
+    (home, local), (_, remote) = sorted(by_shard.items(), key=lambda kv: -len(kv[1]))[:2]
+    item = lambda country: {"country": country, "cases": 1, "deaths": 0, "recovered": 0, "active": 1}
+
+    # Shards commit separately, so a batch that spans them is rejected whole
+    res = sharded_client.post("/covid/batch", json=[item(local[0]), item(remote[0])], headers=admin)
+    assert res.status_code == 400
+    assert res.get_json()["results"] == [{"index": 1, "error": "batch spans several shards; send one batch per shard"}]
+    assert walk(sharded_client, "sort=id") == []
+
+    created = sharded_client.post("/covid/batch", json=[item(c) for c in local], headers=admin).get_json()["results"]
+    ids = [r["id"] for r in created]
+    assert len(set(ids)) == len(local)
+    assert sorted(r[0] for r in shard_rows(sharded_app, home)) == sorted(ids)
+
+    res = sharded_client.patch("/covid/batch", json=[{"id": ids[0], "country": remote[0]}], headers=admin)
+    assert res.get_json()["results"][0]["error"] == f"update would move record {ids[0]} to another shard"
+
+    res = sharded_client.patch("/covid/batch", json=[
+        {"id": ids[0], "cases": 9},
+        {"id": ids[1], "country": local[0]},
+        {"id": ids[1], "op": "delete"},
+    ], headers=admin)
+    assert res.status_code == 200
+    assert [r["status"] for r in res.get_json()["results"]] == ["updated", "updated", "deleted"]
+    rows = {r["id"]: r for r in walk(sharded_client, "sort=id")}
+    assert rows[ids[0]]["cases"] == 9
+    assert ids[1] not in rows
+    assert sharded_client.delete("/covid/batch", json=[{"id": 424242}], headers=admin).status_code == 400
+
+
+def test_scatter_gather_matches_single_database(app, client, sharded_app, sharded_client):
+    seed(app)
+    seed(sharded_app)
+    for url in [
+        "/covid/aggregate",
+        "/covid/aggregate?group_by=day",
+        "/covid/aggregate?group_by=week&metrics=cases,deaths",
+        "/covid/aggregate?group_by=month&country=India",
+        "/covid/top?by=cases&n=3",
+        "/covid/top?by=deaths&date=2021-01-03",
+        "/covid/analytics?country=USA,Kenya",
+    ]:
+        assert sharded_client.get(url).get_json() == client.get(url).get_json(), url
+
+    strip = lambda rows: [{k: v for k, v in r.items() if k != "id"} for r in rows]
+    assert strip(walk(sharded_client, "sort=-cases")) == strip(walk(client, "sort=-cases"))
+
+
+def test_export_is_in_id_order(sharded_app, sharded_client):
+    sharded_app.config["EXPORT_BATCH_SIZE"] = 4
+    seed(sharded_app)
+    lines = sharded_client.get("/covid/export?format=ndjson&after_id=3").get_data(as_text=True).splitlines()
+    ids = [json.loads(line)["id"] for line in lines]
+    assert ids == sorted(ids) and ids[0] > 3
+    assert len(ids) == len([r for r in walk(sharded_client, "sort=id") if r["id"] > 3])
+
+
+def shard_index_for(app, country):
+    with app.app_context():
+        return shard_index(country)
+
+
+def login(client, app=None, admin=False):
+    username = "admin" if admin else "u1"
+    client.post("/auth/register", json={"username": username, "password": "p1"})
+    if admin:
+        from models import User
+        with app.app_context():
+            User.query.filter_by(username=username).one().role = "admin"
+            db.session.commit()
+    token = client.post("/auth/login", json={"username": username, "password": "p1"}).get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
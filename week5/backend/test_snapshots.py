@@ -0,0 +1,73 @@
+from datetime import date, datetime
+
+import upstream
+from extensions import db
+from models import CovidDailyRollup, CovidStat, CovidWeeklyRollup
+from snapshots import record_snapshots
+
+
+def snap(day, cases, deaths=0, recovered=0, country="USA"):
+    return {"country": country, "snapshot_date": day, "cases": cases, "deaths": deaths,
+            "recovered": recovered, "active": cases - deaths - recovered}
+
+
+def record(app, *rows):
+    with app.app_context():
+        result = record_snapshots(list(rows), recorded_at=datetime(2021, 1, 1, 12))
+        db.session.commit()
+        return result
+
+
+def test_unchanged_snapshot_is_deduplicated(app):
+    record(app, snap(date(2021, 1, 4), 100))
+    stored, skipped = record(app, snap(date(2021, 1, 5), 100))
+    assert stored == [] and skipped == ["USA"]
+    with app.app_context():
+        assert CovidStat.query.count() == 1
+        assert CovidStat.query.one().content_hash
+
+
+def test_rollups_accumulate_deltas_incrementally(app):
+    record(app, snap(date(2021, 1, 4), 100, deaths=1))
+    record(app, snap(date(2021, 1, 4), 110, deaths=2))
+    record(app, snap(date(2021, 1, 5), 130, deaths=4))
+    record(app, snap(date(2021, 1, 11), 200, deaths=5))
+    with app.app_context():
+        days = {r.day: r for r in CovidDailyRollup.query.all()}
+        assert (days[date(2021, 1, 4)].cases, days[date(2021, 1, 4)].new_cases, days[date(2021, 1, 4)].samples) == (110, 10, 2)
+        assert (days[date(2021, 1, 5)].new_cases, days[date(2021, 1, 5)].new_deaths) == (20, 2)
+        weeks = {r.week_start: r for r in CovidWeeklyRollup.query.all()}
+        assert (weeks[date(2021, 1, 4)].cases, weeks[date(2021, 1, 4)].new_cases, weeks[date(2021, 1, 4)].samples) == (130, 30, 3)
+        assert weeks[date(2021, 1, 11)].new_cases == 70
+        # Same-day snapshots update the raw row in place
+        assert CovidStat.query.count() == 3
+
+
+def test_history_reads_rollups(app, client):
+    record(app, snap(date(2021, 1, 4), 100), snap(date(2021, 1, 4), 5, country="Peru"))
+    record(app, snap(date(2021, 1, 12), 150))
+    daily = client.get("/covid/history?country=USA&start_date=2021-01-05").get_json()
+    assert [(r["day"], r["cases"], r["new_cases"]) for r in daily] == [("2021-01-12", 150, 50)]
+    weekly = client.get("/covid/history?granularity=week&end_date=2021-01-10").get_json()
+    assert [(r["week_start"], r["country"]) for r in weekly] == [("2021-01-04", "Peru"), ("2021-01-04", "USA")]
+    assert client.get("/covid/history?granularity=hour").status_code == 400
+
+
+def test_live_fetch_records_timestamped_snapshot_once(app, client, monkeypatch):
+    payload = {"country": "USA", "cases": 10, "deaths": 1, "recovered": 5, "active": 4}
+
+    class Session:
+        def get(self, url, timeout=None):
+            class Resp:
+                status_code = 200
+                def json(self): return payload
+            return Resp()
+
+    monkeypatch.setattr(upstream, "get_session", lambda workers: Session())
+    assert client.get("/covid/fetch").get_json()["skipped"] == []
+    assert client.get("/covid/fetch").get_json()["skipped"] == ["USA"]
+    with app.app_context():
+        stat = CovidStat.query.one()
+        assert stat.recorded_at is not None
+        assert stat.snapshot_date == datetime.utcnow().date()
+        assert CovidDailyRollup.query.one().samples == 1
@@ -1,11 +1,13 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, current_app, jsonify, request
 from config import Config
 from extensions import db
+import click
 import requests
 from models import CovidStat, User
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 import os
 from utils import role_required
+from health import readiness
 import logging
 from logging.handlers import RotatingFileHandler
 from flask_cors import CORS
@@ -14,20 +16,41 @@ from flask_limiter.util import get_remote_address
 from flask_caching import Cache
 
 
-app = Flask(__name__)
-app.config.from_object(Config)
-app.config["JWT_IDENTITY_CLAIM"] = "user_id"
-db.init_app(app)
-CORS(app, resources={r"/*": {"origins": "*"}})
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-jwt-secret")
-jwt = JWTManager(app)
-limiter = Limiter(get_remote_address, app=app, default_limits=["200/day", "50/hour"])
-cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
+api = Blueprint("api", __name__)
+jwt = JWTManager()
+limiter = Limiter(get_remote_address, default_limits=["200/day", "50/hour"])
+cache = Cache(config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
 
 
-handler = RotatingFileHandler("week3.log", maxBytes=1000000, backupCount=3)
-handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
+# One-time schema setup, run before the server starts: flask --app wsgi init-db
+@click.command("init-db")
+def init_db_command():
+    db.create_all()
+    click.echo("Initialized the database.")
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["JWT_IDENTITY_CLAIM"] = "user_id"
+    app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-jwt-secret")
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    jwt.init_app(app)
+    limiter.init_app(app)
+    cache.init_app(app)
+
+    if not any(isinstance(h, RotatingFileHandler) for h in app.logger.handlers):
+        handler = RotatingFileHandler("week3.log", maxBytes=1000000, backupCount=3)
+        handler.setLevel(logging.INFO)
+        app.logger.addHandler(handler)
+
+    app.register_blueprint(api)
+    app.cli.add_command(init_db_command)
+    return app
 
 
 def validate_covid_data(data):
@@ -43,7 +66,7 @@ def validate_covid_data(data):
 # Routes
 # ----------------------
 
-@app.route("/")
+@api.route("/")
 def home():
     return {
         "message": "Welcome to the Week3 API 🚀",
@@ -53,8 +76,23 @@ def home():
         }
     }
 
+# Liveness probe: no database or cache calls
+@api.route("/healthz", methods=["GET"])
+@limiter.exempt
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+
+# Readiness probe: 503 until this worker has warmed up, then a cached
+# database ping (see health.py)
+@api.route("/readyz", methods=["GET"])
+@limiter.exempt
+def readyz():
+    ready, body = readiness(current_app._get_current_object())
+    return jsonify(body), 200 if ready else 503
+
 # Fetch live COVID-19 data and save to DB
-@app.route("/covid/fetch", methods=["GET"])
+@api.route("/covid/fetch", methods=["GET"])
 def fetch_covid_data():
     url = "https://disease.sh/v3/covid-19/countries/USA"
     response = requests.get(url)
@@ -80,7 +118,7 @@ def fetch_covid_data():
 
 
 
-@app.route("/covid", methods=["GET"])
+@api.route("/covid", methods=["GET"])
 def get_all_covid():
     stats = CovidStat.query.all()
     return jsonify([
@@ -97,7 +135,7 @@ def get_all_covid():
 
 
 
-@app.route("/covid", methods=["POST"])
+@api.route("/covid", methods=["POST"])
 @jwt_required()
 def add_covid_stat():
     identity = get_jwt_identity()
@@ -115,7 +153,7 @@ def add_covid_stat():
 
 
 # Update a COVID record
-@app.route("/covid/<int:id>", methods=["PUT"])
+@api.route("/covid/<int:id>", methods=["PUT"])
 # @jwt_required()
 def update_covid(id):
     stat = CovidStat.query.get_or_404(id)
@@ -130,7 +168,7 @@ def update_covid(id):
 
 
 # Delete a COVID record (Admin only)
-@app.route("/covid/<int:id>", methods=["DELETE"])
+@api.route("/covid/<int:id>", methods=["DELETE"])
 @role_required("admin")
 def delete_covid(id):
     stat = CovidStat.query.get_or_404(id)
@@ -140,7 +178,7 @@ def delete_covid(id):
 
 
 # Register a new user
-@app.route("/auth/register", methods=["POST"])
+@api.route("/auth/register", methods=["POST"])
 def register():
     data = request.get_json()
     if not data or not data.get("username") or not data.get("password"):
@@ -155,7 +193,7 @@ def register():
 
 
 # Login
-@app.route("/auth/login", methods=["POST"])
+@api.route("/auth/login", methods=["POST"])
 def login():
     data = request.get_json()
     if not data or "username" not in data or "password" not in data:
@@ -177,29 +215,27 @@ def login():
 # ----------------------
 # Error Handlers
 # ----------------------
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request(e):
-    app.logger.warning(f"400: {e}")
+    current_app.logger.warning(f"400: {e}")
     return jsonify({"error": "bad request"}), 400
 
-@app.errorhandler(401)
+@api.app_errorhandler(401)
 def unauthorized(e):
-    app.logger.warning(f"401: {e}")
+    current_app.logger.warning(f"401: {e}")
     return jsonify({"error": "unauthorized"}), 401
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(e):
     return jsonify({"error": "not found"}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def server_error(e):
-    app.logger.error(f"500: {e}", exc_info=True)
+    current_app.logger.error(f"500: {e}", exc_info=True)
     return jsonify({"error": "internal server error"}), 500
 
 
 
+# Development server only; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True, port=5001)
-
+    create_app().run(debug=True, port=5001)
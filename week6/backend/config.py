@@ -0,0 +1,16 @@
+import os
+
+
+# Heroku-style and some managed Postgres providers still hand out postgres://,
+# which SQLAlchemy no longer accepts
+def normalize_database_url(url):
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+class Config:
+    # The k8s secret (backend-secrets) provides DATABASE_URL
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.environ.get("DATABASE_URL", "sqlite:///week3.db"))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret")
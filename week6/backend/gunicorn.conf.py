@@ -0,0 +1,41 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Everything can be tuned from the environment:
+#   GUNICORN_WORKERS       worker processes (default 2 * CPUs + 1)
+#   GUNICORN_THREADS       threads per worker for the gthread class (default 4)
+#   GUNICORN_WORKER_CLASS  gthread (default) or gevent (pip install gevent)
+#   GUNICORN_PRELOAD       load the app once in the master before forking (default true)
+#
+# Graceful reload: `kill -HUP <master pid>` starts new workers and lets the old
+# ones finish in-flight requests within graceful_timeout. With preload on, the
+# application code itself is only re-imported on a full restart.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() != "false"
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+# Each worker warms up in the background right after the fork; /readyz fails
+# until that is done
+def post_fork(server, worker):
+    from health import ensure_warm_up
+    from wsgi import app
+
+    ensure_warm_up(app)
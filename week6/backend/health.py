@@ -0,0 +1,170 @@
+# Trimmed copy of Week3/health.py. The week6 image is built from week6/backend
+# alone, so it cannot import the Week3 module. This app has no analytics series
+# or response cache to warm, and its config has no WARMUP_* or
+# HEALTH_DB_PING_TTL settings, so those are read with Week3's defaults. Keep
+# changes to the warm-up and the ping cache in step with Week3.
+import logging
+import os
+import threading
+import time
+
+from flask_jwt_extended import create_access_token, decode_token
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+# Per-app readiness state in app.extensions["health"]
+def _state(app):
+    state = app.extensions.get("health")
+    if state is None:
+        with _lock:
+            state = app.extensions.setdefault("health", {
+                "pid": None,
+                "ready": False,
+                "warmed_at": None,
+                "warmup_ms": None,
+                "attempts": 0,
+                "error": None,
+                "ping": None,
+                "ping_lock": threading.Lock(),
+            })
+    return state
+
+
+# Opens WARMUP_CONNECTIONS connections on every engine at once and runs a
+# trivial query on each, so they are all in the pool before the first request
+def _prime_pools(app):
+    for engine in db.engines.values():
+        count = 1
+        if isinstance(engine.pool, QueuePool):
+            count = max(1, min(app.config.get("WARMUP_CONNECTIONS", 2), engine.pool.size()))
+        connections = []
+        try:
+            for _ in range(count):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text("SELECT 1"))
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+# A signed and verified token loads the JWT key and crypto backend
+def _warm_jwt():
+    decode_token(create_access_token(identity="warmup"))
+
+
+# In-process GETs through the whole stack: routing, the rate limiter, the
+# query and the JSON encoder
+def _self_requests(app):
+    client = app.test_client()
+    for path in filter(None, (p.strip() for p in app.config.get("WARMUP_PATHS", "/covid").split(","))):
+        status = client.get(path).status_code
+        if status >= 500:
+            raise RuntimeError(f"warm-up request GET {path} returned {status}")
+
+
+def _warm_up(app):
+    with app.app_context():
+        try:
+            _prime_pools(app)
+            configure_mappers()
+            _warm_jwt()
+        finally:
+            db.session.remove()
+    _self_requests(app)
+
+
+# Retries every WARMUP_RETRY_SECONDS until one warm-up succeeds, e.g. while
+# the database is still starting
+def _run(app, state):
+    while True:
+        state["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            _warm_up(app)
+        except Exception as e:
+            state["error"] = str(e)
+            log.warning("warm-up failed: %s", e)
+            time.sleep(app.config.get("WARMUP_RETRY_SECONDS", 5))
+            continue
+        state["warmup_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        state["warmed_at"] = time.time()
+        state["error"] = None
+        state["ready"] = True
+        return
+
+
+# Starts the warm-up for this process. The gunicorn post_fork hook calls it
+# so a worker warms up before its first probe; /readyz calls it too, which
+# covers the dev server and a restarted worker.
+def ensure_warm_up(app):
+    state = _state(app)
+    if state["pid"] == os.getpid():
+        return
+    with _lock:
+        if state["pid"] == os.getpid():
+            return
+        state["ready"] = False
+        state["pid"] = os.getpid()
+        threading.Thread(target=_run, args=(app, state), name="warm-up", daemon=True).start()
+
+
+def _ping_database():
+    with db.engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+# Primary database ping, cached for HEALTH_DB_PING_TTL seconds. One caller
+# refreshes an expired result; the others answer from the previous one
+# rather than queue up behind it.
+def db_ping(app):
+    state = _state(app)
+    ping = state["ping"]
+    if ping is not None and time.monotonic() - ping["checked"] < app.config.get("HEALTH_DB_PING_TTL", 5):
+        return ping
+    if not state["ping_lock"].acquire(blocking=ping is None):
+        return ping
+    try:
+        start = time.perf_counter()
+        try:
+            _ping_database()
+            error = None
+        except Exception as e:
+            error = str(e)
+        ping = {
+            "ok": error is None,
+            "error": error,
+            "ms": round((time.perf_counter() - start) * 1000, 3),
+            "checked": time.monotonic(),
+        }
+        state["ping"] = ping
+        return ping
+    finally:
+        state["ping_lock"].release()
+
+
+# (ready, body) for /readyz: warm-up finished in this process and the
+# database answered its last ping
+def readiness(app):
+    ensure_warm_up(app)
+    state = _state(app)
+    body = {"warmup": {"done": state["ready"], "attempts": state["attempts"], "ms": state["warmup_ms"]}}
+    if state["error"]:
+        body["warmup"]["error"] = state["error"]
+    if not state["ready"]:
+        return False, {"status": "warming up", **body}
+    ping = db_ping(app)
+    body["database"] = {"ok": ping["ok"], "ms": ping["ms"]}
+    if not ping["ok"]:
+        body["database"]["error"] = ping["error"]
+        return False, {"status": "database unavailable", **body}
+    return True, {"status": "ready", **body}